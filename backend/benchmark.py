@@ -0,0 +1,518 @@
+"""Latency benchmarks for the order and PDF API
+
+Usage:
+    python benchmark.py templates [--rounds 50]
+    python benchmark.py startup [--rounds 5] [--mongomock]
+    python benchmark.py micro [--rounds 50]
+    python benchmark.py write-modes [--rounds 50]
+    python benchmark.py responses [--rounds 500]
+    python benchmark.py load [--mongomock | --url URL] [--orders 200] [--requests 200] [--concurrency 8]
+    python benchmark.py compare BASELINE.json CURRENT.json [--threshold 0.2]
+
+Every command prints JSON (or writes it with --out) so runs can be compared
+across commits; ``compare`` exits non-zero when CURRENT regressed.
+--mongomock needs the development requirements (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pflegebox_benchmark")
+sys.path.insert(0, str(Path(__file__).parent))
+
+from pypdf import PdfReader, PdfWriter  # noqa: E402
+
+import server  # noqa: E402
+
+
+def sample_order() -> server.Order:
+    return server.Order(
+        products=[
+            server.ProductSelection(product_id="gloves", quantity=1, size="M"),
+            server.ProductSelection(product_id="pads", quantity=1),
+            server.ProductSelection(product_id="handdes", quantity=1),
+        ],
+        customer=server.CustomerInfo(
+            pflegegrad="2", anrede="Frau", vorname="Erika", nachname="Mustermann",
+            strasse="Musterstraße", hausnr="1", plz="10115", stadt="Berlin", geburtsdatum="01.01.1940",
+        ),
+        insurance=server.InsuranceInfo(
+            versicherungsart="gesetzlich", krankenkasse="AOK Nordost", versichertennummer="A123456789",
+            bezieht_bereits=True, consent1=True, consent2=True, signature_insured="",
+        ),
+        total=40.79,
+    )
+
+
+def summarize(samples_ms: list, elapsed_s: float = None) -> dict:
+    """Mean and nearest-rank percentiles of latencies in ms; throughput if the wall time is known"""
+    samples = sorted(samples_ms)
+
+    def percentile(p):
+        return round(samples[max(0, -(-len(samples) * p // 100) - 1)], 3)
+
+    summary = {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(samples[-1], 3),
+    }
+    if elapsed_s:
+        summary["throughput_per_s"] = round(len(samples) / elapsed_s, 2)
+    return summary
+
+
+def measure(fn, rounds: int) -> dict:
+    fn()  # warm-up
+    samples = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def legacy_writer(name: str, full: bool = False) -> PdfWriter:
+    """Per-request template handling before the prepared template registry"""
+    template = server.pdf_templates.get(name)
+    writer = PdfWriter()
+    writer.clone_document_from_reader(PdfReader(io.BytesIO(template.path.read_bytes())))
+    if template.prepare:
+        template.prepare(writer)
+    return writer
+
+
+def bench_templates(rounds: int) -> dict:
+    order = sample_order()
+    renderers = {
+        "main": server.generate_filled_pdf,
+        "bestellung": server.generate_bestellformular_pdf,
+        "wechsel": server.generate_wechsel_pdf,
+    }
+    server.pdf_templates.load_all()
+    results = {}
+    for name, render in renderers.items():
+        server.pdf_templates.writer = legacy_writer
+        try:
+            before = measure(lambda: render(order), rounds)
+        finally:
+            del server.pdf_templates.writer
+        after = measure(lambda: render(order), rounds)
+        results[name] = {
+            "before": before,
+            "after": after,
+            "speedup": round(before["mean_ms"] / after["mean_ms"], 2),
+        }
+    return results
+
+
+def bench_write_modes(rounds: int) -> dict:
+    """Render time and output size of the full rewrite vs. the incremental update"""
+    order = sample_order()
+    order.insurance.signature_insured = server.signature_data_url(server.normalize_signature(signature_data_url(0)))
+    server.pdf_templates.load_all()
+    default = server.INCREMENTAL_WRITES
+    results = {}
+    for doc_type, (render, _) in server.PDF_DOCUMENTS.items():
+        results[doc_type] = {}
+        for mode in ("full", "incremental"):
+            server.INCREMENTAL_WRITES = mode == "incremental"
+            try:
+                results[doc_type][mode] = {**measure(lambda: render(order), rounds), "bytes": len(render(order))}
+            finally:
+                server.INCREMENTAL_WRITES = default
+        full, incremental = results[doc_type]["full"], results[doc_type]["incremental"]
+        results[doc_type]["speedup"] = round(full["mean_ms"] / incremental["mean_ms"], 2)
+        results[doc_type]["size_ratio"] = round(incremental["bytes"] / full["bytes"], 3)
+    return results
+
+
+COLD_START = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+if "--mongomock" in sys.argv:
+    from mongomock_motor import AsyncMongoMockClient
+    server.client = AsyncMongoMockClient()
+    server.db = server.client["pflegebox_benchmark"]
+
+async def run():
+    await server.startup()
+    ready = time.perf_counter()
+    await server.shutdown_services()
+    return ready
+
+ready = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "phases": server.startup_state.phases,
+}))
+"""
+
+
+def bench_startup(rounds: int, mongomock: bool) -> dict:
+    """Cold start to ready, each round in a fresh interpreter"""
+    runs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", COLD_START] + (["--mongomock"] if mongomock else []),
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        )
+        run = json.loads(out.stdout.strip().splitlines()[-1])
+        run["process_ms"] = (time.perf_counter() - start) * 1000
+        runs.append(run)
+
+    return {
+        "rounds": rounds,
+        "process": summarize([r["process_ms"] for r in runs]),
+        "import": summarize([r["import_ms"] for r in runs]),
+        "ready": summarize([r["ready_ms"] for r in runs]),
+        "phases": {name: summarize([r["phases"][name] for r in runs]) for name in runs[0]["phases"]},
+    }
+
+
+def use_mongomock():
+    """Point the server at an in-memory Mongo stand-in"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    server.client = AsyncMongoMockClient()
+    server.db = server.client[os.environ["DB_NAME"]]
+
+
+def signature_data_url(seed: int) -> str:
+    """A synthetic handwritten-looking signature"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (600, 200), (0, 0, 0, 0))
+    points = [(20 + i * 56, rng.randint(40, 170)) for i in range(10)]
+    ImageDraw.Draw(image).line(points, fill=(10, 20, 80, 255), width=4, joint="curve")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+KASSEN = ["AOK Nordost", "Barmer", "DAK-Gesundheit", "Techniker Krankenkasse", "IKK classic"]
+
+
+def order_payload(rng: random.Random, signature: str) -> dict:
+    """Request body for POST /api/orders, always within the budget"""
+    return {
+        "products": [
+            {"product_id": "gloves", "quantity": 1, "size": rng.choice(["S", "M", "L", "XL"])},
+            {"product_id": "pads", "quantity": rng.randint(0, 1)},
+            {"product_id": "handdes", "quantity": 1},
+        ],
+        "customer": {
+            "pflegegrad": str(rng.randint(1, 5)), "anrede": rng.choice(["Frau", "Herr"]),
+            "vorname": rng.choice(["Erika", "Hans", "Jutta", "Klaus"]), "nachname": f"Muster{rng.randint(1, 9999)}",
+            "strasse": "Musterstraße", "hausnr": str(rng.randint(1, 200)), "plz": f"{rng.randint(10000, 99999)}",
+            "stadt": "Berlin", "geburtsdatum": "01.01.1940",
+        },
+        "insurance": {
+            "versicherungsart": "gesetzlich", "krankenkasse": rng.choice(KASSEN),
+            "versichertennummer": f"A{rng.randint(100000000, 999999999)}", "bezieht_bereits": rng.random() < 0.5,
+            "consent1": True, "consent2": True, "signature_insured": signature,
+        },
+    }
+
+
+async def seed_orders(count: int, seed: int = 1) -> list:
+    """Insert synthetic orders the way create_order stores them, without pre-rendered documents"""
+    rng = random.Random(seed)
+    refs = [await server.store_signature(server.normalize_signature(signature_data_url(i))) for i in range(8)]
+    now = datetime.now(timezone.utc)
+    orders = []
+    for i in range(count):
+        payload = order_payload(rng, rng.choice(refs))
+        products = [server.ProductSelection(**item) for item in payload["products"]]
+        order = server.Order(
+            products=products, customer=payload["customer"], insurance=payload["insurance"],
+            total=server.calculate_total(products), pdf_status="pending",
+            created_at=(now - timedelta(minutes=i)).isoformat(),
+        )
+        orders.append(server.order_document(order))
+    if orders:
+        await server.db.orders.insert_many(orders)
+    return [order["id"] for order in orders]
+
+
+def bench_micro(rounds: int) -> dict:
+    """In-process cost of the totals, each renderer and the ZIP bundling"""
+    rng = random.Random(1)
+    order = sample_order()
+    order.insurance.signature_insured = server.signature_data_url(server.normalize_signature(signature_data_url(0)))
+    products = [server.ProductSelection(**p) for p in order_payload(rng, "")["products"]]
+    server.pdf_templates.load_all()
+    documents = {doc_type: render(order) for doc_type, (render, _) in server.PDF_DOCUMENTS.items()}
+
+    def bundle():
+        async def run():
+            loop = asyncio.get_running_loop()
+            entries = []
+            for doc_type, data in documents.items():
+                future = loop.create_future()
+                future.set_result(data)
+                entries.append((f"{doc_type}.pdf", future))
+            return [chunk async for chunk in server.stream_zip(entries)]
+        asyncio.run(run())
+
+    results = {"calculate_total": measure(lambda: server.calculate_total(products), rounds * 100)}
+    for doc_type, (render, _) in server.PDF_DOCUMENTS.items():
+        results[f"render_{doc_type}"] = measure(lambda: render(order), rounds)
+        results[f"render_{doc_type}_flattened"] = measure(lambda: render(order, flatten=True), rounds)
+    results["zip_bundle"] = measure(bundle, rounds)
+    return results
+
+
+@functools.lru_cache(maxsize=None)
+def response_field(model):
+    """Response field FastAPI creates once per route for its response_model"""
+    from fastapi.utils import create_response_field
+
+    return create_response_field(name="Response", type_=model)
+
+
+def fastapi_response(value, model=None) -> bytes:
+    """Body FastAPI produces for a returned value: response_model validation, encoder, JSONResponse"""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    # For async endpoints serialize_response never awaits; run it without an event loop
+    coroutine = serialize_response(field=response_field(model) if model else None, response_content=value)
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return JSONResponse(done.value).body
+    raise RuntimeError("serialize_response suspended")
+
+
+def bench_responses(rounds: int) -> dict:
+    """Bytes and CPU per order response: full model through FastAPI vs. selected fields.
+
+    "legacy" orders still carry their signatures inline (not migrated to
+    db.signatures); "current" ones hold the content hash references.
+    """
+    signature = server.signature_data_url(server.normalize_signature(signature_data_url(0)))
+    stored = {
+        "current": server.order_document(server.build_order(
+            server.OrderCreate(**order_payload(random.Random(1), signature)), 4079,
+            {"signature_insured": server.normalize_signature(signature)},
+        )),
+    }
+    legacy = json.loads(json.dumps(stored["current"]))
+    legacy["insurance"]["signature_insured"] = legacy["insurance"]["signature_care"] = signature
+    stored["legacy"] = legacy
+    summary = server.selected_fields(None, server.ORDER_SUMMARY_FIELDS)
+    projection = server.list_projection(server.selected_fields(None))
+    projected_keys = {key.partition(".")[0] for key in projection}
+    results = {}
+    for kind, doc in stored.items():
+        order = server.Order(**doc)
+        # What find_one returns for the listing projection of get_order
+        projected = {
+            key: ({k: v for k, v in value.items() if k not in server.SIGNATURE_FIELDS} if key == "insurance" else value)
+            for key, value in doc.items() if key in projected_keys
+        }
+        cases = {
+            "create_order": (lambda: fastapi_response(order, server.Order), lambda: server.order_response(order, summary).body),
+            "get_order": (lambda: fastapi_response(doc), lambda: server.json_response(projected).body),
+        }
+        results[kind] = {}
+        for name, (before, after) in cases.items():
+            entry = {"before": measure(before, rounds), "after": measure(after, rounds)}
+            entry["bytes_before"], entry["bytes_after"] = len(before()), len(after())
+            entry["speedup"] = round(entry["before"]["mean_ms"] / entry["after"]["mean_ms"], 2)
+            results[kind][name] = entry
+    return results
+
+
+async def run_phase(concurrency: int, requests: int, send) -> dict:
+    """Send ``requests`` requests from ``concurrency`` workers; send(i) returns a response"""
+    samples, statuses, responses = [], {}, {}
+    next_index = iter(range(requests))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            response = await send(i)
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            responses[i] = response
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = summarize(samples, time.perf_counter() - started)
+    summary["status"] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary, responses
+
+
+async def bench_load(concurrency: int, requests: int, orders: int, pdf_type: str, url: str = None) -> dict:
+    """Load-test order creation and PDF download over HTTP.
+
+    Without --url the app is served by uvicorn inside this process (same
+    event loop as the client), and the PDF phase downloads the seeded
+    orders, which have no stored documents yet.
+    """
+    import httpx
+    import uvicorn
+
+    uvicorn_server = None
+    if url is None:
+        config = uvicorn.Config(server.app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+        uvicorn_server = uvicorn.Server(config)
+        serving = asyncio.create_task(uvicorn_server.serve())
+        while not uvicorn_server.started:
+            if serving.done():
+                serving.result()
+            await asyncio.sleep(0.05)
+        host, port = uvicorn_server.servers[0].sockets[0].getsockname()[:2]
+        url = f"http://{host}:{port}"
+
+    rng = random.Random(2)
+    signatures = [signature_data_url(i) for i in range(8)]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        seeded = await seed_orders(orders) if uvicorn_server else []
+        async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as http:
+            create, responses = await run_phase(
+                concurrency, requests,
+                lambda i: http.post("/api/orders", json=order_payload(rng, signatures[i % len(signatures)])),
+            )
+            created = [r.json()["id"] for r in responses.values() if r.status_code == 200]
+            # Let the pre-renders (and their retries) of the new orders finish before the downloads start
+            while uvicorn_server and await server.db.orders.count_documents({"id": {"$in": created}, "pdf_status": "pending"}):
+                await asyncio.sleep(0.2)
+            ids = seeded or created
+            download, _ = await run_phase(
+                concurrency, requests,
+                lambda i: http.get(f"/api/orders/{ids[i % len(ids)]}/pdf", params={"pdf_type": pdf_type}),
+            )
+    finally:
+        if uvicorn_server is not None:
+            uvicorn_server.should_exit = True
+            await serving
+    return {
+        "concurrency": concurrency,
+        "pdf_type": pdf_type,
+        "create_order": create,
+        "download_pdf": download,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, path: str = "") -> list:
+    """Latencies (*_ms) that grew or throughputs (*_per_s) that shrank by more than threshold"""
+    regressions = []
+    for key, base in baseline.items():
+        if key not in current:
+            continue
+        name = f"{path}.{key}" if path else key
+        value = current[key]
+        if isinstance(base, dict) and isinstance(value, dict):
+            regressions += compare(base, value, threshold, name)
+        elif not isinstance(base, (int, float)) or not base:
+            continue
+        elif key.endswith("_ms") and value > base * (1 + threshold):
+            regressions.append({"metric": name, "baseline": base, "current": value})
+        elif key.endswith("_per_s") and value < base * (1 - threshold):
+            regressions.append({"metric": name, "baseline": base, "current": value})
+    return regressions
+
+
+def run_metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "executor": server.PDF_EXECUTOR,
+        "write_mode": "incremental" if server.INCREMENTAL_WRITES else "full",
+        "workers": server.PDF_WORKERS,
+        "time": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    templates_cmd = commands.add_parser("templates", help="Per-PDF latency: parse per request vs. prepared template")
+    templates_cmd.add_argument("--rounds", type=int, default=50)
+    startup_cmd = commands.add_parser("startup", help="Cold start to ready, per startup phase")
+    startup_cmd.add_argument("--rounds", type=int, default=5)
+    startup_cmd.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    micro_cmd = commands.add_parser("micro", help="calculate_total, each renderer (fillable and flattened) and ZIP bundling")
+    micro_cmd.add_argument("--rounds", type=int, default=50)
+    write_modes_cmd = commands.add_parser("write-modes", help="Each renderer with full rewrite vs. incremental update")
+    write_modes_cmd.add_argument("--rounds", type=int, default=50)
+    responses_cmd = commands.add_parser("responses", help="Order response bytes and CPU: full model vs. selected fields")
+    responses_cmd.add_argument("--rounds", type=int, default=500)
+    load_cmd = commands.add_parser("load", help="POST /api/orders and GET /api/orders/{id}/pdf under concurrency")
+    target = load_cmd.add_mutually_exclusive_group()
+    target.add_argument("--mongomock", action="store_true", help="serve in-process on mongomock-motor")
+    target.add_argument("--url", help="load-test a running server instead of serving in-process")
+    load_cmd.add_argument("--orders", type=int, default=200, help="synthetic orders to seed (in-process only)")
+    load_cmd.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    load_cmd.add_argument("--concurrency", type=int, default=8)
+    load_cmd.add_argument("--pdf-type", default="main", choices=[*server.PDF_DOCUMENTS, "all"])
+    compare_cmd = commands.add_parser("compare", help="Fail if CURRENT regressed against BASELINE")
+    compare_cmd.add_argument("baseline", type=Path)
+    compare_cmd.add_argument("current", type=Path)
+    compare_cmd.add_argument("--threshold", type=float, default=0.2, help="tolerated relative change")
+    for command in (templates_cmd, startup_cmd, micro_cmd, write_modes_cmd, responses_cmd, load_cmd):
+        command.add_argument("--out", type=Path, help="write the JSON result to this file")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        baseline = json.loads(args.baseline.read_text())
+        current = json.loads(args.current.read_text())
+        regressions = compare(baseline.get("results", baseline), current.get("results", current), args.threshold)
+        print(json.dumps({"threshold": args.threshold, "regressions": regressions}, indent=2))
+        sys.exit(1 if regressions else 0)
+
+    if getattr(args, "mongomock", False) and args.command == "load":
+        use_mongomock()
+    if args.command == "templates":
+        result = bench_templates(args.rounds)
+    elif args.command == "startup":
+        result = bench_startup(args.rounds, args.mongomock)
+    elif args.command == "micro":
+        result = bench_micro(args.rounds)
+    elif args.command == "write-modes":
+        result = bench_write_modes(args.rounds)
+    elif args.command == "responses":
+        result = bench_responses(args.rounds)
+    elif args.command == "load":
+        result = asyncio.run(bench_load(args.concurrency, args.requests, args.orders, args.pdf_type, args.url))
+    output = json.dumps({"benchmark": args.command, "meta": run_metadata(), "results": result}, indent=2)
+    if args.out:
+        args.out.write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,194 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Header, BackgroundTasks, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from urllib.parse import quote
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, model_validator
+from typing import List, Optional, Dict, Any, Awaitable, Callable, Tuple, AsyncIterator
 import uuid
-from datetime import datetime, timezone
+import time
+import json
+from dataclasses import dataclass
+from types import MappingProxyType
+from zoneinfo import ZoneInfo
+from datetime import date, datetime, timedelta, timezone
 import base64
-import tempfile
+import csv
+import binascii
+import hashlib
 import zipfile
+import shutil
+from collections import OrderedDict
 import io
+import sys
+import threading
+import functools
+import contextlib
+import zlib
+import asyncio
+import multiprocessing
+from email.message import EmailMessage
+from email.utils import formatdate
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import pypdf
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+    FloatObject, IndirectObject, NameObject, NumberObject, StreamObject, TextStringObject,
+)
+
+from metrics import Counter, Gauge, Histogram, MetricsRegistry
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ============ METRICS ============
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+metrics = MetricsRegistry()
+PDF_STAGE_SECONDS = metrics.register(Histogram(
+    "pdf_stage_seconds", "Duration of the PDF request and rendering stages", ("pdf_type", "stage"),
+))
+PDF_STAGE_FAILURES = metrics.register(Counter(
+    "pdf_stage_failures_total", "Rendering stages that failed and were skipped", ("pdf_type", "stage"),
+))
+PDF_DOCUMENTS_SERVED = metrics.register(Counter(
+    "pdf_documents_total", "Documents handed out by where they came from", ("pdf_type", "source"),
+))
+PRERENDER_FAILURES = metrics.register(Counter(
+    "pdf_prerender_failures_total", "Failed pre-rendering attempts",
+))
+MONGO_COMMAND_SECONDS = metrics.register(Histogram(
+    "mongo_command_seconds", "MongoDB command round trip", ("command",),
+))
+MONGO_COMMAND_FAILURES = metrics.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command",),
+))
+ORDER_EMAILS = metrics.register(Counter(
+    "order_email_attempts_total", "Order email delivery attempts by outcome (sent, retry, failed)", ("result",),
+))
+metrics.register(Gauge("pdf_renders_in_flight", "Render jobs queued or running", lambda: pdf_render_pool.pending))
+metrics.register(Gauge("pdf_render_queue_limit", "Render jobs admitted at once", lambda: pdf_render_pool.queue_limit))
+metrics.register(Gauge("pdf_cache_bytes", "Rendered PDFs held in memory", lambda: pdf_cache.size))
+metrics.register(Counter("pdf_cache_hits_total", "Rendered PDF cache hits", read=lambda: pdf_cache.hits))
+metrics.register(Counter("pdf_cache_misses_total", "Rendered PDF cache misses", read=lambda: pdf_cache.misses))
+metrics.register(
+    Counter("smtp_connections_opened_total", "SMTP sessions opened", read=lambda: email_outbox.pool.opened)
+)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_COMMAND_FAILURES.inc(event.command_name)
+
+
+# Stage timings of the render running in this thread; renders may run in
+# pool processes, so they are collected here and reported with the result
+_render_report = threading.local()
+
+
+class _RenderStage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        report = getattr(_render_report, "current", None)
+        if report is not None:
+            stages = report["stages"]
+            stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class _ObservedStage:
+    __slots__ = ("pdf_type", "name", "start")
+
+    def __init__(self, pdf_type: str, name: str):
+        self.pdf_type = pdf_type
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        PDF_STAGE_SECONDS.observe(time.perf_counter() - self.start, self.pdf_type, self.name)
+
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """Time a stage of the render running in this thread"""
+    return _RenderStage(name) if METRICS_ENABLED else _NO_STAGE
+
+
+def timed(pdf_type: str, name: str):
+    """Time a stage of PDF request handling in the API process"""
+    return _ObservedStage(pdf_type, name) if METRICS_ENABLED else _NO_STAGE
+
+
+def stage_failed(name: str):
+    """Count a render stage whose error was logged and skipped"""
+    report = getattr(_render_report, "current", None)
+    if report is not None:
+        report["failures"][name] = report["failures"].get(name, 0) + 1
+
+
+def record_render_report(pdf_type: str, report: Optional[Dict[str, Dict[str, float]]]):
+    if report is None:
+        return
+    for name, seconds in report["stages"].items():
+        PDF_STAGE_SECONDS.observe(seconds, pdf_type, name)
+    for name, count in report["failures"].items():
+        PDF_STAGE_FAILURES.inc(pdf_type, name, amount=count)
+
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTimer()] if METRICS_ENABLED else [])
 db = client[os.environ['DB_NAME']]
 
+ORDER_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    IndexModel([("created_at", ASCENDING)], name="created_at"),
+    IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    IndexModel([("insurance.versichertennummer", ASCENDING)], name="versichertennummer"),
+    IndexModel([("insurance.krankenkasse", ASCENDING), ("created_at", ASCENDING)], name="krankenkasse_created_at"),
+    IndexModel([("client_key", ASCENDING)], unique=True, sparse=True, name="client_key_unique"),
+]
+ORDER_DOCUMENT_INDEXES = [
+    IndexModel([("order_id", ASCENDING), ("doc_type", ASCENDING)], unique=True, name="order_doc_type_unique"),
+]
+EXPORT_JOB_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    IndexModel([("status", ASCENDING)], name="status"),  # recovery of unfinished jobs at startup
+]
+EMAIL_OUTBOX_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+    IndexModel([("order_id", ASCENDING)], name="order_id"),
+]
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_KEY_INDEXES = [
+    IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL, name="created_at_ttl"),
+]
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -34,6 +199,798 @@ PDF_MAIN = PDF_DIR / "richtige-pdf.pdf"
 PDF_ORDER = PDF_DIR / "bestellformular.pdf"
 PDF_WECHSEL = PDF_DIR / "wechsel.pdf"
 
+# ============ PYPDF INTERNALS ============
+# Every use of pypdf's private API is in this section. It was written against
+# the release range below; requirements.txt pins a release inside it.
+from pypdf._codecs.core_font_metrics import CORE_FONT_METRICS  # noqa: E402
+from pypdf._font import Font  # noqa: E402
+
+PYPDF_TESTED = ((6, 0), (7, 0))  # first tested release, first untested one
+
+
+def _pypdf_incremental_supported() -> bool:
+    """The incremental writer internals used by write_increment exist in this pypdf release"""
+    try:
+        version = tuple(int(part) for part in pypdf.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    return PYPDF_TESTED[0] <= version < PYPDF_TESTED[1] and all(
+        hasattr(PdfWriter, name) for name in ("_write_increment", "list_objects_in_increment")
+    )
+
+
+PYPDF_INCREMENTAL = _pypdf_incremental_supported()
+
+
+def add_object(writer: PdfWriter, obj: Any) -> IndirectObject:
+    """Add a new object to the document and return its reference"""
+    return writer._add_object(obj)
+
+
+def cloned_ids(writer: PdfWriter, source: int) -> Optional[Dict[int, int]]:
+    """Object numbers a writer gave the objects it cloned from the reader with id ``source``"""
+    return getattr(writer, "_id_translated", {}).get(source)
+
+
+def incremental_source(writer: PdfWriter) -> Optional[int]:
+    """id() of the reader an incremental writer appends to; its objects keep their numbers"""
+    reader = getattr(writer, "_reader", None) if writer.incremental else None
+    return id(reader) if reader is not None else None
+
+
+def info_reference(writer: PdfWriter) -> Optional[IndirectObject]:
+    info = getattr(writer, "_info", None)
+    return info.indirect_reference if info is not None else None
+
+
+def free_objects(writer: PdfWriter, keep: set):
+    """Drop the objects whose numbers are not in ``keep``, so they are not written"""
+    for index in range(len(writer._objects)):
+        if index + 1 not in keep:
+            writer._objects[index] = None
+
+
+def encoded_stream(data: bytes) -> EncodedStreamObject:
+    """Stream holding already Flate-compressed data; set_data would compress it again"""
+    stream = EncodedStreamObject()
+    stream._data = data
+    return stream
+
+
+def write_increment(writer: PdfWriter, output: io.BytesIO):
+    """The template bytes followed by the objects an incremental writer changed"""
+    # Copy the template from the reader's buffer instead of seeking its stream,
+    # which is shared by all render threads; then append the changed objects
+    output.write(writer._reader.stream.getbuffer())
+    # Finding modified objects hashes the whole document; new objects settle it sooner
+    if len(writer._objects) > len(writer._original_hash) or writer.list_objects_in_increment():
+        writer._write_increment(output)
+
+
+# ============ FORM APPEARANCES ============
+# Field flags (/Ff) and annotation flags (/F) from the PDF reference
+FIELD_MULTILINE = 1 << 12
+FIELD_PUSHBUTTON = 1 << 16
+FIELD_COMB = 1 << 24
+ANNOT_HIDDEN = 1 << 1
+MIN_AUTO_FONT_SIZE = 4.0
+MULTILINE_FONT_SIZE = 12.0
+CHECK_FONT = "/ZaDb"  # ZapfDingbats, the font of the /MK /CA check glyphs
+COMB_SEPARATORS = " .-/"  # printed between the cells of a comb field, e.g. the dots of a date
+
+
+def _num(value: float) -> str:
+    """Compact number for content streams"""
+    return f"{value:.3f}".rstrip("0").rstrip(".") or "0"
+
+
+def _literal(data: bytes) -> bytes:
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _core_font(base_font: str) -> Font:
+    metrics = CORE_FONT_METRICS[base_font]
+    return Font(
+        name=base_font,
+        encoding="cp1252",
+        sub_type="Type1",
+        font_descriptor=metrics.font_descriptor,
+        character_widths=metrics.character_widths,
+    )
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class FormFont:
+    """Metrics and encoding of a form font, read once per template instead of per field and request"""
+    name: str
+    font: Font
+    glyphs: Dict[str, bytes]
+    # Font dictionary to add to each document; None uses the template's /DR entry
+    resource: Optional[DictionaryObject] = None
+
+    @classmethod
+    def load(cls, name: str, resource: Optional[DictionaryObject]) -> "FormFont":
+        base_font = str(resource.get("/BaseFont", "")).lstrip("/") if resource is not None else "Helvetica"
+        if resource is None or ("/Encoding" not in resource and base_font in CORE_FONT_METRICS):
+            # Missing font or a standard font in its built-in encoding, which has no umlauts:
+            # render with our own WinAnsi copy of it
+            base_font = base_font if base_font in CORE_FONT_METRICS else "Helvetica"
+            font = _core_font(base_font)
+            own = DictionaryObject({
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject(f"/{base_font}"),
+                NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+            })
+            return cls(name, font, _glyph_map(font), own)
+        font = Font.from_font_resource(resource)
+        return cls(name, font, _glyph_map(font))
+
+    @property
+    def ascent(self) -> float:
+        return self.font.font_descriptor.ascent / 1000
+
+    @property
+    def leading(self) -> float:
+        bbox = self.font.font_descriptor.bbox
+        return (bbox[3] - bbox[1]) / 1000
+
+    def width(self, text: str, size: float) -> float:
+        return self.font.text_width(text) * size / 1000
+
+    def encode(self, text: str) -> bytes:
+        return _literal(b"".join(self.glyphs.get(char, b"?") for char in text))
+
+
+def _glyph_map(font: Font) -> Dict[str, bytes]:
+    if isinstance(font.encoding, str):
+        glyphs = {}
+        for code in range(32, 256):
+            try:
+                glyphs.setdefault(bytes((code,)).decode(font.encoding), bytes((code,)))
+            except UnicodeDecodeError:
+                pass
+        return glyphs
+    return {char: bytes((code,)) for code, char in font.encoding.items() if code >= 32}
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class FormWidget:
+    """Everything needed to fill one widget except the value"""
+    name: str
+    page: int
+    kind: str  # "text", "checkbox" or "button"
+    rect: Tuple[float, float, float, float]  # normalized: x1 < x2, y1 < y2
+    ref: Optional[int] = None  # template object number of the widget annotation
+    field_ref: Optional[int] = None  # ... and of its field dictionary, the same for merged widgets
+    font: Optional[FormFont] = None
+    font_size: float = 0.0  # 0 = fit the field
+    color: str = "0 g"
+    align: int = 0  # /Q: 0 left, 1 centered, 2 right
+    comb: int = 0  # number of cells of a comb field
+    multiline: bool = False
+    margin: float = 1.0
+    on_state: str = "/Yes"
+    check: bytes = b""  # checked appearance of a checkbox
+
+    @property
+    def width(self) -> float:
+        return self.rect[2] - self.rect[0]
+
+    @property
+    def height(self) -> float:
+        return self.rect[3] - self.rect[1]
+
+    def describe(self) -> Dict[str, Any]:
+        """Inventory entry, as printed by ``server.py form-fields``"""
+        entry = {
+            "name": self.name,
+            "page": self.page,
+            "kind": self.kind,
+            "rect": [round(v, 2) for v in self.rect],
+            "object": self.ref,
+        }
+        if self.kind == "text":
+            entry.update(
+                font=self.font.name, font_size=self.font_size or "auto",
+                align=("left", "center", "right")[self.align] if self.align in (0, 1, 2) else self.align,
+            )
+            if self.comb:
+                entry["comb"] = self.comb
+            if self.multiline:
+                entry["multiline"] = True
+        elif self.kind == "checkbox":
+            entry["on_state"] = self.on_state
+        return entry
+
+    def comb_text(self, text: str) -> str:
+        """Value to store in the field: without separators if only that makes it fit the comb cells"""
+        if self.comb and len(text) > self.comb:
+            compact = "".join(char for char in text if char not in COMB_SEPARATORS)
+            if len(compact) <= self.comb:
+                return compact
+        return text
+
+    def text_appearance(self, text: str) -> bytes:
+        """Content of the normal appearance showing ``text``"""
+        font, margin = self.font, self.margin
+        inner_width, inner_height = self.width - 4 * margin, self.height - 2 * margin
+        lines = text.splitlines() if self.multiline else [" ".join(text.splitlines())]
+        # A value longer than the cells is laid out as a plain line instead of being cut off
+        comb = self.comb if len(lines[0]) <= self.comb else 0
+        size = self.font_size
+        if not size:
+            if self.multiline:
+                size = min(MULTILINE_FONT_SIZE, inner_height / (font.leading * max(len(lines), 1)))
+            elif comb:
+                widest = max((font.width(char, 1) for char in lines[0]), default=0)
+                size = min(inner_height / font.leading, self.width / comb / (widest or 1))
+            else:
+                size = min(inner_height / font.leading, inner_width / (font.width(lines[0], 1) or 1))
+            size = round(max(size, MIN_AUTO_FONT_SIZE), 1)
+
+        ops = [
+            b"/Tx BMC q",
+            f"{_num(2 * margin)} {_num(margin)} {_num(inner_width)} {_num(inner_height)} re W n".encode(),
+            f"BT {font.name} {_num(size)} Tf {self.color}".encode(),
+        ]
+        if self.multiline:
+            y = self.height - margin - font.font.font_descriptor.bbox[3] * size / 1000
+        else:
+            y = margin + (inner_height - font.ascent * size) / 2
+        if comb:
+            cell = self.width / comb
+            for index, char in enumerate(lines[0]):
+                x = index * cell + (cell - font.width(char, size)) / 2
+                ops.append(f"1 0 0 1 {_num(x)} {_num(y)} Tm ".encode() + font.encode(char) + b" Tj")
+        else:
+            for line in lines:
+                line_width = font.width(line, size)
+                if self.align == 1:
+                    x = (self.width - line_width) / 2
+                elif self.align == 2:
+                    x = self.width - 2 * margin - line_width
+                else:
+                    x = 2 * margin
+                ops.append(f"1 0 0 1 {_num(x)} {_num(y)} Tm ".encode() + font.encode(line) + b" Tj")
+                y -= size * font.leading
+        ops.append(b"ET Q EMC")
+        return b"\n".join(ops) + b"\n"
+
+
+def _check_appearance(width: float, height: float, caption: str, color: str) -> bytes:
+    """Checked state of a checkbox: the /MK caption glyph centered in ZapfDingbats"""
+    glyph = CORE_FONT_METRICS["ZapfDingbats"].character_widths.get(caption, 846) / 1000
+    size = min(width / glyph, height) * 0.8
+    x = (width - glyph * size) / 2
+    y = (height - size * 0.7) / 2
+    caption_code = caption.encode("latin-1", "replace")
+    return (
+        f"q BT {CHECK_FONT} {_num(size)} Tf {color} {_num(x)} {_num(y)} Td ".encode()
+        + _literal(caption_code) + b" Tj ET Q\n"
+    )
+
+
+def _default_appearance(da: str) -> Tuple[str, float, str]:
+    """Font name, size and color operators of a /DA string"""
+    tokens = da.split()
+    if "Tf" not in tokens:
+        return "/Helv", 0.0, da or "0 g"
+    tf = tokens.index("Tf")
+    color = " ".join(tokens[:tf - 2] + tokens[tf + 1:])
+    return tokens[tf - 2], float(tokens[tf - 1]), color or "0 g"
+
+
+class TemplateForm:
+    """The widgets of a template's AcroForm, compiled once when the template is loaded.
+
+    Appearance streams are built from these with cached font metrics, so a
+    fill neither looks up fonts nor leaves the viewer to regenerate them.
+    """
+
+    def __init__(self, widgets: Dict[str, FormWidget], fonts: Dict[str, FormFont], source: Optional[PdfReader] = None):
+        self.widgets = widgets
+        self.fonts = fonts
+        self._source = id(source) if source is not None else None
+
+    def objects(self, writer: PdfWriter) -> Callable[[FormWidget], Tuple[DictionaryObject, DictionaryObject]]:
+        """Resolve widgets to the writer's copies of their annotation and field.
+
+        Writers cloned from the template keep pypdf's table of translated object
+        numbers, so this is a list lookup; other writers are scanned by name.
+        """
+        if self._source is not None and incremental_source(writer) == self._source:
+            def translate(idnum: int) -> int:
+                return idnum
+        else:
+            translated = cloned_ids(writer, self._source) if self._source is not None else None
+            if translated is None:
+                return self._scan(writer)
+            translate = translated.__getitem__
+
+        scanned = None
+
+        def resolve(widget: FormWidget) -> Tuple[DictionaryObject, DictionaryObject]:
+            nonlocal scanned
+            if widget.ref is None:
+                # Direct (not indirect) annotation objects have no number to look up
+                scanned = scanned or self._scan(writer)
+                return scanned(widget)
+            annot = writer.get_object(translate(widget.ref))
+            field = annot if widget.field_ref == widget.ref else writer.get_object(translate(widget.field_ref))
+            return annot, field
+        return resolve
+
+    @staticmethod
+    def _scan(writer: PdfWriter) -> Callable[[FormWidget], Tuple[DictionaryObject, DictionaryObject]]:
+        found: Dict[str, Tuple[DictionaryObject, DictionaryObject]] = {}
+        for page in writer.pages:
+            for ref in page.get("/Annots", []):
+                annot = ref.get_object()
+                field = annot if "/T" in annot else annot.get("/Parent", annot).get_object()
+                found.setdefault(field.get("/T"), (annot, field))
+        return lambda widget: found[widget.name]
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [widget.describe() for widget in self.widgets.values()]
+
+    @classmethod
+    def compile(cls, reader: PdfReader) -> "TemplateForm":
+        acroform = reader.root_object.get("/AcroForm")
+        if acroform is None:
+            return cls({}, {}, reader)
+        acroform = acroform.get_object()
+        dr_fonts = acroform.get("/DR", DictionaryObject()).get_object().get("/Font", DictionaryObject()).get_object()
+        fonts: Dict[str, FormFont] = {}
+        widgets: Dict[str, FormWidget] = {}
+        for page_index, page in enumerate(reader.pages):
+            for ref in page.get("/Annots", []):
+                annot = ref.get_object()
+                if annot.get("/Subtype") != "/Widget":
+                    continue
+                field_ref = ref if "/T" in annot else annot.raw_get("/Parent")
+                field = field_ref.get_object()
+                name = field["/T"]
+                x1, y1, x2, y2 = (float(v) for v in annot["/Rect"])
+                common = {
+                    "name": name,
+                    "page": page_index,
+                    "rect": (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)),
+                    "ref": ref.idnum if isinstance(ref, IndirectObject) else None,
+                    "field_ref": field_ref.idnum if isinstance(field_ref, IndirectObject) else None,
+                }
+                width, height = abs(x2 - x1), abs(y2 - y1)
+                field_type = field.get("/FT", acroform.get("/FT"))
+                flags = int(field.get("/Ff", 0))
+                da = str(annot.get("/DA") or field.get("/DA") or acroform.get("/DA") or "/Helv 0 Tf 0 g")
+                font_name, font_size, color = _default_appearance(da)
+                border = annot.get("/BS", field.get("/BS", DictionaryObject())).get_object()
+                border_width = float(border.get("/W", 1))
+                margin = max(border_width * (2 if border.get("/S") in ("/B", "/I") else 1), 1)
+                if field_type == "/Btn" and not flags & FIELD_PUSHBUTTON:
+                    appearances = annot.get("/AP", DictionaryObject()).get_object()
+                    states = appearances.get("/N", DictionaryObject()).get_object()
+                    on_state = next((key for key in states if key != "/Off"), "/Yes")
+                    caption = str(annot.get("/MK", DictionaryObject()).get_object().get("/CA", "4")) or "4"
+                    widgets[name] = FormWidget(
+                        kind="checkbox", color=color, on_state=on_state,
+                        check=_check_appearance(width, height, caption, color), **common,
+                    )
+                elif field_type == "/Tx":
+                    if font_name not in fonts:
+                        resource = dr_fonts.get(font_name)
+                        fonts[font_name] = FormFont.load(
+                            font_name, resource.get_object() if resource is not None else None
+                        )
+                    comb = int(field.get("/MaxLen", 0)) if flags & FIELD_COMB else 0
+                    widgets[name] = FormWidget(
+                        kind="text", font=fonts[font_name], font_size=font_size, color=color,
+                        align=int(field.get("/Q", acroform.get("/Q", 0))), comb=comb,
+                        multiline=bool(flags & FIELD_MULTILINE), margin=margin, **common,
+                    )
+                else:
+                    widgets[name] = FormWidget(kind="button", **common)
+        return cls(widgets, fonts, reader)
+
+
+class _FormResources:
+    """Objects shared by all appearance streams of one document"""
+
+    def __init__(self, writer: PdfWriter, form: TemplateForm):
+        self.writer = writer
+        self.form = form
+        self._resources: Optional[IndirectObject] = None
+        self._checks: Dict[bytes, IndirectObject] = {}
+
+    def resources(self) -> IndirectObject:
+        if self._resources is None:
+            acroform = self.writer.root_object.get("/AcroForm", DictionaryObject()).get_object()
+            resources = acroform.get("/DR", DictionaryObject()).get_object()
+            dr_fonts = resources.get("/Font", DictionaryObject()).get_object()
+            fonts = DictionaryObject()
+            for name, font in self.form.fonts.items():
+                fonts[NameObject(name)] = (
+                    add_object(self.writer, DictionaryObject(font.resource))
+                    if font.resource is not None or name not in dr_fonts
+                    else dr_fonts.raw_get(name)
+                )
+            fonts[NameObject(CHECK_FONT)] = add_object(self.writer, DictionaryObject({
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/ZapfDingbats"),
+            }))
+            self._resources = add_object(self.writer, DictionaryObject({NameObject("/Font"): fonts}))
+        return self._resources
+
+    def appearance(self, widget: FormWidget, content: bytes) -> IndirectObject:
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        stream.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([
+                NumberObject(0), NumberObject(0), FloatObject(widget.width), FloatObject(widget.height),
+            ]),
+            NameObject("/Resources"): self.resources(),
+        })
+        return add_object(self.writer, stream)
+
+    def check(self, widget: FormWidget) -> IndirectObject:
+        # Checkboxes of the same size and color share one appearance stream
+        if widget.check not in self._checks:
+            self._checks[widget.check] = self.appearance(widget, widget.check)
+        return self._checks[widget.check]
+
+
+def fill_form(writer: PdfWriter, form: TemplateForm, assignments: List[Tuple[FormWidget, Any]]):
+    """Set field values together with their appearance streams.
+
+    Checkboxes take "/Yes" (or True) for their on state and "/Off", "" or
+    False for off.
+    """
+    shared = _FormResources(writer, form)
+    resolve = form.objects(writer)
+    for widget, value in assignments:
+        annot, field = resolve(widget)
+        if widget.kind == "checkbox":
+            checked = value not in (None, False, "", "/Off", "Off")
+            state = NameObject(widget.on_state if checked else "/Off")
+            field[NameObject("/V")] = state
+            annot[NameObject("/AS")] = state
+            if checked:
+                states = annot.get("/AP", DictionaryObject()).get_object().get("/N", DictionaryObject()).get_object()
+                normal = DictionaryObject({NameObject(widget.on_state): shared.check(widget)})
+                if "/Off" in states:
+                    normal[NameObject("/Off")] = states.raw_get("/Off")
+                annot[NameObject("/AP")] = DictionaryObject({NameObject("/N"): normal})
+        elif widget.kind == "text":
+            text = widget.comb_text("" if value is None else str(value))
+            field[NameObject("/V")] = TextStringObject(text)
+            annot[NameObject("/AP")] = DictionaryObject({
+                NameObject("/N"): shared.appearance(widget, widget.text_appearance(text)),
+            })
+
+
+def stamp_page(writer: PdfWriter, page, xobjects: Dict[str, IndirectObject], content: bytes):
+    """Draw form XObjects or images over the page content"""
+    if "/Resources" not in page:
+        page[NameObject("/Resources")] = DictionaryObject()
+    resources = page["/Resources"].get_object()
+    if "/XObject" not in resources:
+        resources[NameObject("/XObject")] = DictionaryObject()
+    registered = resources["/XObject"].get_object()
+    for name, ref in xobjects.items():
+        registered[NameObject(name)] = ref
+
+    # Wrap the existing content in q/Q so its graphics state cannot leak into the stamp
+    contents = page.get("/Contents")
+    existing = list(contents.get_object()) if isinstance(contents.get_object(), ArrayObject) else [contents]
+    page[NameObject("/Contents")] = ArrayObject([
+        _content_stream(writer, b"q\n"),
+        *existing,
+        _content_stream(writer, b"Q\n" + content),
+    ])
+
+
+def _placement(appearance: StreamObject, rect) -> Tuple[float, float, float, float]:
+    """Scale and offset that map an appearance's transformed /BBox onto the widget rectangle"""
+    a, b, c, d, e, f = (float(v) for v in appearance.get("/Matrix", [1, 0, 0, 1, 0, 0]))
+    x1, y1, x2, y2 = (float(v) for v in appearance["/BBox"])
+    corners = [(a * x + c * y + e, b * x + d * y + f) for x in (x1, x2) for y in (y1, y2)]
+    bx1, bx2 = min(p[0] for p in corners), max(p[0] for p in corners)
+    by1, by2 = min(p[1] for p in corners), max(p[1] for p in corners)
+    rx1, ry1, rx2, ry2 = (float(v) for v in rect)
+    rx1, rx2, ry1, ry2 = min(rx1, rx2), max(rx1, rx2), min(ry1, ry2), max(ry1, ry2)
+    sx = (rx2 - rx1) / (bx2 - bx1) if bx2 > bx1 else 1
+    sy = (ry2 - ry1) / (by2 - by1) if by2 > by1 else 1
+    return sx, sy, rx1 - sx * bx1, ry1 - sy * by1
+
+
+def flatten_form(writer: PdfWriter):
+    """Burn every visible widget appearance into its page and drop the AcroForm.
+
+    Use a writer that rewrites the whole document: an incremental update
+    would still carry the original form.
+    """
+    for page in writer.pages:
+        annots = page.get("/Annots")
+        if not annots:
+            continue
+        kept = ArrayObject()
+        xobjects: Dict[str, IndirectObject] = {}
+        ops = []
+        for ref in annots.get_object():
+            annot = ref.get_object()
+            if annot.get("/Subtype") != "/Widget":
+                kept.append(ref)
+                continue
+            if int(annot.get("/F", 0)) & ANNOT_HIDDEN or "/AP" not in annot:
+                continue
+            normal = annot["/AP"].get_object()
+            appearance_ref = normal.raw_get("/N") if "/N" in normal else None
+            appearance = appearance_ref.get_object() if appearance_ref is not None else None
+            if appearance is not None and not isinstance(appearance, StreamObject):
+                # Per-state appearances (checkboxes): the one selected by /AS
+                state = annot.get("/AS")
+                appearance_ref = appearance.raw_get(state) if state in appearance else None
+                appearance = appearance_ref.get_object() if appearance_ref is not None else None
+            if appearance is None or "/BBox" not in appearance or not appearance.get_data().strip():
+                continue
+            if not isinstance(appearance_ref, IndirectObject):
+                appearance_ref = add_object(writer, appearance)
+            name = f"/Fm{len(xobjects)}"
+            xobjects[name] = appearance_ref
+            sx, sy, x, y = _placement(appearance, annot["/Rect"])
+            ops.append(f"q {_num(sx)} 0 0 {_num(sy)} {_num(x)} {_num(y)} cm {name} Do Q")
+        if kept:
+            page[NameObject("/Annots")] = kept
+        else:
+            del page["/Annots"]
+        if ops:
+            stamp_page(writer, page, xobjects, "\n".join(ops).encode() + b"\n")
+    if "/AcroForm" in writer.root_object:
+        del writer.root_object["/AcroForm"]
+    drop_unreachable(writer)
+
+
+def drop_unreachable(writer: PdfWriter):
+    """Free the objects nothing refers to any more, e.g. the fields of a flattened form.
+
+    A plain mark phase; pypdf's own orphan removal also hashes every object
+    and costs more than it saves here.
+    """
+    reachable = set()
+    stack: List[Any] = [writer.root_object.indirect_reference]
+    info = info_reference(writer)
+    if info is not None:
+        stack.append(info)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in reachable:
+                continue
+            reachable.add(obj.idnum)
+            stack.append(writer.get_object(obj.idnum))
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, list):
+            stack.extend(obj)
+    free_objects(writer, reachable)
+
+
+# ============ PDF TEMPLATES ============
+# "full" re-serializes the whole cloned document. "incremental" appends only the
+# changed objects to the verbatim template bytes: faster, but the files grow and it
+# relies on pypdf internals, so releases outside PYPDF_TESTED fall back to "full".
+PDF_WRITE_MODE = os.environ.get("PDF_WRITE_MODE", "full")
+INCREMENTAL_WRITES = PDF_WRITE_MODE == "incremental" and PYPDF_INCREMENTAL
+# How often a loaded template is compared with its file (seconds, 0 = never)
+TEMPLATE_CHECK_INTERVAL = float(os.environ.get("TEMPLATE_CHECK_INTERVAL", 5))
+
+
+def _estimate_size(root: Any) -> int:
+    """Approximate deep size in bytes of a parsed pypdf object graph"""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        data = getattr(obj, "_data", None)
+        if isinstance(data, bytes):
+            stack.append(data)
+    return total
+
+
+class PdfTemplate:
+    """A PDF form template that is parsed once and shared between requests.
+
+    All objects of the template are resolved when it is loaded, so handing out
+    a writer only clones already parsed objects instead of re-reading the file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: Path,
+        prepare: Optional[Callable[[PdfWriter], None]] = None,
+        mapping: Optional["FormMapping"] = None,
+    ):
+        self.name = name
+        self.path = path
+        self.prepare = prepare
+        self.mapping = mapping
+        self.mtime_ns: Optional[int] = None
+        self.checked_at = 0.0
+        self.version = ""
+        self.source_bytes = 0
+        self.resident_bytes = 0
+        self.form = TemplateForm({}, {})
+        self.compiled: Optional["CompiledMapping"] = None
+        self._reader: Optional[PdfReader] = None
+
+    def load(self):
+        mtime_ns = self.path.stat().st_mtime_ns
+        data = self.path.read_bytes()
+        version = hashlib.sha256(data).hexdigest()[:16]
+        if self.prepare:
+            data = self.prepared_bytes(data)
+        reader = PdfReader(io.BytesIO(data))
+        # A throwaway incremental writer resolves every object of the xref into the
+        # reader's cache, so renders never read from the shared stream again
+        PdfWriter(reader, incremental=True)
+        form = TemplateForm.compile(reader)
+        # Raises when the mapping names fields the template does not have
+        self.compiled = self.mapping.compile(form, self.name) if self.mapping else None
+        self.form = form
+        self._reader = reader
+        self.version = version
+        self.source_bytes = len(data)
+        self.resident_bytes = len(data) + _estimate_size(reader.resolved_objects)
+        self.mtime_ns = mtime_ns
+        self.checked_at = time.monotonic()
+
+    def prepared_bytes(self, data: bytes) -> bytes:
+        """Apply the one-time structural changes and serialize the base document"""
+        writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+        self.prepare(writer)
+        return write_pdf(writer)
+
+    def writer(self, full: bool = False) -> PdfWriter:
+        """Fresh writer for one render; the cached template is never modified.
+
+        ``full`` forces a complete rewrite, e.g. for a flattened document that
+        must not carry the original form along.
+        """
+        if full or not INCREMENTAL_WRITES:
+            return PdfWriter(clone_from=self._reader)
+        writer = PdfWriter(self._reader, incremental=True)
+        if writer.pdf_header < "%PDF-1.5":
+            # The appended section uses a cross-reference stream, a PDF 1.5 feature;
+            # the header stays untouched, the catalog overrides it
+            writer.root_object[NameObject("/Version")] = NameObject("/1.5")
+        return writer
+
+
+class TemplateRegistry:
+    """Keeps the parsed PDF templates and reloads them when the file changes.
+
+    A render only looks at the file once TEMPLATE_CHECK_INTERVAL has passed
+    since the last check; reload_changed() checks every template right away.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, PdfTemplate] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        path: Path,
+        prepare: Optional[Callable[[PdfWriter], None]] = None,
+        mapping: Optional["FormMapping"] = None,
+    ):
+        self._templates[name] = PdfTemplate(name, path, prepare, mapping)
+
+    def load_all(self):
+        for name in self._templates:
+            self.get(name)
+
+    def get(self, name: str) -> PdfTemplate:
+        template = self._templates[name]
+        if template.mtime_ns is None or self._check_due(template):
+            self._reload_if_changed(template)
+        return template
+
+    def writer(self, name: str, full: bool = False) -> PdfWriter:
+        return self.get(name).writer(full)
+
+    def version(self, name: str) -> str:
+        """Version of the template as loaded; never reads the file, so it is safe on the event loop"""
+        return self._templates[name].version
+
+    def reload_changed(self) -> List[str]:
+        """Reload the templates whose file changed since they were loaded"""
+        return [name for name, template in self._templates.items() if self._reload_if_changed(template)]
+
+    @staticmethod
+    def _check_due(template: PdfTemplate) -> bool:
+        now = time.monotonic()
+        if TEMPLATE_CHECK_INTERVAL <= 0 or now - template.checked_at < TEMPLATE_CHECK_INTERVAL:
+            return False
+        template.checked_at = now
+        return True
+
+    def _reload_if_changed(self, template: PdfTemplate) -> bool:
+        mtime_ns = template.path.stat().st_mtime_ns
+        if mtime_ns == template.mtime_ns:
+            return False
+        with self._lock:
+            if mtime_ns != template.mtime_ns:
+                template.load()
+                logger.info(f"Loaded PDF template {template.name} ({template.resident_bytes} bytes resident)")
+        return True
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def write_prepared(self, out_dir: Path) -> List[Path]:
+        """Write the prepared base documents, e.g. to inspect them in a viewer"""
+        out_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for template in self._templates.values():
+            data = template.path.read_bytes()
+            if template.prepare:
+                data = template.prepared_bytes(data)
+            target = out_dir / f"{template.path.stem}.prepared.pdf"
+            target.write_bytes(data)
+            written.append(target)
+        return written
+
+    def memory_usage(self) -> Dict[str, Any]:
+        templates = {
+            name: {
+                "path": str(t.path),
+                "loaded": t.mtime_ns is not None,
+                "version": t.version,
+                "source_bytes": t.source_bytes,
+                "resident_bytes": t.resident_bytes,
+            }
+            for name, t in self._templates.items()
+        }
+        return {
+            "templates": templates,
+            "total_resident_bytes": sum(t["resident_bytes"] for t in templates.values()),
+        }
+
+
+def remove_form_field(writer: PdfWriter, field_name: str):
+    """Remove a form field from the AcroForm and from every page's annotations"""
+    acroform = writer.root_object.get("/AcroForm")
+    if acroform and "/Fields" in acroform:
+        acroform[NameObject("/Fields")] = ArrayObject(
+            ref for ref in acroform["/Fields"] if ref.get_object().get("/T") != field_name
+        )
+    for page in writer.pages:
+        if "/Annots" in page:
+            page[NameObject("/Annots")] = ArrayObject(
+                ref for ref in page["/Annots"] if ref.get_object().get("/T") != field_name
+            )
+
+
+def prepare_main_template(writer: PdfWriter):
+    # leistungserbringer_name_addr duplicates the printed background text
+    remove_form_field(writer, "leistungserbringer_name_addr")
+
+
 # ============ PRODUCTS DATA ============
 PRODUCTS = [
     {"id": "pads", "name": "Bettschutzeinlagen", "meta": "Einmalgebrauch", "price": 24.40, "factor": 50, "pos": "54.45.01.0001", "unit": "1 Stück"},
@@ -52,6 +1009,171 @@ PRODUCTS = [
 
 BUDGET_LIMIT = 42.00
 
+# Optional JSON/YAML file that replaces the built-in catalog; reloaded when it changes
+PRODUCTS_FILE = Path(os.environ["PRODUCTS_FILE"]) if os.environ.get("PRODUCTS_FILE") else None
+
+# Quantity field per product on the Anlage 2 form (richtige-pdf.pdf)
+MAIN_QTY_FIELDS = {
+    "pads": "qty_1",           # Bettschutzeinlagen
+    "fingerlings": "qty_2",    # Fingerlinge
+    "gloves": "qty_3",         # Einmalhandschuhe
+    "medMasks": "qty_4",       # Medizinische Masken
+    "ffp2": "qty_5",           # FFP2-Masken
+    "aprons": "qty6",          # Schutzschürzen Einmal (Note: no underscore!)
+    "apronsReusable": "qty_7", # Schutzschürzen wiederverwendbar
+    "serviettes": "qty_8",     # Schutzservietten
+    "handdes": "qty_9",        # Händedesinfektionsmittel
+    "surfacedes": "qty_10",    # Flächendesinfektionsmittel
+    "hand_wipes": "qty_11",    # Händedesinfektionstücher
+    "surface_wipes": "qty_12", # Flächendesinfektionstücher
+}
+
+# Position, article number, quantity and description field per row of the Bestellformular
+ORDER_FORM_ROWS = tuple(
+    (f"POS_{n:02d}", f"PN_{n:02d}", f"MENGE_{n:02d}", f"BEZ_{n:02d}") for n in range(1, 13)
+)
+
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    id: str
+    name: str
+    meta: str
+    price_cents: int
+    factor: int
+    pos: str
+    unit: str
+    has_size: bool
+
+
+class CatalogEntry(BaseModel):
+    """A product as given in PRODUCTS_FILE; further keys are passed on to the frontend"""
+    model_config = ConfigDict(extra="allow")
+
+    id: str = Field(min_length=1)
+    name: str
+    meta: str = ""
+    price: float = Field(ge=0)
+    factor: int = Field(gt=0)  # pieces (or 100 ml units) per package
+    pos: str
+    unit: str = ""
+    hasSize: bool = False
+
+
+class CatalogData(BaseModel):
+    products: List[CatalogEntry] = Field(min_length=1)
+    budget_limit: float = Field(BUDGET_LIMIT, gt=0)
+
+    @model_validator(mode="after")
+    def unique_ids(self) -> "CatalogData":
+        ids = [entry.id for entry in self.products]
+        duplicates = sorted({product_id for product_id in ids if ids.count(product_id) > 1})
+        if duplicates:
+            raise ValueError(f"duplicate product ids: {', '.join(duplicates)}")
+        return self
+
+
+class Catalog:
+    """Immutable product catalog with an id index, built once per data version"""
+
+    __slots__ = ("products", "by_id", "budget_limit_cents", "api_payload")
+
+    def __init__(self, data: CatalogData):
+        self.products = tuple(
+            Product(
+                id=entry.id,
+                name=entry.name,
+                meta=entry.meta,
+                price_cents=to_cents(entry.price),
+                factor=entry.factor,
+                pos=entry.pos,
+                unit=entry.unit,
+                has_size=entry.hasSize,
+            )
+            for entry in data.products
+        )
+        self.by_id = MappingProxyType({p.id: p for p in self.products})
+        self.budget_limit_cents = to_cents(data.budget_limit)
+        # Response of GET /api/products, in the shape the frontend expects
+        self.api_payload = {
+            "products": [entry.model_dump(exclude_unset=True) for entry in data.products],
+            "budget_limit": data.budget_limit,
+        }
+
+    @classmethod
+    def parse(cls, data: Any) -> "Catalog":
+        """Catalog from a product list or {"products": [...], "budget_limit": ...}; raises ValidationError"""
+        return cls(CatalogData.model_validate({"products": data} if isinstance(data, list) else data))
+
+    def get(self, product_id: str) -> Optional[Product]:
+        return self.by_id.get(product_id)
+
+    def total_cents(self, items: List["ProductSelection"]) -> int:
+        total = 0
+        for item in items:
+            product = self.by_id.get(item.product_id)
+            if product:
+                total += product.price_cents * item.quantity
+        return total
+
+
+class CatalogStore:
+    """Serves the current catalog and rebuilds it when PRODUCTS_FILE changes.
+
+    A file that cannot be read or does not validate is logged and skipped;
+    the last good catalog stays in service until the file is fixed.
+    """
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.mtime_ns: Optional[int] = None
+        self._catalog = Catalog.parse(PRODUCTS)
+        self._lock = threading.Lock()
+
+    def current(self) -> Catalog:
+        if self.path is None:
+            return self._catalog
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime_ns = 0  # missing; reading it reports why
+        if mtime_ns != self.mtime_ns:
+            with self._lock:
+                if mtime_ns != self.mtime_ns:
+                    # Remembered before loading, so a broken file is reported once, not per request
+                    self.mtime_ns = mtime_ns
+                    try:
+                        self._catalog = self._load()
+                        logger.info(f"Loaded product catalog from {self.path} ({len(self._catalog.products)} products)")
+                    except Exception as e:
+                        logger.error(f"Product catalog {self.path} is invalid, keeping the previous one: {e}")
+        return self._catalog
+
+    def reload(self) -> Catalog:
+        """Load PRODUCTS_FILE now and raise if it is invalid, e.g. at startup"""
+        if self.path is not None:
+            with self._lock:
+                mtime_ns = self.path.stat().st_mtime_ns
+                self._catalog = self._load()
+                self.mtime_ns = mtime_ns
+        return self._catalog
+
+    def _load(self) -> Catalog:
+        text = self.path.read_text(encoding="utf-8")
+        if self.path.suffix in (".yaml", ".yml"):
+            import yaml
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+        return Catalog.parse(data)
+
+
+catalog_store = CatalogStore(PRODUCTS_FILE)
+
 # ============ MODELS ============
 class ProductSelection(BaseModel):
     product_id: str
@@ -85,8 +1207,8 @@ class InsuranceInfo(BaseModel):
     bemerkung: Optional[str] = ""
     consent1: bool
     consent2: bool
-    signature_insured: str  # Base64 PNG
-    signature_care: Optional[str] = ""  # Base64 PNG (optional)
+    signature_insured: str  # Base64 PNG; stored orders hold a "sha256:" reference into db.signatures
+    signature_care: Optional[str] = ""  # Base64 PNG (optional), stored like signature_insured
 
 class OrderCreate(BaseModel):
     products: List[ProductSelection]
@@ -104,327 +1226,2218 @@ class Order(BaseModel):
     extra_washable: int = 0
     total: float
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    pdf_status: Optional[str] = None  # pending, rendered, failed
+    client_key: Optional[str] = None  # partner row ID of bulk intake, unique when set (sparse index)
 
 # ============ HELPER FUNCTIONS ============
 def calculate_total(products: List[ProductSelection]) -> float:
-    total = 0.0
-    for item in products:
-        product = next((p for p in PRODUCTS if p["id"] == item.product_id), None)
-        if product:
-            total += product["price"] * item.quantity
-    return round(total, 2)
-
-def fill_pdf_fields(reader: PdfReader, writer: PdfWriter, field_values: Dict[str, Any]):
-    """Fill AcroForm fields in PDF"""
-    for page in reader.pages:
-        writer.add_page(page)
-    
-    # Update form fields
-    writer.update_page_form_field_values(writer.pages[0], field_values)
+    return catalog_store.current().total_cents(products) / 100
 
-def generate_filled_pdf(order: Order) -> bytes:
-    """Generate the main PDF (richtige-pdf.pdf) with filled AcroFields"""
-    reader = PdfReader(str(PDF_MAIN))
-    writer = PdfWriter()
-    
-    # Clone document to preserve form fields properly
-    writer.clone_document_from_reader(reader)
-    
-    # Remove the leistungserbringer_name_addr field completely (has duplicate background text)
-    field_to_remove = "leistungserbringer_name_addr"
-    try:
-        # Remove from AcroForm fields
-        if "/AcroForm" in writer._root_object:
-            acroform = writer._root_object["/AcroForm"]
-            if "/Fields" in acroform:
-                fields = acroform["/Fields"]
-                new_fields = []
-                for field_ref in fields:
-                    field = field_ref.get_object()
-                    field_name = field.get("/T", "")
-                    if field_name != field_to_remove:
-                        new_fields.append(field_ref)
-                acroform["/Fields"] = new_fields
-        
-        # Remove from page annotations
-        for page in writer.pages:
-            if "/Annots" in page:
-                annots = page["/Annots"]
-                new_annots = []
-                for annot_ref in annots:
-                    annot = annot_ref.get_object()
-                    annot_name = annot.get("/T", "")
-                    if annot_name != field_to_remove:
-                        new_annots.append(annot_ref)
-                page["/Annots"] = new_annots
-    except Exception as e:
-        logger.warning(f"Could not remove field: {e}")
-    
-    # Build field values from order data
-    customer = order.customer
-    insurance = order.insurance
-    
-    # Name and address formatting
-    full_name = f"{customer.nachname}, {customer.vorname}"
-    full_address = f"{customer.strasse} {customer.hausnr}, {customer.plz} {customer.stadt}"
-    if customer.adresszusatz:
-        full_address = f"{customer.strasse} {customer.hausnr}, {customer.adresszusatz}, {customer.plz} {customer.stadt}"
-    
-    # Today's date
-    today = datetime.now()
-    date_str = today.strftime("%d.%m.%Y")
-    
-    # Build quantity fields based on products
-    qty_map = {
-        "pads": "qty_1",           # Bettschutzeinlagen
-        "fingerlings": "qty_2",    # Fingerlinge
-        "gloves": "qty_3",         # Einmalhandschuhe
-        "medMasks": "qty_4",       # Medizinische Masken
-        "ffp2": "qty_5",           # FFP2-Masken
-        "aprons": "qty6",          # Schutzschürzen Einmal (Note: no underscore!)
-        "apronsReusable": "qty_7", # Schutzschürzen wiederverwendbar
-        "serviettes": "qty_8",     # Schutzservietten
-        "handdes": "qty_9",        # Händedesinfektionsmittel
-        "surfacedes": "qty_10",    # Flächendesinfektionsmittel
-        "hand_wipes": "qty_11",    # Händedesinfektionstücher
-        "surface_wipes": "qty_12", # Flächendesinfektionstücher
-    }
-    
-    qty_fields = {}
-    gloves_size = ""
-    
-    for item in order.products:
-        product = next((p for p in PRODUCTS if p["id"] == item.product_id), None)
-        if product and item.quantity > 0:
-            field_name = qty_map.get(item.product_id)
-            if field_name:
-                factor_value = item.quantity * product["factor"]
-                qty_fields[field_name] = str(factor_value)
-            
-            if item.product_id == "gloves" and item.size:
-                gloves_size = item.size
-    
-    # Add glove size info
-    if gloves_size and "qty_3" in qty_fields:
-        qty_fields["qty_3"] = f"{qty_fields['qty_3']} (Gr. {gloves_size})"
-    
-    # === PAGE 0 FIELDS ===
-    page0_fields = {
-        "name_vorname": full_name,
-        "geb_1": customer.geburtsdatum,
-        "anschrift": full_address,
-        "pflegekasse": insurance.krankenkasse,
-        "ver_nr": insurance.versichertennummer,
-        "chk_pg54": "/Yes",  # Checkbox: PG54 beantragt
-        **qty_fields
-    }
-    
-    # === PAGE 1 FIELDS ===
-    page1_fields = {
-        # leistungserbringer_name_addr wurde entfernt (Hintergrundtext bleibt)
-        "mitarbeiter": "Marina Bittner",
-        "ik_nr": "330522443",  # IK-Nummer des Leistungserbringers
-        "datum_beratung": date_str,
-        "datum_unterschrift": date_str,
-        # Checkboxen auf Seite 1
-        "chk_beratung_bestaetigt": "/Yes",
-        "chk_form_1": "/Yes",
-        "chk_form_2": "/Yes",
-        "chk_beraten_1": "/Yes",
-        "chk_beraten_2": "/Yes",
-        "chk_bestaetigung_1": "/Yes",
-        "chk_bestaetigung_2": "/Yes",
-        "genehm_pg54": "/Yes",
-    }
-    
-    # Add beihilfe checkbox if applicable
-    if insurance.beihilfe:
-        page1_fields["genehm_pg54_beihilfe"] = "/Yes"
-    
-    # Update fields on each page
-    try:
-        writer.update_page_form_field_values(writer.pages[0], page0_fields)
-    except Exception as e:
-        logger.warning(f"Could not update page 0 fields: {e}")
-    
-    try:
-        writer.update_page_form_field_values(writer.pages[1], page1_fields)
-    except Exception as e:
-        logger.warning(f"Could not update page 1 fields: {e}")
-    
-    # === EMBED SIGNATURE IMAGE ===
-    if insurance.signature_insured:
-        try:
-            embed_signature_in_pdf(writer, insurance.signature_insured, page_num=1)
-        except Exception as e:
-            logger.warning(f"Could not embed signature: {e}")
-    
-    # Write to bytes
-    output = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    writer.write(output)
-    output.close()
-    
-    with open(output.name, "rb") as f:
-        pdf_bytes = f.read()
-    
-    os.unlink(output.name)
-    return pdf_bytes
+def utc_timestamp(delay: float = 0) -> str:
+    """Fixed-width UTC timestamp, so comparing the strings in queries compares the times"""
+    return (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat(timespec="milliseconds")
+
+def write_pdf(writer: PdfWriter) -> bytes:
+    """Serialize a filled document in memory"""
+    output = io.BytesIO()
+    if writer.incremental:
+        write_increment(writer, output)
+    else:
+        writer.write(output)
+    return output.getvalue()
 
+def finish_pdf(writer: PdfWriter, flatten: bool = False) -> bytes:
+    """Optionally flatten the form, then serialize"""
+    if flatten:
+        with stage("flatten"):
+            flatten_form(writer)
+    with stage("write"):
+        return write_pdf(writer)
 
-def embed_signature_in_pdf(writer: PdfWriter, signature_base64: str, page_num: int = 1):
-    """Embed signature image into PDF at the Image1 field location"""
-    import io
+def attachment_headers(filename: str) -> Dict[str, str]:
+    """Content-Disposition for a download, RFC 5987 encoded for non-ASCII names"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+SIGNATURE_CACHE_SIZE = int(os.environ.get("SIGNATURE_CACHE_SIZE", 128))
+
+
+@dataclass(frozen=True, slots=True)
+class SignatureImage:
+    """Signature decoded into Flate-compressed samples, ready to become an image XObject"""
+    width: int
+    height: int
+    rgb: bytes
+    alpha: Optional[bytes]
+
+
+@functools.lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def decode_signature(signature_base64: str) -> SignatureImage:
+    """Decode a base64 PNG (data URL or plain) once; repeated renders reuse the result"""
     from PIL import Image as PILImage
-    from pypdf.generic import (
-        DictionaryObject, ArrayObject, NameObject, 
-        NumberObject, IndirectObject
-    )
-    from reportlab.lib.utils import ImageReader
-    from reportlab.pdfgen import canvas as rl_canvas
     
-    # Decode base64 signature
     if signature_base64.startswith('data:'):
         signature_base64 = signature_base64.split(',')[1]
     
-    sig_bytes = base64.b64decode(signature_base64)
-    sig_image = PILImage.open(io.BytesIO(sig_bytes))
-    
-    # Convert to RGB if necessary
-    if sig_image.mode in ('RGBA', 'LA', 'P'):
-        background = PILImage.new('RGB', sig_image.size, (255, 255, 255))
-        if sig_image.mode == 'P':
-            sig_image = sig_image.convert('RGBA')
-        background.paste(sig_image, mask=sig_image.split()[-1] if sig_image.mode == 'RGBA' else None)
-        sig_image = background
-    
-    # Save signature as temporary PNG
-    sig_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    sig_image.save(sig_temp, format='PNG')
-    sig_temp.close()
+    sig_image = PILImage.open(io.BytesIO(base64.b64decode(signature_base64)))
+    if sig_image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'transparency' in sig_image.info or 'A' in sig_image.getbands()
+        sig_image = sig_image.convert('RGBA' if has_alpha else 'RGB')
     
-    # Create a PDF with just the signature using reportlab
-    sig_pdf_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    c = rl_canvas.Canvas(sig_pdf_temp.name, pagesize=(200, 50))
-    c.drawImage(sig_temp.name, 0, 0, width=200, height=50, preserveAspectRatio=True)
-    c.save()
-    
-    # Merge signature PDF onto the target page
-    sig_reader = PdfReader(sig_pdf_temp.name)
-    
-    # Get page and find Image1 field location (approximate - bottom of page 1)
-    page = writer.pages[page_num]
-    
-    # Merge the signature page content
-    # Note: This is a simplified approach - for production, you'd want to 
-    # position the signature exactly at the Image1 field coordinates
-    
-    # Clean up temp files
-    os.unlink(sig_temp.name)
-    os.unlink(sig_pdf_temp.name)
+    # Keep the transparency as a soft mask instead of flattening onto white
+    alpha = sig_image.getchannel('A').tobytes() if sig_image.mode == 'RGBA' else None
+    return SignatureImage(
+        width=sig_image.width,
+        height=sig_image.height,
+        rgb=zlib.compress(sig_image.convert('RGB').tobytes()),
+        alpha=zlib.compress(alpha) if alpha else None,
+    )
 
 
-def generate_bestellformular_pdf(order: Order) -> bytes:
-    """Generate the order form (bestellformular.pdf) with filled fields"""
-    reader = PdfReader(str(PDF_ORDER))
-    writer = PdfWriter()
-    
-    # Clone document to preserve form fields
-    writer.clone_document_from_reader(reader)
-    
-    customer = order.customer
-    today = datetime.now()
-    
-    # Customer info
-    field_values = {
-        "K_NAME": f"{customer.vorname} {customer.nachname}",
-        "K_STRASSE": f"{customer.strasse} {customer.hausnr}",
-        "K_ORT": f"{customer.plz} {customer.stadt}",
-        "DATUM": today.strftime("%d.%m.%Y"),
-        "LS_NR": order.id[:8].upper(),
-        "KUNDEN_NR": order.insurance.versichertennummer,
-    }
+def _image_stream(writer: PdfWriter, data: bytes, width: int, height: int, color_space: str, **extra) -> IndirectObject:
+    stream = encoded_stream(data)
+    stream.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(width),
+        NameObject("/Height"): NumberObject(height),
+        NameObject("/ColorSpace"): NameObject(color_space),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+        **{NameObject(key): value for key, value in extra.items()},
+    })
+    return add_object(writer, stream)
+
+
+def _content_stream(writer: PdfWriter, data: bytes) -> IndirectObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return add_object(writer, stream)
+
+
+def embed_signature_in_pdf(writer: PdfWriter, signature_base64: str, widget: FormWidget):
+    """Stamp a signature image onto the page, fitted into the rectangle of a form field"""
+    image = decode_signature(signature_base64)
+    extra = {}
+    if image.alpha:
+        extra["/SMask"] = _image_stream(writer, image.alpha, image.width, image.height, "/DeviceGray")
+    image_ref = _image_stream(writer, image.rgb, image.width, image.height, "/DeviceRGB", **extra)
     
-    # Fill product rows
-    row_num = 1
-    for item in order.products:
-        if item.quantity > 0 and row_num <= 12:
-            product = next((p for p in PRODUCTS if p["id"] == item.product_id), None)
-            if product:
-                pos_key = f"POS_{row_num:02d}"
-                pn_key = f"PN_{row_num:02d}"
-                menge_key = f"MENGE_{row_num:02d}"
-                bez_key = f"BEZ_{row_num:02d}"
-                
-                field_values[pos_key] = str(row_num)
-                field_values[pn_key] = product["pos"]
-                field_values[menge_key] = str(item.quantity)
-                
-                bez = product["name"]
-                if item.product_id == "gloves" and item.size:
-                    bez += f" (Gr. {item.size})"
-                field_values[bez_key] = bez
-                
-                row_num += 1
+    # Fit into the field keeping the aspect ratio, centered
+    x1, y1, x2, y2 = widget.rect
+    scale = min((x2 - x1) / image.width, (y2 - y1) / image.height)
+    width, height = image.width * scale, image.height * scale
+    x = x1 + ((x2 - x1) - width) / 2
+    y = y1 + ((y2 - y1) - height) / 2
     
-    try:
-        writer.update_page_form_field_values(writer.pages[0], field_values)
-    except Exception as e:
-        logger.warning(f"Could not update bestellformular fields: {e}")
+    resource_name = f"/Sig_{widget.name}"
+    stamp_page(
+        writer, writer.pages[widget.page], {resource_name: image_ref},
+        f"q {width:.4f} 0 0 {height:.4f} {x:.4f} {y:.4f} cm {resource_name} Do Q\n".encode(),
+    )
+
+
+# ============ FORM MAPPINGS ============
+# Which order data goes into which field, declared once per template. A mapping
+# is compiled against the template's AcroForm when the template is loaded, so a
+# renamed or missing field stops the startup instead of leaving it empty in
+# every document; rendering then only evaluates a flat list of assignments.
+
+CHECKED = True
+
+
+@dataclass(frozen=True, slots=True)
+class FormContext:
+    """Order data prepared once per render for the field sources"""
+    order: Order
+    lines: Tuple[Tuple[Product, ProductSelection], ...]  # ordered products with quantity
+    today: datetime
+
+    @classmethod
+    def build(cls, order: Order) -> "FormContext":
+        catalog = catalog_store.current()
+        lines = tuple(
+            (product, item)
+            for item in order.products
+            if item.quantity > 0 and (product := catalog.get(item.product_id)) is not None
+        )
+        return cls(order, lines, datetime.now())
+
+    @property
+    def date(self) -> str:
+        return self.today.strftime("%d.%m.%Y")
+
+    def line(self, product_id: str) -> Optional[Tuple[Product, ProductSelection]]:
+        found = None
+        for product, item in self.lines:
+            if product.id == product_id:
+                found = (product, item)
+        return found
+
+
+# A field source turns the context into the field value; None leaves the field as it is
+FieldSource = Callable[[FormContext], Any]
+
+
+@dataclass(frozen=True, slots=True)
+class FormRows:
+    """Table rows of the same fields, filled with one order line each"""
+    fields: Tuple[Tuple[str, ...], ...]
+    values: Callable[[int, Product, ProductSelection], Tuple[Any, ...]]
+
+
+@dataclass(frozen=True, slots=True)
+class FormSignature:
+    """Signature image stamped into the rectangle of a field"""
+    field: str
+    source: Callable[[Order], Optional[str]]
+
+
+@dataclass(frozen=True, slots=True)
+class FormMapping:
+    fields: Dict[str, FieldSource]
+    rows: Optional[FormRows] = None
+    signature: Optional[FormSignature] = None
+
+    def compile(self, form: TemplateForm, template: str) -> "CompiledMapping":
+        """Resolve every field name to its widget, collecting all mismatches"""
+        errors = []
+
+        def widget(name: str, kinds: Tuple[str, ...]) -> Optional[FormWidget]:
+            found = form.widgets.get(name)
+            if found is None:
+                errors.append(f"{name} does not exist")
+            elif found.kind not in kinds:
+                errors.append(f"{name} is a {found.kind} field")
+            return found
+
+        fields = tuple((widget(name, ("text", "checkbox")), source) for name, source in self.fields.items())
+        rows: Tuple[Tuple[FormWidget, ...], ...] = ()
+        if self.rows:
+            rows = tuple(tuple(widget(name, ("text",)) for name in row) for row in self.rows.fields)
+            if len({len(row) for row in rows}) > 1:
+                errors.append("rows differ in length")
+        signature = None
+        if self.signature:
+            signature = (widget(self.signature.field, ("button", "text")), self.signature.source)
+        if errors:
+            raise ValueError(f"Form mapping of template {template} does not match the PDF: {'; '.join(errors)}")
+        return CompiledMapping(fields, rows, self.rows.values if self.rows else None, signature)
+
+
+class CompiledMapping:
+    """A form mapping resolved to the widgets of one loaded template"""
+
+    __slots__ = ("fields", "rows", "row_values", "signature")
+
+    def __init__(
+        self,
+        fields: Tuple[Tuple[FormWidget, FieldSource], ...],
+        rows: Tuple[Tuple[FormWidget, ...], ...],
+        row_values: Optional[Callable[[int, Product, ProductSelection], Tuple[Any, ...]]],
+        signature: Optional[Tuple[FormWidget, Callable[[Order], Optional[str]]]],
+    ):
+        self.fields = fields
+        self.rows = rows
+        self.row_values = row_values
+        self.signature = signature
+
+    def assignments(self, context: FormContext) -> List[Tuple[FormWidget, Any]]:
+        assignments = []
+        for widget, source in self.fields:
+            value = source(context)
+            if value is not None:
+                assignments.append((widget, value))
+        # Order lines beyond the last row do not fit onto the form
+        for number, (row, (product, item)) in enumerate(zip(self.rows, context.lines), 1):
+            assignments.extend(zip(row, self.row_values(number, product, item)))
+        return assignments
+
+    def names(self) -> set:
+        names = {widget.name for widget, _ in self.fields}
+        names.update(widget.name for row in self.rows for widget in row)
+        if self.signature:
+            names.add(self.signature[0].name)
+        return names
+
+
+def _const(value: Any) -> FieldSource:
+    return lambda context: value
+
+
+def _size_suffix(product: Product, item: ProductSelection) -> str:
+    return f" (Gr. {item.size})" if product.has_size and item.size else ""
+
+
+def _main_quantity(product_id: str) -> FieldSource:
+    """Anlage 2 asks for pieces (or 100 ml units), not packages"""
+    def source(context: FormContext) -> Optional[str]:
+        line = context.line(product_id)
+        if line is None:
+            return None
+        product, item = line
+        return f"{item.quantity * product.factor}{_size_suffix(product, item)}"
+    return source
+
+
+def _main_address(context: FormContext) -> str:
+    customer = context.order.customer
+    parts = (f"{customer.strasse} {customer.hausnr}", customer.adresszusatz, f"{customer.plz} {customer.stadt}")
+    return ", ".join(part for part in parts if part)
+
+
+def _supply_start(context: FormContext) -> str:
+    """First day of the next month"""
+    today = context.today
+    if today.month == 12:
+        return today.replace(year=today.year + 1, month=1, day=1).strftime("%d.%m.%Y")
+    return today.replace(month=today.month + 1, day=1).strftime("%d.%m.%Y")
+
+
+# Anlage 2 (richtige-pdf.pdf)
+MAIN_FORM = FormMapping(
+    fields={
+        # Page 1: insured person and quantities
+        "name_vorname": lambda c: f"{c.order.customer.nachname}, {c.order.customer.vorname}",
+        "geb_1": lambda c: c.order.customer.geburtsdatum,
+        "anschrift": _main_address,
+        "pflegekasse": lambda c: c.order.insurance.krankenkasse,
+        "ver_nr": lambda c: c.order.insurance.versichertennummer,
+        "chk_pg54": _const(CHECKED),  # PG54 beantragt
+        **{field: _main_quantity(product_id) for product_id, field in MAIN_QTY_FIELDS.items()},
+        # Page 2: provider; leistungserbringer_name_addr is removed from the prepared
+        # template, the printed background text stays
+        "mitarbeiter": _const("Marina Bittner"),
+        "ik_nr": _const("330522443"),  # IK-Nummer des Leistungserbringers
+        "datum_beratung": lambda c: c.date,
+        "datum_unterschrift": lambda c: c.date,
+        "chk_beratung_bestaetigt": _const(CHECKED),
+        "chk_form_1": _const(CHECKED),
+        "chk_form_2": _const(CHECKED),
+        "chk_beraten_1": _const(CHECKED),
+        "chk_beraten_2": _const(CHECKED),
+        "chk_bestaetigung_1": _const(CHECKED),
+        "chk_bestaetigung_2": _const(CHECKED),
+        "genehm_pg54": _const(CHECKED),
+        "genehm_pg54_beihilfe": lambda c: CHECKED if c.order.insurance.beihilfe else None,
+    },
+    signature=FormSignature("Image1", lambda order: order.insurance.signature_insured),
+)
+
+# Bestellformular (bestellformular.pdf)
+ORDER_FORM = FormMapping(
+    fields={
+        "K_NAME": lambda c: f"{c.order.customer.vorname} {c.order.customer.nachname}",
+        "K_STRASSE": lambda c: f"{c.order.customer.strasse} {c.order.customer.hausnr}",
+        "K_ORT": lambda c: f"{c.order.customer.plz} {c.order.customer.stadt}",
+        "DATUM": lambda c: c.date,
+        "LS_NR": lambda c: c.order.id[:8].upper(),
+        "KUNDEN_NR": lambda c: c.order.insurance.versichertennummer,
+    },
+    rows=FormRows(
+        ORDER_FORM_ROWS,
+        lambda number, product, item: (
+            str(number), product.pos, str(item.quantity), f"{product.name}{_size_suffix(product, item)}",
+        ),
+    ),
+)
+
+# Wechselerklärung (wechsel.pdf)
+WECHSEL_FORM = FormMapping(
+    fields={
+        "txt_name": lambda c: c.order.customer.nachname,
+        "txt_vorname": lambda c: c.order.customer.vorname,
+        "txt_geburtsdatum": lambda c: c.order.customer.geburtsdatum,
+        "txt_versichertennummer": lambda c: c.order.insurance.versichertennummer,
+        "txt_pflegekasse": lambda c: c.order.insurance.krankenkasse,
+        "txt_versorgungsbeginn_ab": _supply_start,
+        "txt_ort_datum": lambda c: f"{c.order.customer.stadt}, {c.date}",
+    },
+    # "Unterschrift der/des Versicherten / der gesetzlichen Vertretung":
+    # a signing Betreuungsperson acts as the representative
+    signature=FormSignature(
+        "sig_unterschrift", lambda order: order.insurance.signature_care or order.insurance.signature_insured,
+    ),
+)
+
+pdf_templates = TemplateRegistry()
+pdf_templates.register("main", PDF_MAIN, prepare=prepare_main_template, mapping=MAIN_FORM)
+pdf_templates.register("bestellung", PDF_ORDER, mapping=ORDER_FORM)
+pdf_templates.register("wechsel", PDF_WECHSEL, mapping=WECHSEL_FORM)
+
+
+def render_form(name: str, order: Order, flatten: bool = False) -> bytes:
+    """Fill a template from its form mapping"""
+    # Cloned from the cached template to preserve form fields
+    with stage("clone"):
+        writer = pdf_templates.writer(name, full=flatten)
+    template = pdf_templates.get(name)
+    context = FormContext.build(order)
+
+    with stage("fields"):
+        try:
+            fill_form(writer, template.form, template.compiled.assignments(context))
+        except Exception as e:
+            logger.warning(f"Could not update {name} fields: {e}")
+            stage_failed("fields")
+
+    if template.compiled.signature:
+        widget, source = template.compiled.signature
+        signature = source(order)
+        if signature:
+            with stage("signature"):
+                try:
+                    embed_signature_in_pdf(writer, signature, widget)
+                except Exception as e:
+                    logger.warning(f"Could not embed signature: {e}")
+                    stage_failed("signature")
+
+    return finish_pdf(writer, flatten)
+
+
+def generate_filled_pdf(order: Order, flatten: bool = False) -> bytes:
+    """Generate the main PDF (richtige-pdf.pdf) with filled AcroFields"""
+    return render_form("main", order, flatten)
+
+
+def generate_bestellformular_pdf(order: Order, flatten: bool = False) -> bytes:
+    """Generate the order form (bestellformular.pdf) with filled fields"""
+    return render_form("bestellung", order, flatten)
+
+
+def generate_wechsel_pdf(order: Order, flatten: bool = False) -> bytes:
+    """Generate the switch declaration (wechsel.pdf) with filled fields"""
+    return render_form("wechsel", order, flatten)
+
+
+# Renderer and download name prefix per document type
+PDF_DOCUMENTS: Dict[str, Tuple[Callable[..., bytes], str]] = {
+    "main": (generate_filled_pdf, "Anlage2_Antrag"),
+    "bestellung": (generate_bestellformular_pdf, "Bestellformular"),
+    "wechsel": (generate_wechsel_pdf, "Wechselerklaerung"),
+}
+
+def render_document(
+    doc_type: str, order: Order, flatten: bool = False
+) -> Tuple[bytes, Optional[Dict[str, Dict[str, float]]]]:
+    """Pool job: render one document and report its stage timings back to the API process"""
+    renderer = PDF_DOCUMENTS[doc_type][0]
+    if not METRICS_ENABLED:
+        return renderer(order, flatten), None
+    report = _render_report.current = {"stages": {}, "failures": {}}
+    try:
+        return renderer(order, flatten), report
+    finally:
+        _render_report.current = None
+
+
+def order_document_types(order: Order) -> List[str]:
+    """Documents belonging to an order; the Wechselerklärung only for existing recipients"""
+    types = ["main", "bestellung"]
+    if order.insurance.bezieht_bereits:
+        types.append("wechsel")
+    return types
+
+
+# ============ SIGNATURE STORAGE ============
+SIGNATURE_FIELDS = ("signature_insured", "signature_care")
+SIGNATURE_REF_PREFIX = "sha256:"
+SIGNATURE_MAX_UPLOAD = int(os.environ.get("SIGNATURE_MAX_UPLOAD", 2 * 1024 * 1024))
+SIGNATURE_MAX_PIXELS = 16 * 1024 * 1024
+SIGNATURE_MAX_WIDTH = int(os.environ.get("SIGNATURE_MAX_WIDTH", 800))
+SIGNATURE_MAX_HEIGHT = int(os.environ.get("SIGNATURE_MAX_HEIGHT", 300))
+
+
+class InvalidSignature(ValueError):
+    """The uploaded signature is not a usable image"""
+
+
+def normalize_signature(value: str) -> bytes:
+    """Validate, crop to the ink, downscale and re-encode a signature as a grayscale+alpha PNG"""
+    from PIL import Image as PILImage
     
-    output = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    writer.write(output)
-    output.close()
+    if value.startswith('data:'):
+        header, _, value = value.partition(',')
+        if not header.startswith('data:image/'):
+            raise InvalidSignature("kein Bild")
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise InvalidSignature("ungültige Base64-Daten")
+    if len(raw) > SIGNATURE_MAX_UPLOAD:
+        raise InvalidSignature("Bild zu groß")
     
-    with open(output.name, "rb") as f:
-        pdf_bytes = f.read()
+    try:
+        image = PILImage.open(io.BytesIO(raw))
+        if image.width * image.height > SIGNATURE_MAX_PIXELS:
+            raise InvalidSignature("Bild zu groß")
+        image = image.convert('RGBA')
+    except InvalidSignature:
+        raise
+    except Exception:
+        raise InvalidSignature("Bild nicht lesbar")
+    
+    gray = image.convert('L')
+    alpha = image.getchannel('A')
+    if alpha.getextrema()[0] == 255:
+        # Opaque export (ink on white): derive the transparency from the darkness
+        alpha = gray.point(lambda v: 255 - v)
+    bbox = alpha.point(lambda v: 255 if v > 16 else 0).getbbox()
+    if bbox is None:
+        raise InvalidSignature("leere Unterschrift")
     
-    os.unlink(output.name)
-    return pdf_bytes
+    result = PILImage.merge('LA', (gray.crop(bbox), alpha.crop(bbox)))
+    result.thumbnail((SIGNATURE_MAX_WIDTH, SIGNATURE_MAX_HEIGHT), PILImage.LANCZOS)
+    output = io.BytesIO()
+    result.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def signature_ref(png: bytes) -> str:
+    return SIGNATURE_REF_PREFIX + hashlib.sha256(png).hexdigest()
+
+
+def signature_data_url(png: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(png).decode()
+
+
+def is_legacy_signature(value: Optional[str]) -> bool:
+    return bool(value) and not value.startswith(SIGNATURE_REF_PREFIX)
+
+
+async def store_signature(png: bytes) -> str:
+    """Store a normalized signature once per content hash and return its reference"""
+    ref = signature_ref(png)
+    try:
+        await db.signatures.update_one(
+            {"_id": ref},
+            {"$setOnInsert": {"data": png, "created_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass  # stored concurrently by another request
+    return ref
+
+
+async def resolve_signatures(values: Dict[str, str]) -> Dict[str, str]:
+    """Replace signature references by data URLs; legacy inline signatures pass through"""
+    refs = [v for v in values.values() if v and v.startswith(SIGNATURE_REF_PREFIX)]
+    if not refs:
+        return values
+    stored = {doc["_id"]: doc["data"] async for doc in db.signatures.find({"_id": {"$in": refs}})}
+    resolved = {}
+    for name, value in values.items():
+        if value and value.startswith(SIGNATURE_REF_PREFIX):
+            if value not in stored:
+                logger.warning(f"Signature {value} not found")
+            resolved[name] = signature_data_url(stored[value]) if value in stored else ""
+        else:
+            resolved[name] = value
+    return resolved
+
+
+def _normalize_batch(docs: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[bytes]]]:
+    results = []
+    for doc in docs:
+        for field in SIGNATURE_FIELDS:
+            value = doc.get("insurance", {}).get(field)
+            if is_legacy_signature(value):
+                try:
+                    results.append((doc["id"], field, normalize_signature(value)))
+                except InvalidSignature:
+                    results.append((doc["id"], field, None))
+    return results
+
+
+async def migrate_signatures(
+    batch_size: int = 500, progress: Optional[Callable[[Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    """Move inline signatures of existing orders into db.signatures, batch by batch"""
+    stats = {"orders": 0, "signatures": 0, "invalid": 0}
+    query = {"$or": [{f"insurance.{f}": {"$regex": f"^(?!{SIGNATURE_REF_PREFIX})."}} for f in SIGNATURE_FIELDS]}
+    projection = {"_id": 0, "id": 1, **{f"insurance.{f}": 1 for f in SIGNATURE_FIELDS}}
+
+    async def migrate_batch(docs: List[Dict[str, Any]]):
+        updates: Dict[str, Dict[str, str]] = {}
+        signatures: Dict[str, bytes] = {}
+        for order_id, field, png in await asyncio.to_thread(_normalize_batch, docs):
+            if png is None:
+                stats["invalid"] += 1
+                continue
+            ref = signature_ref(png)
+            signatures[ref] = png
+            updates.setdefault(order_id, {})[f"insurance.{field}"] = ref
+        if signatures:
+            now = datetime.now(timezone.utc).isoformat()
+            await db.signatures.bulk_write([
+                UpdateOne({"_id": ref}, {"$setOnInsert": {"data": png, "created_at": now}}, upsert=True)
+                for ref, png in signatures.items()
+            ], ordered=False)
+        if updates:
+            await db.orders.bulk_write([
+                UpdateOne({"id": order_id}, {"$set": fields}) for order_id, fields in updates.items()
+            ], ordered=False)
+        stats["orders"] += len(updates)
+        stats["signatures"] += sum(len(fields) for fields in updates.values())
+        if progress:
+            progress(stats)
+
+    batch = []
+    async for doc in db.orders.find(query, projection).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await migrate_batch(batch)
+            batch = []
+    if batch:
+        await migrate_batch(batch)
+    return stats
+
+
+# Signatures each renderer embeds; they are only fetched from Mongo when a render needs them
+DOCUMENT_SIGNATURES: Dict[str, List[str]] = {
+    "main": ["signature_insured"],
+    "bestellung": [],
+    "wechsel": ["signature_insured", "signature_care"],
+}
+
+# Fields the renderers read. The small required fields (pflegegrad, anrede,
+# consents, versicherungsart) are included so the documents still validate as Order.
+ORDER_PDF_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "products": 1,
+    "extra_washable": 1,
+    "total": 1,
+    "created_at": 1,
+    **{f"customer.{name}": 1 for name in (
+        "pflegegrad", "anrede", "vorname", "nachname", "strasse", "hausnr",
+        "adresszusatz", "plz", "stadt", "geburtsdatum",
+    )},
+    **{f"insurance.{name}": 1 for name in (
+        "versicherungsart", "beihilfe", "krankenkasse", "versichertennummer",
+        "bezieht_bereits", "consent1", "consent2",
+    )},
+}
+
+
+def stored_order(doc: Dict[str, Any]) -> Order:
+    """Order from a database document (also ORDER_PDF_PROJECTION documents, whose signatures are missing)"""
+    # Validating is cheaper than model_construct with the nested models
+    # (~13 µs vs ~35 µs per order), so stored orders are still validated
+    return Order.model_validate({**doc, "insurance": {"signature_insured": "", **doc["insurance"]}})
+
+
+async def load_signatures(order: Order, doc_types: List[str]) -> Order:
+    """Order with the signatures the given documents embed fetched from Mongo"""
+    fields = sorted({name for doc_type in doc_types for name in DOCUMENT_SIGNATURES[doc_type]})
+    if not fields:
+        return order
+    doc = await db.orders.find_one({"id": order.id}, {"_id": 0, **{f"insurance.{f}": 1 for f in fields}})
+    signatures = await resolve_signatures((doc or {}).get("insurance", {}))
+    return order.model_copy(update={"insurance": order.insurance.model_copy(update=signatures)})
+
+
+# ============ PDF RENDER POOL ============
+PDF_EXECUTOR = os.environ.get("PDF_EXECUTOR", "process")  # "process" or "thread"
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 2))
+PDF_QUEUE_LIMIT = int(os.environ.get("PDF_QUEUE_LIMIT", PDF_WORKERS * 4))
+# Queue slots exports and emails never take, so downloads are not turned away while a batch runs
+PDF_DOWNLOAD_RESERVE = int(os.environ.get("PDF_DOWNLOAD_RESERVE", max(PDF_QUEUE_LIMIT // 4, 3)))
+PDF_JOB_TIMEOUT = float(os.environ.get("PDF_JOB_TIMEOUT", 30))
+PDF_RETRY_AFTER = int(os.environ.get("PDF_RETRY_AFTER", 5))
+
+
+class RenderPoolSaturated(Exception):
+    """Raised when the render queue is full"""
+
+
+def _warm_render_worker():
+    """Executor initializer: parse the templates and import the imaging code before the first job arrives"""
+    pdf_templates.load_all()
+    warm_libraries()
+
+
+class PdfRenderPool:
+    """Runs the CPU-bound PDF generators off the event loop.
+
+    At most ``queue_limit`` jobs may be queued or running at once; further
+    jobs are rejected with RenderPoolSaturated instead of piling up.
+    Background jobs wait for a slot instead, and only up to
+    ``background_limit``, which leaves ``reserve`` slots to downloads.
+    """
+
+    def __init__(self, kind: str, workers: int, queue_limit: int, timeout: float, reserve: int = 0):
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.background_limit = max(queue_limit - reserve, 1)
+        self.timeout = timeout
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._freed = asyncio.Event()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pdf-render")
+        else:
+            # spawn instead of fork: the parent already runs the event loop and Mongo threads
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_render_worker,
+            )
+            await asyncio.gather(*(
+                self._loop.run_in_executor(self._executor, _warm_render_worker) for _ in range(self.workers)
+            ))
+        logger.info(
+            f"PDF render pool started ({self.kind}, {self.workers} workers, queue limit {self.queue_limit}, "
+            f"{self.background_limit} for background jobs)"
+        )
+
+    def _reserve(self, count: int, limit: int):
+        with self._lock:
+            # A batch larger than the limit still gets an idle pool
+            if self.pending and self.pending + count > limit:
+                raise RenderPoolSaturated()
+            self.pending += count
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        # Runs in the executor's threads; waiting background jobs live on the event loop
+        if self._loop is not None:
+            with contextlib.suppress(RuntimeError):  # loop already closed
+                self._loop.call_soon_threadsafe(self._freed.set)
+
+    def _start(self, fn: Callable, *args) -> asyncio.Future:
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is only freed when the job really finished, even after a timeout
+        future.add_done_callback(self._release)
+        return asyncio.ensure_future(asyncio.wait_for(asyncio.wrap_future(future), self.timeout))
+
+    def submit(self, fn: Callable, *args) -> asyncio.Future:
+        """Queue a job; raises RenderPoolSaturated right away when the queue is full"""
+        self._reserve(1, self.queue_limit)
+        return self._start(fn, *args)
+
+    def submit_all(self, jobs: List[Tuple[Callable, Any]], limit: Optional[int] = None) -> List[asyncio.Future]:
+        """Queue several jobs, either all of them or none"""
+        self._reserve(len(jobs), self.queue_limit if limit is None else limit)
+        futures = []
+        try:
+            for fn, *args in jobs:
+                futures.append(self._start(fn, *args))
+        except BaseException:
+            # _start freed the slot of the failed job, these were never submitted
+            for _ in jobs[len(futures) + 1:]:
+                self._release(None)
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    async def submit_background(self, jobs: List[Tuple[Callable, Any]]) -> List[asyncio.Future]:
+        """Queue the jobs of an export or email once they fit below background_limit"""
+        while True:
+            # Cleared before trying, so a slot freed in between is not missed
+            self._freed.clear()
+            try:
+                return self.submit_all(jobs, self.background_limit)
+            except RenderPoolSaturated:
+                await self._freed.wait()
+
+    async def run(self, fn: Callable, *args):
+        return await self.submit(fn, *args)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+pdf_render_pool = PdfRenderPool(PDF_EXECUTOR, PDF_WORKERS, PDF_QUEUE_LIMIT, PDF_JOB_TIMEOUT, PDF_DOWNLOAD_RESERVE)
+
+
+def render_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="PDF-Generierung ausgelastet, bitte später erneut versuchen",
+        headers={"Retry-After": str(PDF_RETRY_AFTER)},
+    )
+
+
+# ============ RENDERED PDF CACHE ============
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PDF_CACHE_DIR = Path(os.environ["PDF_CACHE_DIR"]) if os.environ.get("PDF_CACHE_DIR") else None
+
+
+def render_date() -> str:
+    """The renderers print today's date, so a rendered document is only valid for one day"""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class RenderedPdfCache:
+    """Rendered documents keyed by order, document type, template version and date.
+
+    Orders never change after creation, so a key can be reused for as long as
+    the template and the date stay the same. The in-process tier is an LRU
+    bounded by total size; the optional disk tier survives restarts and is
+    shared by all uvicorn workers.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[Path] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(order_id: str, pdf_type: str, flatten: bool = False) -> str:
+        doc_types = list(PDF_DOCUMENTS) if pdf_type == "all" else [pdf_type]
+        versions = ",".join(pdf_templates.version(t) for t in doc_types)
+        raw = f"{order_id}:{pdf_type}:{versions}:{render_date()}"
+        if flatten:
+            raw += ":flat"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.hits += 1
+                self._remember(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / render_date() / f"{key}.pdf"
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            return self._disk_path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Entries of past days can never be hit again
+            for old in self.directory.iterdir():
+                if old.is_dir() and old.name < path.parent.name:
+                    shutil.rmtree(old, ignore_errors=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "directory": str(self.directory) if self.directory else None,
+        }
+
+
+pdf_cache = RenderedPdfCache(PDF_CACHE_MAX_BYTES, PDF_CACHE_DIR)
+
+
+async def load_order_documents(order_id: str, doc_types: List[str]) -> Dict[str, bytes]:
+    """Documents persisted by the pre-render pipeline for the current template versions and today's date"""
+    found = {}
+    today = render_date()
+    cursor = db.order_documents.find(
+        {"order_id": order_id, "doc_type": {"$in": doc_types}},
+        {"_id": 0, "doc_type": 1, "template_version": 1, "render_date": 1, "data": 1},
+    )
+    async for doc in cursor:
+        # Documents of earlier days print an outdated date (and Versorgungsbeginn)
+        if doc["template_version"] == pdf_templates.version(doc["doc_type"]) and doc.get("render_date") == today:
+            found[doc["doc_type"]] = doc["data"]
+    return found
+
+
+async def store_order_document(order_id: str, doc_type: str, data: bytes, rendered_on: str):
+    await db.order_documents.update_one(
+        {"order_id": order_id, "doc_type": doc_type},
+        {"$set": {
+            "template_version": pdf_templates.version(doc_type),
+            "render_date": rendered_on,
+            "data": data,
+            "rendered_at": datetime.now(timezone.utc).isoformat(),
+        }},
+        upsert=True,
+    )
+
+
+async def render_order_documents(
+    order: Order, doc_types: List[str], signatures_loaded: bool = True, flatten: bool = False, background: bool = False,
+) -> List["asyncio.Future[bytes]"]:
+    """Futures for the rendered documents.
+
+    Lookup order: rendered cache, documents persisted at order creation
+    (on the same day), and only then a new render in the pool. Pass ``signatures_loaded=False``
+    for orders read with ORDER_PDF_PROJECTION. Only fillable documents are
+    persisted, flattened ones come from the cache or a new render.
+    ``background`` jobs wait for a free slot instead of raising
+    RenderPoolSaturated, see PdfRenderPool.submit_background.
+    """
+    loop = asyncio.get_running_loop()
+    results: Dict[str, asyncio.Future] = {}
+    missing = []
+    for doc_type in doc_types:
+        key = pdf_cache.key(order.id, doc_type, flatten)
+        data = await pdf_cache.get(key)
+        if data is not None:
+            PDF_DOCUMENTS_SERVED.inc(doc_type, "cache")
+            results[doc_type] = loop.create_future()
+            results[doc_type].set_result(data)
+        else:
+            missing.append((doc_type, key))
+
+    if missing and not flatten:
+        persisted = await load_order_documents(order.id, [doc_type for doc_type, _ in missing])
+        for doc_type, key in missing:
+            if doc_type in persisted:
+                PDF_DOCUMENTS_SERVED.inc(doc_type, "stored")
+                await pdf_cache.put(key, persisted[doc_type])
+                results[doc_type] = loop.create_future()
+                results[doc_type].set_result(persisted[doc_type])
+        missing = [(doc_type, key) for doc_type, key in missing if doc_type not in persisted]
+
+    async def store(doc_type: str, key: str, future: "asyncio.Future[bytes]") -> bytes:
+        data, report = await future
+        record_render_report(doc_type, report)
+        PDF_DOCUMENTS_SERVED.inc(doc_type, "rendered")
+        await pdf_cache.put(key, data)
+        return data
+
+    if missing and not signatures_loaded:
+        order = await load_signatures(order, [doc_type for doc_type, _ in missing])
+    jobs = [(render_document, doc_type, order, flatten) for doc_type, _ in missing]
+    futures = await pdf_render_pool.submit_background(jobs) if background else pdf_render_pool.submit_all(jobs)
+    for (doc_type, key), future in zip(missing, futures):
+        results[doc_type] = asyncio.ensure_future(store(doc_type, key, future))
+    return [results[doc_type] for doc_type in doc_types]
+
+
+# ============ PRE-RENDERING ============
+PRERENDER_ATTEMPTS = int(os.environ.get("PRERENDER_ATTEMPTS", 4))
+PRERENDER_BACKOFF = float(os.environ.get("PRERENDER_BACKOFF", 2.0))
+
+
+async def prerender_order(order: Order):
+    """Render and persist an order's documents right after it was stored.
+
+    Failed attempts (including a saturated render pool) are retried with
+    exponential backoff; the outcome is recorded in the order's pdf_status.
+    """
+    doc_types = order_document_types(order)
+    for attempt in range(1, PRERENDER_ATTEMPTS + 1):
+        try:
+            # Taken before rendering, like the cache key
+            rendered_on = render_date()
+            futures = await render_order_documents(order, doc_types)
+            documents = await asyncio.gather(*futures)
+            for doc_type, data in zip(doc_types, documents):
+                await store_order_document(order.id, doc_type, data, rendered_on)
+            await db.orders.update_one({"id": order.id}, {"$set": {"pdf_status": "rendered"}})
+            return
+        except Exception as e:
+            logger.warning(f"Pre-rendering order {order.id} failed (attempt {attempt}/{PRERENDER_ATTEMPTS}): {e!r}")
+            PRERENDER_FAILURES.inc()
+            if attempt < PRERENDER_ATTEMPTS:
+                await asyncio.sleep(PRERENDER_BACKOFF * 2 ** (attempt - 1))
+    await db.orders.update_one({"id": order.id}, {"$set": {"pdf_status": "failed"}})
+
+
+# ============ ZIP BUNDLES ============
+# PDFs barely compress, so "stored" is a reasonable choice for large bundles
+PDF_ZIP_COMPRESSION = os.environ.get("PDF_ZIP_COMPRESSION", "deflated")  # "deflated" or "stored"
+PDF_ZIP_LEVEL = int(os.environ["PDF_ZIP_LEVEL"]) if os.environ.get("PDF_ZIP_LEVEL") else None
+ZIP_METHODS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+
+class ZipChunkSink:
+    """Write-only file object that hands out what zipfile wrote so far.
+
+    It has no seek(), so zipfile writes data descriptors instead of patching
+    local headers and the archive can be sent while it is being built.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(entries: List[Tuple[str, "asyncio.Future[bytes]"]]) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive entry by entry while the remaining documents still render.
+
+    Entries keep the given order and carry the render date instead of the
+    current time, so the same documents always give the same bytes (the
+    response has a strong ETag).
+    """
+    date_time = datetime.strptime(render_date(), "%Y-%m-%d").timetuple()[:6]
+    sink = ZipChunkSink()
+    try:
+        with zipfile.ZipFile(sink, "w", ZIP_METHODS[PDF_ZIP_COMPRESSION], compresslevel=PDF_ZIP_LEVEL) as zip_file:
+            for name, future in entries:
+                data = await future
+                info = zipfile.ZipInfo(name, date_time)
+                info.external_attr = 0o600 << 16  # what writestr gives a plain name
+                # Deflating a few hundred KB is noticeable on the event loop
+                with timed("all", "zip"):
+                    await asyncio.to_thread(
+                        zip_file.writestr, info, data,
+                        compress_type=zip_file.compression, compresslevel=zip_file.compresslevel,
+                    )
+                yield sink.drain()
+        yield sink.drain()
+    except Exception as e:
+        logger.error(f"ZIP bundle failed: {e}")
+        raise
+    finally:
+        for _, future in entries:
+            future.cancel()
+
+
+# ============ BATCH EXPORT ============
+EXPORT_DIR = Path(os.environ.get("EXPORT_DIR", ROOT_DIR / "exports"))
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", PDF_WORKERS * 2))
+EXPORT_FORMATS = ("zip", "merged")
+EXPORT_UNFINISHED = ["pending", "running"]
+# Documents per merged PDF: the merging writer holds all of their pages in memory
+EXPORT_MERGE_MAX_DOCUMENTS = int(os.environ.get("EXPORT_MERGE_MAX_DOCUMENTS", 200))
+EXPORT_LEASE = float(os.environ.get("EXPORT_LEASE", 60))  # a job not renewed for longer was abandoned by its process
+
+
+class ExportRequest(BaseModel):
+    date_from: Optional[str] = None  # YYYY-MM-DD, inclusive
+    date_to: Optional[str] = None  # YYYY-MM-DD, inclusive
+    krankenkasse: Optional[str] = None
+    doc_types: List[str] = ["main"]
+    # "zip": one PDF per document, "merged": one PDF per Pflegekasse (or several, see EXPORT_MERGE_MAX_DOCUMENTS)
+    format: str = "zip"
+    flatten: bool = False  # burn the field values into the pages, without AcroForm
+
+class ExportJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    params: ExportRequest
+    status: str = "pending"  # pending, running, done, failed
+    total: int = 0
+    processed: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: Optional[str] = None
+    # Renewed while a process works on the job; a new job belongs to the process that created it
+    lease_until: Optional[str] = Field(default_factory=lambda: utc_timestamp(EXPORT_LEASE))
+
+
+def safe_filename(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_. " else "_" for c in name).strip() or "_"
+
+
+def export_query(params: ExportRequest) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    created: Dict[str, str] = {}
+    if params.date_from:
+        created["$gte"] = date.fromisoformat(params.date_from).isoformat()
+    if params.date_to:
+        # created_at is an ISO string, so the next day is an exclusive upper bound
+        created["$lt"] = (date.fromisoformat(params.date_to) + timedelta(days=1)).isoformat()
+    if created:
+        query["created_at"] = created
+    if params.krankenkasse:
+        query["insurance.krankenkasse"] = params.krankenkasse
+    return query
+
+
+def write_file_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+async def update_export_job(job: ExportJob, **changes):
+    for name, value in changes.items():
+        setattr(job, name, value)
+    job.updated_at = datetime.now(timezone.utc).isoformat()
+    await db.export_jobs.update_one({"id": job.id}, {"$set": {**changes, "updated_at": job.updated_at}})
+
+
+async def render_for_export(order: Order, doc_types: List[str], flatten: bool = False) -> List[bytes]:
+    """Render through the shared pool as a background job, leaving the reserved slots to downloads"""
+    futures = await render_order_documents(order, doc_types, signatures_loaded=False, flatten=flatten, background=True)
+    return await asyncio.gather(*futures)
+
+
+async def run_export_job(job_id: str, progress: Optional[Callable[[ExportJob], None]] = None) -> ExportJob:
+    """Render all selected orders into the job's workspace and bundle them.
+
+    Every document is written to its own file as soon as it is rendered, so
+    memory stays bounded by EXPORT_CONCURRENCY orders. A resumed job skips
+    the files that already exist. The job's lease is renewed while it runs,
+    so a job left behind by a stopped process can be told apart.
+    """
+    job = ExportJob(**await db.export_jobs.find_one({"id": job_id}, {"_id": 0}))
+    workspace = EXPORT_DIR / job.id
+    query = export_query(job.params)
+    await update_export_job(
+        job, status="running", error=None, processed=0, failed=0,
+        total=await db.orders.count_documents(query), lease_until=utc_timestamp(EXPORT_LEASE),
+    )
+    semaphore = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(EXPORT_LEASE / 3)
+            with contextlib.suppress(PyMongoError):  # retried on the next beat, the lease has room for it
+                await db.export_jobs.update_one({"id": job.id}, {"$set": {"lease_until": utc_timestamp(EXPORT_LEASE)}})
+
+    async def export_order(order_doc: Dict[str, Any]):
+        try:
+            order = stored_order(order_doc)
+            kasse_dir = workspace / safe_filename(order.insurance.krankenkasse)
+            nachname = safe_filename(order.customer.nachname)
+            targets = [
+                (doc_type, kasse_dir / f"{PDF_DOCUMENTS[doc_type][1]}_{nachname}_{order.id}.pdf")
+                for doc_type in job.params.doc_types
+                if doc_type in order_document_types(order)
+            ]
+            missing = [(doc_type, path) for doc_type, path in targets if not path.exists()]
+            if missing:
+                documents = await render_for_export(order, [doc_type for doc_type, _ in missing], job.params.flatten)
+                for (_, path), data in zip(missing, documents):
+                    await asyncio.to_thread(write_file_atomic, path, data)
+        except Exception as e:
+            job.failed += 1
+            logger.warning(f"Export {job.id}: order {order_doc.get('id')} failed: {e!r}")
+        finally:
+            job.processed += 1
+            semaphore.release()
+            if progress:
+                progress(job)
+
+    heartbeat = asyncio.create_task(renew_lease())
+    tasks = set()
+    try:
+        last_update = time.monotonic()
+        cursor = db.orders.find(query, ORDER_PDF_PROJECTION).sort([("created_at", ASCENDING), ("id", ASCENDING)])
+        async for order_doc in cursor.batch_size(100):
+            await semaphore.acquire()
+            task = asyncio.create_task(export_order(order_doc))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if time.monotonic() - last_update > 1:
+                last_update = time.monotonic()
+                await update_export_job(job, processed=job.processed, failed=job.failed)
+        if tasks:
+            await asyncio.gather(*tasks)
+        await update_export_job(job, processed=job.processed, failed=job.failed)
+        await asyncio.to_thread(assemble_export, job, workspace)
+        await update_export_job(job, status="done", lease_until=None)
+    except asyncio.CancelledError:
+        # Stopped with the process: the job stays "running" and is picked up again at the next start
+        for task in tasks:
+            task.cancel()
+        with contextlib.suppress(PyMongoError):
+            await update_export_job(job, lease_until=None)
+        raise
+    except Exception as e:
+        logger.error(f"Export {job.id} failed: {e!r}")
+        await update_export_job(job, status="failed", error=str(e), lease_until=None)
+    finally:
+        heartbeat.cancel()
+    return job
+
+
+async def claim_export_job(job_id: str, **conditions) -> Optional[Dict[str, Any]]:
+    """Take the lease of a job that no task works on; None if it is held or the job does not exist"""
+    job = await db.export_jobs.find_one_and_update(
+        {"id": job_id, **conditions, "$or": [{"lease_until": None}, {"lease_until": {"$lt": utc_timestamp()}}]},
+        {"$set": {"lease_until": utc_timestamp(EXPORT_LEASE)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job:
+        job.pop("_id", None)
+    return job
+
+
+async def recover_export_jobs():
+    """Continue the exports a stopped process left pending or running.
+
+    A job whose lease is still valid may belong to another instance, so it
+    is only taken over once nobody renewed the lease for EXPORT_LEASE seconds.
+    """
+    waiting = [job["id"] async for job in db.export_jobs.find({"status": {"$in": EXPORT_UNFINISHED}}, {"id": 1})]
+    while waiting:
+        for job_id in list(waiting):
+            if await claim_export_job(job_id, status={"$in": EXPORT_UNFINISHED}):
+                logger.info(f"Export {job_id}: resuming after restart")
+                start_export_job(job_id)
+                waiting.remove(job_id)
+            elif not await db.export_jobs.count_documents({"id": job_id, "status": {"$in": EXPORT_UNFINISHED}}):
+                waiting.remove(job_id)  # finished by its owner
+        if waiting:
+            await asyncio.sleep(EXPORT_LEASE / 2)
+
+
+def export_archive_path(job_id: str) -> Path:
+    return EXPORT_DIR / f"{job_id}.zip"
+
+
+def assemble_export(job: ExportJob, workspace: Path):
+    """Bundle the rendered files.
+
+    "merged" concatenates the documents of each Pflegekasse; more than
+    EXPORT_MERGE_MAX_DOCUMENTS are split into numbered parts, each written
+    to the archive before the next one is merged.
+    """
+    target = export_archive_path(job.id)
+    tmp = target.with_suffix(".tmp")
+    kasse_dirs = sorted(p for p in workspace.iterdir() if p.is_dir()) if workspace.exists() else []
+    with zipfile.ZipFile(tmp, "w", ZIP_METHODS[PDF_ZIP_COMPRESSION], compresslevel=PDF_ZIP_LEVEL) as zip_file:
+        for kasse_dir in kasse_dirs:
+            files = sorted(kasse_dir.glob("*.pdf"))
+            if job.params.format == "merged":
+                size = EXPORT_MERGE_MAX_DOCUMENTS
+                parts = [files[i:i + size] for i in range(0, len(files), size)]
+                for number, part in enumerate(parts, 1):
+                    merged = PdfWriter()
+                    for path in part:
+                        merged.append(str(path))
+                    name = kasse_dir.name if len(parts) == 1 else f"{kasse_dir.name}_{number:03d}"
+                    zip_file.writestr(f"{name}.pdf", write_pdf(merged))
+            else:
+                for path in files:
+                    zip_file.write(path, f"{kasse_dir.name}/{path.name}")
+    os.replace(tmp, target)
+
+
+def start_export_job(job_id: str):
+    start_export_task(run_export_job(job_id), job_id)
+
+
+def start_export_task(coro: Awaitable, name: str):
+    task = asyncio.create_task(coro, name=name)
+    # Keep a reference, the event loop only holds weak ones
+    export_tasks.add(task)
+    task.add_done_callback(export_tasks.discard)
+
+
+export_tasks: set = set()
+
+
+# ============ ORDER EMAIL ============
+# Same variable names the former Node mail API (server.js) read from .env
+SMTP_HOST = os.environ.get("SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASS = os.environ.get("SMTP_PASS", "")
+SMTP_SECURE = os.environ.get("SMTP_SECURE", "").lower() == "true"  # implicit TLS; otherwise STARTTLS when offered
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 30))
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 2))
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", 60))  # servers drop idle sessions after a few minutes
+SMTP_RATE_LIMIT = float(os.environ.get("SMTP_RATE_LIMIT", 30))  # messages per minute and process, 0 = unlimited
+FROM_EMAIL = os.environ.get("FROM_EMAIL", SMTP_USER)
+ORDER_EMAIL_TO = os.environ.get("ORDER_EMAIL_TO", "kontakt@pb-marina.de")
+ORDER_EMAIL_ON_CREATE = os.environ.get("ORDER_EMAIL_ON_CREATE", "false").lower() == "true"
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BASE = float(os.environ.get("OUTBOX_RETRY_BASE", 30))
+OUTBOX_RETRY_MAX = float(os.environ.get("OUTBOX_RETRY_MAX", 3600))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 10))
+OUTBOX_LEASE = float(os.environ.get("OUTBOX_LEASE", 300))  # a message "sending" for longer was abandoned by its worker
+
+# Attachment order and names in the message text, as the Konfigurator sent them
+EMAIL_DOCUMENT_TITLES = {"bestellung": "Bestellformular", "main": "Anlage 2", "wechsel": "Wechselerklärung"}
+ORDER_EMAIL_PROJECTION = {**ORDER_PDF_PROJECTION, "insurance.telefon": 1, "insurance.email": 1}
+
+
+class EmailRequest(BaseModel):
+    doc_types: Optional[List[str]] = None  # default: all documents of the order
+    flatten: bool = False
+
+class OutboxMessage(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    order_id: str
+    to: str
+    subject: str
+    text: str
+    doc_types: List[str]
+    flatten: bool = False
+    status: str = "pending"  # pending, sending, sent, failed
+    attempts: int = 0
+    next_attempt_at: str = Field(default_factory=utc_timestamp)
+    lease_until: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: str = Field(default_factory=utc_timestamp)
+    sent_at: Optional[str] = None
+
+
+class MessageUndeliverable(Exception):
+    """Retrying cannot help, e.g. the order no longer exists"""
+
+
+def order_email(order: Order, doc_types: List[str]) -> Tuple[str, str]:
+    """Subject and text of the order notification"""
+    customer, insurance = order.customer, order.insurance
+    name = f"{customer.vorname.strip()} {customer.nachname.strip()}".strip()
+    forms = " + ".join(title for doc_type, title in EMAIL_DOCUMENT_TITLES.items() if doc_type in doc_types)
+    text = (
+        "Neue Bestellung aus dem Konfigurator.\n\n"
+        f"Kunde: {name}\n"
+        f"Adresse: {customer.strasse} {customer.hausnr}, {customer.plz} {customer.stadt}\n"
+        f"Telefon: {insurance.telefon or ''}\n"
+        f"E-Mail: {insurance.email or ''}\n"
+        f"Bestellnummer: {order.id}\n\n"
+        f"Enthaltene Formulare: {forms}\n\n"
+        "(Automatisch gesendet)"
+    )
+    return f"Bestellung Pflegehilfsmittel – {name}", text
+
+
+def build_email(message: OutboxMessage, attachments: List[Tuple[str, bytes]]) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = FROM_EMAIL
+    email["To"] = message.to
+    email["Subject"] = message.subject
+    email["Date"] = formatdate(localtime=True)
+    # Stable across retries, so a receiver can drop a duplicate of an unconfirmed delivery
+    email["Message-ID"] = f"<{message.id}@{FROM_EMAIL.rpartition('@')[2] or 'localhost'}>"
+    email.set_content(message.text)
+    for filename, data in attachments:
+        email.add_attachment(data, maintype="application", subtype="pdf", filename=filename)
+    return email
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """5xx replies reject this message for good; everything else may pass on a later attempt"""
+    import aiosmtplib
+
+    if isinstance(error, MessageUndeliverable):
+        return True
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(refused.code >= 500 for refused in error.recipients)
+    # A rejected login is a configuration problem; keep the message until it is fixed
+    if (
+        isinstance(error, aiosmtplib.SMTPResponseException)
+        and not isinstance(error, aiosmtplib.SMTPAuthenticationError)
+    ):
+        return error.code >= 500
+    return False
+
+
+class RateLimiter:
+    """Spaces out acquisitions to ``per_minute``, allowing bursts of ``burst``"""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60 / per_minute if per_minute > 0 else 0.0
+        self.burst = burst
+        self._next = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        # Reserve the slot before sleeping, so concurrent callers queue up behind it
+        start = max(self._next, now - (self.burst - 1) * self.interval)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class SmtpPool:
+    """Persistent SMTP sessions shared by the outbox workers.
+
+    A session carries on with the next message until it has been idle for
+    SMTP_IDLE_TIMEOUT; one that failed in any way is closed, never reused.
+    """
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self._idle: List[Tuple[Any, float]] = []  # (session, last used), most recent last
+        self._slots = asyncio.Semaphore(size)
 
+    async def _connect(self):
+        import aiosmtplib
 
-def generate_wechsel_pdf(order: Order) -> bytes:
-    """Generate the switch declaration (wechsel.pdf) with filled fields"""
-    reader = PdfReader(str(PDF_WECHSEL))
-    writer = PdfWriter()
-    
-    # Clone document to preserve form fields
-    writer.clone_document_from_reader(reader)
-    
-    customer = order.customer
-    insurance = order.insurance
-    today = datetime.now()
-    
-    # Calculate next month for Versorgungsbeginn
-    next_month = today.replace(day=1)
-    if today.month == 12:
-        next_month = next_month.replace(year=today.year + 1, month=1)
-    else:
-        next_month = next_month.replace(month=today.month + 1)
-    
-    field_values = {
-        "txt_name": customer.nachname,
-        "txt_vorname": customer.vorname,
-        "txt_geburtsdatum": customer.geburtsdatum,
-        "txt_versichertennummer": insurance.versichertennummer,
-        "txt_pflegekasse": insurance.krankenkasse,
-        "txt_versorgungsbeginn_ab": next_month.strftime("%d.%m.%Y"),
-        "txt_ort_datum": f"{customer.stadt}, {today.strftime('%d.%m.%Y')}",
+        smtp = aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            username=SMTP_USER or None,
+            password=SMTP_PASS or None,
+            use_tls=SMTP_SECURE,
+            timeout=SMTP_TIMEOUT,
+        )
+        await smtp.connect()  # includes EHLO, STARTTLS and login
+        self.opened += 1
+        return smtp
+
+    def _checkout(self):
+        while self._idle:
+            smtp, last_used = self._idle.pop()
+            if smtp.is_connected and time.monotonic() - last_used < self.idle_timeout:
+                return smtp
+            smtp.close()
+        return None
+
+    async def send(self, email: EmailMessage):
+        import aiosmtplib
+
+        async with self._slots:
+            smtp = self._checkout()
+            try:
+                if smtp is not None:
+                    try:
+                        await smtp.send_message(email)
+                    except aiosmtplib.SMTPServerDisconnected:
+                        # The server ended the idle session before our timeout did
+                        smtp.close()
+                        smtp = None
+                if smtp is None:
+                    smtp = await self._connect()
+                    await smtp.send_message(email)
+            except BaseException:
+                if smtp is not None:
+                    smtp.close()
+                raise
+            self._idle.append((smtp, time.monotonic()))
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(smtp.quit(), 5)
+            smtp.close()
+
+
+class EmailOutbox:
+    """Delivers the messages queued in db.email_outbox.
+
+    Workers claim a message with an atomic update, so several API processes
+    can deliver side by side. Failed attempts are retried with exponential
+    backoff until OUTBOX_MAX_ATTEMPTS; attachments are rendered (or taken
+    from the caches) at delivery time and never stored in the outbox.
+    """
+
+    def __init__(self):
+        self.pool = SmtpPool(SMTP_POOL_SIZE, SMTP_IDLE_TIMEOUT)
+        self.limiter = RateLimiter(SMTP_RATE_LIMIT, burst=SMTP_POOL_SIZE)
+        self._wake = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def configured(self) -> bool:
+        return bool(SMTP_HOST and FROM_EMAIL)
+
+    async def start(self):
+        if not self.configured:
+            logger.info("SMTP_HOST/FROM_EMAIL not set, order emails are disabled")
+            return
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"email-outbox-{n}") for n in range(SMTP_POOL_SIZE)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.pool.close()
+
+    async def enqueue(self, message: OutboxMessage):
+        await db.email_outbox.insert_one(message.model_dump())
+        self._wake.set()
+
+    async def _claim(self) -> Optional[OutboxMessage]:
+        now = utc_timestamp()
+        doc = await db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "sending", "lease_until": utc_timestamp(OUTBOX_LEASE)}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return OutboxMessage(**doc) if doc else None
+
+    async def _work(self):
+        while True:
+            # Cleared before looking, so an enqueue during the lookup is not missed
+            self._wake.clear()
+            try:
+                message = await self._claim()
+                if message is not None:
+                    await self.deliver(message)
+                    continue
+            except Exception as e:
+                # A claimed message is picked up again once its lease ran out
+                logger.error(f"Email outbox worker: {e!r}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+
+    async def _attachments(self, message: OutboxMessage) -> List[Tuple[str, bytes]]:
+        order_doc = await db.orders.find_one({"id": message.order_id}, ORDER_PDF_PROJECTION)
+        if not order_doc:
+            raise MessageUndeliverable(f"order {message.order_id} not found")
+        order = stored_order(order_doc)
+        documents = await render_for_export(order, message.doc_types, message.flatten)
+        return [
+            (f"{PDF_DOCUMENTS[doc_type][1]}_{safe_filename(order.customer.nachname)}_{order.id[:8]}.pdf", data)
+            for doc_type, data in zip(message.doc_types, documents)
+        ]
+
+    async def deliver(self, message: OutboxMessage):
+        try:
+            email = build_email(message, await self._attachments(message))
+            await self.limiter.acquire()
+            await self.pool.send(email)
+        except Exception as e:
+            permanent = is_permanent_failure(e) or message.attempts >= OUTBOX_MAX_ATTEMPTS
+            logger.warning(
+                f"Email {message.id} for order {message.order_id} failed "
+                f"(attempt {message.attempts}/{OUTBOX_MAX_ATTEMPTS}{', giving up' if permanent else ''}): {e!r}"
+            )
+            ORDER_EMAILS.inc("failed" if permanent else "retry")
+            delay = min(OUTBOX_RETRY_BASE * 2 ** (message.attempts - 1), OUTBOX_RETRY_MAX)
+            await db.email_outbox.update_one({"id": message.id}, {"$set": {
+                "status": "failed" if permanent else "pending",
+                "next_attempt_at": utc_timestamp(delay),
+                "lease_until": None,
+                "last_error": repr(e)[:500],
+            }})
+            return
+        ORDER_EMAILS.inc("sent")
+        await db.email_outbox.update_one({"id": message.id}, {"$set": {
+            "status": "sent", "sent_at": utc_timestamp(), "lease_until": None, "last_error": None,
+        }})
+
+
+async def queue_order_email(
+    order: Order, doc_types: Optional[List[str]] = None, flatten: bool = False,
+) -> OutboxMessage:
+    """Queue the order notification to ORDER_EMAIL_TO; an undelivered one for the order is reused"""
+    doc_types = sorted(doc_types or order_document_types(order), key=list(EMAIL_DOCUMENT_TITLES).index)
+    queued = await db.email_outbox.find_one(
+        {"order_id": order.id, "status": {"$in": ["pending", "sending"]}}, {"_id": 0},
+    )
+    if queued:
+        return OutboxMessage(**queued)
+    subject, text = order_email(order, doc_types)
+    message = OutboxMessage(
+        order_id=order.id, to=ORDER_EMAIL_TO, subject=subject, text=text, doc_types=doc_types, flatten=flatten,
+    )
+    await email_outbox.enqueue(message)
+    return message
+
+
+email_outbox = EmailOutbox()
+
+
+# ============ ORDER INTAKE ============
+BULK_MAX_ORDERS = int(os.environ.get("BULK_MAX_ORDERS", 1000))
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 200))
+
+
+class OrderRejected(Exception):
+    """An order failed the budget, consent or signature checks; the message is the HTTP detail"""
+
+
+def check_order(order_data: OrderCreate, catalog: Catalog) -> int:
+    """Budget, consent and signature presence checks; returns the total in cents"""
+    # In cents, so 42.00 is never rejected because of float rounding
+    total_cents = catalog.total_cents(order_data.products)
+    if total_cents > catalog.budget_limit_cents:
+        raise OrderRejected(f"Budget überschritten: {total_cents / 100}€ > {catalog.budget_limit_cents / 100}€")
+    if not order_data.insurance.consent1 or not order_data.insurance.consent2:
+        raise OrderRejected("Beide Einverständniserklärungen müssen akzeptiert werden")
+    if not order_data.insurance.signature_insured:
+        raise OrderRejected("Unterschrift erforderlich")
+    return total_cents
+
+
+def normalize_order_signatures(insurance: InsuranceInfo) -> Dict[str, bytes]:
+    try:
+        return {
+            field: normalize_signature(getattr(insurance, field))
+            for field in SIGNATURE_FIELDS if getattr(insurance, field)
+        }
+    except InvalidSignature as e:
+        raise OrderRejected(f"Ungültige Unterschrift: {e}")
+
+
+def build_order(
+    order_data: OrderCreate, total_cents: int, signatures: Dict[str, bytes],
+    client_key: Optional[str] = None, order_id: Optional[str] = None,
+) -> Order:
+    """The order as stored: signatures replaced by their content hash references"""
+    return Order(
+        id=order_id or str(uuid.uuid4()),
+        products=order_data.products,
+        customer=order_data.customer,
+        insurance=order_data.insurance.model_copy(update={f: signature_ref(png) for f, png in signatures.items()}),
+        extra_washable=order_data.extra_washable,
+        total=total_cents / 100,
+        pdf_status="pending",
+        client_key=client_key,
+    )
+
+
+def order_document(order: Order) -> Dict[str, Any]:
+    doc = order.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    if doc['client_key'] is None:
+        del doc['client_key']  # keeps the order out of the sparse unique index
+    return doc
+
+
+def with_inline_signatures(order: Order, signatures: Dict[str, bytes]) -> Order:
+    """Copy for pre-rendering, so the renderer does not read the signatures back from Mongo"""
+    inline = {field: signature_data_url(png) for field, png in signatures.items()}
+    return order.model_copy(update={"insurance": order.insurance.model_copy(update=inline)})
+
+
+async def place_order(order_data: OrderCreate, order_id: Optional[str] = None) -> Tuple[Order, Dict[str, bytes]]:
+    """Validate and store one order; returns it with its normalized signatures"""
+    try:
+        total_cents = check_order(order_data, catalog_store.current())
+        # Normalize the signatures once; the order only keeps content hash references
+        signatures = await asyncio.to_thread(normalize_order_signatures, order_data.insurance)
+    except OrderRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for png in signatures.values():
+        await store_signature(png)
+
+    # Save to database
+    order = build_order(order_data, total_cents, signatures, order_id=order_id)
+    doc = order_document(order)
+    await db.orders.insert_one(doc)
+    await record_order_stats([doc])
+    return order, signatures
+
+
+async def prerender_orders(orders: List[Order]):
+    """Pre-render a batch one order at a time so it does not crowd out interactive downloads"""
+    for order in orders:
+        await prerender_order(order)
+
+
+class BulkOrderItem(OrderCreate):
+    client_key: Optional[str] = None  # the partner's row ID; resending it returns the existing order
+
+
+class BulkOrderResult(BaseModel):
+    index: int
+    status: str  # created, duplicate, rejected
+    id: Optional[str] = None
+    client_key: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class BulkOrderResponse(BaseModel):
+    created: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    results: List[BulkOrderResult] = []
+
+
+def validation_detail(e: ValidationError) -> str:
+    errors = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()[:3]]
+    return "Ungültige Daten: " + "; ".join(errors)
+
+
+async def read_bulk_rows(request: Request) -> List[Any]:
+    """Rows of a JSON array or an NDJSON stream; unparsable NDJSON lines become ValueErrors"""
+    def too_many():
+        return HTTPException(status_code=413, detail=f"Zu viele Bestellungen (höchstens {BULK_MAX_ORDERS})")
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        rows, buffer = [], b""
+
+        def parse(line: bytes):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    rows.append(ValueError(f"Ungültiges JSON: {e}"))
+                if len(rows) > BULK_MAX_ORDERS:
+                    raise too_many()
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                parse(line)
+        parse(buffer)
+        return rows
+
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiges JSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Liste von Bestellungen erwartet")
+    if len(rows) > BULK_MAX_ORDERS:
+        raise too_many()
+    return rows
+
+
+async def insert_orders(docs: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """Unordered insert_many in chunks; returns the write error per index into docs"""
+    errors = {}
+    for start in range(0, len(docs), BULK_CHUNK_SIZE):
+        try:
+            await db.orders.insert_many(docs[start:start + BULK_CHUNK_SIZE], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                errors[start + error["index"]] = error
+    return errors
+
+
+async def create_orders(rows: List[Any], key_prefix: Optional[str] = None) -> Tuple[BulkOrderResponse, List[Order]]:
+    """Validate, deduplicate and store a batch of orders; returns the per-row results and the orders to pre-render"""
+    results = [BulkOrderResult(index=i, status="rejected") for i in range(len(rows))]
+    catalog = catalog_store.current()
+    accepted: List[Tuple[int, BulkOrderItem, int]] = []
+    for i, row in enumerate(rows):
+        try:
+            if isinstance(row, Exception):
+                raise OrderRejected(str(row))
+            item = BulkOrderItem.model_validate(row)
+            if item.client_key is None and key_prefix:
+                item.client_key = f"{key_prefix}:{i}"
+            results[i].client_key = item.client_key
+            accepted.append((i, item, check_order(item, catalog)))
+        except ValidationError as e:
+            results[i].detail = validation_detail(e)
+        except OrderRejected as e:
+            results[i].detail = str(e)
+
+    # Keys seen before (in an earlier batch or earlier in this one) resolve to the existing order
+    keys = [item.client_key for _, item, _ in accepted if item.client_key]
+    existing = {}
+    if keys:
+        async for doc in db.orders.find({"client_key": {"$in": keys}}, {"_id": 0, "id": 1, "client_key": 1}):
+            existing[doc["client_key"]] = doc["id"]
+    fresh, first_index = [], {}
+    for i, item, total_cents in accepted:
+        if item.client_key in existing:
+            results[i].status, results[i].id = "duplicate", existing[item.client_key]
+        elif item.client_key and item.client_key in first_index:
+            results[i].status = "duplicate"
+            results[i].detail = f"Gleicher client_key wie Zeile {first_index[item.client_key]}"
+        else:
+            if item.client_key:
+                first_index[item.client_key] = i
+            fresh.append((i, item, total_cents))
+
+    def normalize_all():
+        normalized = []
+        for i, item, total_cents in fresh:
+            try:
+                normalized.append((i, item, total_cents, normalize_order_signatures(item.insurance)))
+            except OrderRejected as e:
+                results[i].detail = str(e)
+        return normalized
+
+    normalized = await asyncio.to_thread(normalize_all)
+    signatures = {signature_ref(png): png for *_, sigs in normalized for png in sigs.values()}
+    if signatures:
+        now = datetime.now(timezone.utc).isoformat()
+        await db.signatures.bulk_write([
+            UpdateOne({"_id": ref}, {"$setOnInsert": {"data": png, "created_at": now}}, upsert=True)
+            for ref, png in signatures.items()
+        ], ordered=False)
+
+    orders = [
+        (i, build_order(item, total_cents, sigs, item.client_key), sigs)
+        for i, item, total_cents, sigs in normalized
+    ]
+    docs = [order_document(order) for _, order, _ in orders]
+    errors = await insert_orders(docs)
+    created = []
+    for position, (i, order, sigs) in enumerate(orders):
+        error = errors.get(position)
+        if error is None:
+            results[i].status, results[i].id = "created", order.id
+            created.append(with_inline_signatures(order, sigs))
+        elif error.get("code") == 11000 and order.client_key:
+            # A concurrent retry of the same batch stored it first
+            doc = await db.orders.find_one({"client_key": order.client_key}, {"_id": 0, "id": 1})
+            results[i].status, results[i].id = "duplicate", doc["id"] if doc else None
+        else:
+            results[i].detail = f"Speichern fehlgeschlagen: {error.get('errmsg')}"
+    await record_order_stats([doc for position, doc in enumerate(docs) if position not in errors])
+
+    response = BulkOrderResponse(results=results)
+    for result in results:
+        if result.status == "created":
+            response.created += 1
+        elif result.status == "duplicate":
+            response.duplicates += 1
+        else:
+            response.rejected += 1
+    return response, created
+
+
+# ============ IDEMPOTENCY ============
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", 10))
+IDEMPOTENCY_STALE = float(os.environ.get("IDEMPOTENCY_STALE", 60))  # a pending claim older than this was abandoned
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def order_fingerprint(order_data: OrderCreate) -> str:
+    return hashlib.sha256(order_data.model_dump_json().encode()).hexdigest()
+
+
+async def claim_idempotency_key(key: str, fingerprint: str) -> Tuple[str, Optional[Order]]:
+    """Claim a key for this request.
+
+    Returns the order ID to create under, and None when this request owns
+    the key; or the order stored by an earlier request with the same key.
+    The unique _id makes exactly one of several racing requests the owner,
+    the others wait for it to finish.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        now = datetime.now(timezone.utc)
+        order_id = str(uuid.uuid4())
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": key, "fingerprint": fingerprint, "order_id": order_id,
+                "status": "pending", "created_at": now, "claimed_at": now,
+            })
+            return order_id, None
+        except DuplicateKeyError:
+            pass
+
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if record is None:
+            continue  # released or expired in the meantime
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key wurde bereits für eine andere Bestellung verwendet"
+            )
+        if record["status"] == "done":
+            doc = await db.orders.find_one({"id": record["order_id"]}, {"_id": 0})
+            if doc:
+                return record["order_id"], stored_order(doc)
+            await db.idempotency_keys.delete_one({"_id": key, "order_id": record["order_id"]})
+            continue
+
+        # The owner may have died between claiming and finishing: take over its claim
+        stale = await db.idempotency_keys.find_one_and_update(
+            {"_id": key, "status": "pending", "claimed_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_STALE)}},
+            {"$set": {"claimed_at": now}},
+        )
+        if stale:
+            doc = await db.orders.find_one({"id": stale["order_id"]}, {"_id": 0})
+            if doc:
+                await complete_idempotency_key(key)
+                return stale["order_id"], stored_order(doc)
+            return stale["order_id"], None
+
+        if time.monotonic() > deadline:
+            raise HTTPException(
+                status_code=409, detail="Bestellung wird bereits verarbeitet", headers={"Retry-After": "2"}
+            )
+        await asyncio.sleep(0.2)
+
+
+async def complete_idempotency_key(key: str):
+    await db.idempotency_keys.update_one({"_id": key}, {"$set": {"status": "done"}})
+
+
+async def release_idempotency_key(key: str, order_id: str):
+    """Drop the claim of a failed request so that a retry can try again"""
+    await db.idempotency_keys.delete_one({"_id": key, "order_id": order_id})
+
+
+# ============ ORDER LISTING ============
+ORDER_PAGE_LIMIT = int(os.environ.get("ORDER_PAGE_LIMIT", 200))
+ORDER_STREAM_BATCH = int(os.environ.get("ORDER_STREAM_BATCH", 500))
+ORDER_STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# Everything but the signatures, which never leave the database through the listings
+ORDER_LIST_FIELDS = (
+    "id", "created_at", "total", "pdf_status", "extra_washable", "client_key", "products",
+    *(f"customer.{name}" for name in CustomerInfo.model_fields),
+    *(f"insurance.{name}" for name in InsuranceInfo.model_fields if name not in SIGNATURE_FIELDS),
+)
+
+
+# Default answer to POST /api/orders; the client only needs the ID to go on
+ORDER_SUMMARY_FIELDS = ("id", "created_at", "total", "pdf_status")
+
+
+class OrderPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class OrderSummary(BaseModel):
+    id: str
+    created_at: datetime
+    total: float
+    pdf_status: Optional[str] = None
+
+
+def selected_fields(fields: Optional[str], default: Tuple[str, ...] = ORDER_LIST_FIELDS) -> List[str]:
+    """Fields requested with ?fields=a,customer.b (or whole groups: customer, insurance)"""
+    if not fields:
+        return list(default)
+    selected = []
+    for name in (name.strip() for name in fields.split(",")):
+        if name in ("customer", "insurance"):
+            selected += [field for field in ORDER_LIST_FIELDS if field.startswith(name + ".")]
+        elif name in ORDER_LIST_FIELDS:
+            selected.append(name)
+        elif name:
+            raise HTTPException(status_code=400, detail=f"Unbekanntes Feld: {name}")
+    return list(dict.fromkeys(selected))
+
+
+def list_projection(fields: List[str]) -> Dict[str, int]:
+    # id and created_at are the pagination key, so they are always returned
+    return {"_id": 0, "id": 1, "created_at": 1, **{field: 1 for field in fields}}
+
+
+def json_response(content: Any) -> Response:
+    """Plain JSON of trusted data, skipping FastAPI's response_model validation and encoder pass"""
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str)
+    return Response(body, media_type="application/json")
+
+
+def order_response(order: Order, fields: List[str], headers: Optional[Dict[str, str]] = None) -> Response:
+    """The selected fields of an order, serialized by pydantic in one pass"""
+    include: Dict[str, Any] = {"id": True}
+    for field in fields:
+        group, _, name = field.partition(".")
+        if name:
+            include.setdefault(group, {})[name] = True
+        else:
+            include[group] = True
+    return Response(order.model_dump_json(include=include), media_type="application/json", headers=headers)
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps([doc["created_at"], doc["id"]]).encode()).decode()
+
+
+def after_cursor(query: Dict[str, Any], cursor: str) -> Dict[str, Any]:
+    """Restrict a newest-first query to the orders after the cursor's (created_at, id)"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+    keyset = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": order_id}},
+    ]}
+    return {"$and": [query, keyset]} if query else keyset
+
+
+def listing_query(date_from: Optional[str], date_to: Optional[str], krankenkasse: Optional[str]) -> Dict[str, Any]:
+    try:
+        return export_query(ExportRequest(date_from=date_from, date_to=date_to, krankenkasse=krankenkasse))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datum im Format JJJJ-MM-TT angeben")
+
+
+def field_value(doc: Dict[str, Any], field: str) -> Any:
+    value: Any = doc
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+async def stream_orders(query: Dict[str, Any], fields: List[str], format: str) -> AsyncIterator[bytes]:
+    """Encode the matching orders batch by batch straight from the cursor"""
+    cursor = db.orders.find(query, list_projection(fields)).sort([("created_at", ASCENDING), ("id", ASCENDING)])
+    cursor = cursor.batch_size(ORDER_STREAM_BATCH)
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer)
+    if format == "csv":
+        csv_writer.writerow(fields)
+    count = 0
+    async for doc in cursor:
+        if format == "csv":
+            csv_writer.writerow([
+                json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+                for value in (field_value(doc, field) for field in fields)
+            ])
+        else:
+            buffer.write(json.dumps(doc, ensure_ascii=False, default=str))
+            buffer.write("\n")
+        count += 1
+        if count % ORDER_STREAM_BATCH == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+# ============ STATISTICS ============
+# Daily rollups in db.order_stats_daily, one document per day:
+# {_id: "YYYY-MM-DD", orders, revenue_cents, budget_cents, products: {id: qty}, kassen: {name: count}}
+STATS_TIMEZONE = ZoneInfo(os.environ.get("STATS_TIMEZONE", "UTC"))
+STATS_DEFAULT_DAYS = 30
+STATS_PROJECTION = {"_id": 0, "created_at": 1, "total": 1, "products": 1, "insurance.krankenkasse": 1}
+
+
+def stats_key(name: str) -> str:
+    """Krankenkasse names become field names, which must not contain "." or start with "$" """
+    return (name or "-").replace(".", "．").replace("$", "＄")
+
+
+def stats_name(key: str) -> str:
+    return key.replace("．", ".").replace("＄", "$")
+
+
+def order_day(created_at: Any) -> str:
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(STATS_TIMEZONE).date().isoformat()
+
+
+def add_order_stats(days: Dict[str, Dict[str, Any]], doc: Dict[str, Any], budget_limit_cents: int):
+    """Add a stored order (or its STATS_PROJECTION) to the per-day rollups"""
+    day = days.setdefault(order_day(doc["created_at"]), {
+        "orders": 0, "revenue_cents": 0, "budget_cents": 0, "products": {}, "kassen": {},
+    })
+    day["orders"] += 1
+    day["revenue_cents"] += to_cents(doc["total"])
+    day["budget_cents"] += budget_limit_cents
+    for item in doc["products"]:
+        if item["quantity"] > 0:
+            key = stats_key(item["product_id"])
+            day["products"][key] = day["products"].get(key, 0) + item["quantity"]
+    kasse = stats_key(doc["insurance"]["krankenkasse"])
+    day["kassen"][kasse] = day["kassen"].get(kasse, 0) + 1
+
+
+def stats_increment(day: Dict[str, Any]) -> Dict[str, int]:
+    increment = {"orders": day["orders"], "revenue_cents": day["revenue_cents"], "budget_cents": day["budget_cents"]}
+    for group in ("products", "kassen"):
+        increment.update({f"{group}.{key}": value for key, value in day[group].items()})
+    return increment
+
+
+async def record_order_stats(docs: List[Dict[str, Any]]):
+    """Fold newly stored orders into the rollups; an order never fails because of its statistics"""
+    days: Dict[str, Dict[str, Any]] = {}
+    budget_limit_cents = catalog_store.current().budget_limit_cents
+    for doc in docs:
+        add_order_stats(days, doc, budget_limit_cents)
+    if not days:
+        return
+    try:
+        await db.order_stats_daily.bulk_write([
+            UpdateOne({"_id": day}, {"$inc": stats_increment(values)}, upsert=True) for day, values in days.items()
+        ], ordered=False)
+    except PyMongoError as e:
+        logger.warning(f"Updating order statistics failed, run backfill-stats: {e}")
+
+
+async def backfill_order_stats(
+    batch_size: int = 1000, progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
+    """Rebuild all rollups from the orders, reading them batch by batch.
+
+    Memory is bounded by the number of days. Orders stored while the
+    backfill runs may be missed, so run it while intake is quiet.
+    """
+    days: Dict[str, Dict[str, Any]] = {}
+    budget_limit_cents = catalog_store.current().budget_limit_cents
+    processed = 0
+    async for doc in db.orders.find({}, STATS_PROJECTION).batch_size(batch_size):
+        add_order_stats(days, doc, budget_limit_cents)
+        processed += 1
+        if progress and processed % batch_size == 0:
+            progress(processed)
+    await db.order_stats_daily.delete_many({"_id": {"$nin": list(days)}})
+    if days:
+        await db.order_stats_daily.bulk_write([
+            ReplaceOne({"_id": day}, values, upsert=True) for day, values in days.items()
+        ], ordered=False)
+    return {"orders": processed, "days": len(days)}
+
+
+class StatsSummary(BaseModel):
+    orders: int = 0
+    revenue: float = 0.0
+    budget: float = 0.0
+    budget_utilization: Optional[float] = None  # revenue / budget
+    products: Dict[str, int] = {}
+    kassen: Dict[str, int] = {}
+
+
+class DailyStats(StatsSummary):
+    date: str
+
+
+class StatsResponse(BaseModel):
+    date_from: str
+    date_to: str
+    totals: StatsSummary
+    days: List[DailyStats]
+
+
+def stats_summary(values: Dict[str, Any], **extra) -> Dict[str, Any]:
+    return {
+        "orders": values["orders"],
+        "revenue": values["revenue_cents"] / 100,
+        "budget": values["budget_cents"] / 100,
+        "budget_utilization": (
+            round(values["revenue_cents"] / values["budget_cents"], 4) if values["budget_cents"] else None
+        ),
+        "products": {stats_name(key): value for key, value in values.get("products", {}).items()},
+        "kassen": {stats_name(key): value for key, value in values.get("kassen", {}).items()},
+        **extra,
     }
+
+
+# ============ STARTUP ============
+STARTUP_MONGO_TIMEOUT = float(os.environ.get("STARTUP_MONGO_TIMEOUT", 10))
+READY_MONGO_TIMEOUT = float(os.environ.get("READY_MONGO_TIMEOUT", 2))
+
+
+class StartupState:
+    """Startup phases completed so far and how long each took"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.failed: Optional[str] = None
+
+    async def run(self, name: str, step: Awaitable[Any]):
+        start = time.perf_counter()
+        try:
+            await step
+        except Exception as e:
+            self.failed = f"{name}: {e}"
+            logger.error(f"Startup phase {name} failed: {e}")
+            raise
+        self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Startup phase {name} done in {self.phases[name]} ms")
+
+
+startup_state = StartupState()
+
+
+def load_static_data():
+    """Parse the PDF templates and the product catalog; an invalid PRODUCTS_FILE stops the startup"""
+    if PDF_WRITE_MODE == "incremental" and not INCREMENTAL_WRITES:
+        logger.warning(
+            f"pypdf {pypdf.__version__} is not a tested release for incremental writes, writing PDFs in full"
+        )
+    pdf_templates.load_all()
+    catalog_store.reload()
+
+
+async def watch_templates():
+    """Pick up changed template files off the event loop; cache keys use the loaded versions"""
+    while True:
+        await asyncio.sleep(TEMPLATE_CHECK_INTERVAL)
+        try:
+            await asyncio.to_thread(pdf_templates.reload_changed)
+        except Exception as e:
+            logger.error(f"Reloading the PDF templates failed: {e}")
+
+
+def warm_libraries():
+    """Import and exercise the lazily imported imaging code so the first signed render does not pay for it"""
+    from PIL import Image as PILImage
     
+    buffer = io.BytesIO()
+    PILImage.new('LA', (1, 1)).save(buffer, format='PNG')
+    PILImage.open(io.BytesIO(buffer.getvalue())).convert('RGBA')
+
+
+async def ping_mongo(timeout: float):
     try:
-        writer.update_page_form_field_values(writer.pages[0], field_values)
-    except Exception as e:
-        logger.warning(f"Could not update wechsel fields: {e}")
-    
-    output = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    writer.write(output)
-    output.close()
-    
-    with open(output.name, "rb") as f:
-        pdf_bytes = f.read()
-    
-    os.unlink(output.name)
-    return pdf_bytes
+        await asyncio.wait_for(db.command("ping"), timeout)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"MongoDB did not answer within {timeout}s")
+    except PyMongoError as e:
+        raise RuntimeError(f"MongoDB not reachable: {e}") from e
+
+
+async def ensure_indexes():
+    """Create the indexes the lookups rely on; refuse to start if one conflicts"""
+    try:
+        await db.orders.create_indexes(ORDER_INDEXES)
+        await db.order_documents.create_indexes(ORDER_DOCUMENT_INDEXES)
+        await db.export_jobs.create_indexes(EXPORT_JOB_INDEXES)
+        await db.idempotency_keys.create_indexes(IDEMPOTENCY_KEY_INDEXES)
+        await db.email_outbox.create_indexes(EMAIL_OUTBOX_INDEXES)
+    except OperationFailure as e:
+        raise RuntimeError(f"MongoDB index bootstrap failed: {e}") from e
 
 
 # ============ API ROUTES ============
@@ -435,53 +3448,149 @@ async def root():
 @api_router.get("/products")
 async def get_products():
     """Get all available products"""
-    return {
-        "products": PRODUCTS,
-        "budget_limit": BUDGET_LIMIT
-    }
+    return catalog_store.current().api_payload
 
-@api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate):
-    """Create a new order"""
-    # Validate total
-    total = calculate_total(order_data.products)
-    if total > BUDGET_LIMIT:
-        raise HTTPException(status_code=400, detail=f"Budget überschritten: {total}€ > {BUDGET_LIMIT}€")
+# The body is serialized by order_response; OrderSummary documents the default fields
+@api_router.post("/orders", response_model=None, responses={200: {"model": OrderSummary}})
+async def create_order(
+    order_data: OrderCreate,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None),
+    fields: Optional[str] = Query(None, description="comma-separated, e.g. id,customer; default: summary"),
+):
+    """Create a new order
     
-    # Validate consents
-    if not order_data.insurance.consent1 or not order_data.insurance.consent2:
-        raise HTTPException(status_code=400, detail="Beide Einverständniserklärungen müssen akzeptiert werden")
+    With an Idempotency-Key header, repeating the request (double submit,
+    client retry) returns the first order instead of creating another one.
+    The response holds id, created_at, total and pdf_status unless other
+    fields are requested; the signatures are never echoed.
+    """
+    selected = selected_fields(fields, ORDER_SUMMARY_FIELDS)
+    if not idempotency_key:
+        order, signatures = await place_order(order_data)
+    else:
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key ist zu lang")
+        order_id, replay = await claim_idempotency_key(idempotency_key, order_fingerprint(order_data))
+        if replay:
+            return order_response(replay, selected, headers={"Idempotent-Replayed": "true"})
+        try:
+            order, signatures = await place_order(order_data, order_id)
+        except BaseException:
+            await release_idempotency_key(idempotency_key, order_id)
+            raise
+        await complete_idempotency_key(idempotency_key)
     
-    # Validate signature
-    if not order_data.insurance.signature_insured:
-        raise HTTPException(status_code=400, detail="Unterschrift erforderlich")
+    # Render the documents now, the customer downloads them on the next screen
+    background_tasks.add_task(prerender_order, with_inline_signatures(order, signatures))
+    if ORDER_EMAIL_ON_CREATE and email_outbox.configured:
+        # Runs after the pre-render, so the attachments come from the stored documents
+        background_tasks.add_task(queue_order_email, order)
     
-    # Create order
-    order = Order(
-        products=order_data.products,
-        customer=order_data.customer,
-        insurance=order_data.insurance,
-        extra_washable=order_data.extra_washable,
-        total=total
+    return order_response(order, selected)
+
+@api_router.post("/orders/bulk", response_model=BulkOrderResponse)
+async def create_orders_bulk(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    batch_key: Optional[str] = Query(None, description="derives client_key = batch_key:row for rows without one"),
+):
+    """Create many orders at once from a JSON array or an NDJSON stream (application/x-ndjson).
+
+    Every row gets its own result. Rows whose client_key was stored before
+    are reported as duplicates with the existing order ID, so a batch can
+    safely be sent again.
+    """
+    rows = await read_bulk_rows(request)
+    response, created = await create_orders(rows, batch_key)
+    if created:
+        background_tasks.add_task(prerender_orders, created)
+    logger.info(
+        f"Bulk intake: {response.created} created, {response.duplicates} duplicates, {response.rejected} rejected"
     )
+    return response
+
+@api_router.get("/orders", response_model=OrderPage)
+async def list_orders(
+    limit: int = Query(50, ge=1, le=ORDER_PAGE_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="comma-separated, e.g. customer.nachname,total"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    krankenkasse: Optional[str] = None,
+):
+    """Orders newest first, paginated by (created_at, id) so deep pages stay as cheap as the first"""
+    query = listing_query(date_from, date_to, krankenkasse)
+    if cursor:
+        query = after_cursor(query, cursor)
+    projection = list_projection(selected_fields(fields))
+    docs = await (
+        db.orders.find(query, projection).sort([("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    )
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return OrderPage(items=docs[:limit], next_cursor=next_cursor)
+
+@api_router.get("/orders/export")
+async def export_orders(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    fields: Optional[str] = Query(None, description="comma-separated, e.g. customer.nachname,total"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    krankenkasse: Optional[str] = None,
+):
+    """Stream all matching orders, oldest first, without loading them into memory"""
+    if format not in ORDER_STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unbekanntes Format: {format}")
+    query = listing_query(date_from, date_to, krankenkasse)
+    filename = f"Bestellungen_{datetime.now().strftime('%Y-%m-%d')}.{format}"
+    return StreamingResponse(
+        stream_orders(query, selected_fields(fields), format),
+        media_type=ORDER_STREAM_FORMATS[format],
+        headers=attachment_headers(filename),
+    )
+
+@api_router.get("/stats", response_model=StatsResponse)
+async def get_stats(
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive; default 30 days ago"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive; default today"),
+):
+    """Daily orders, revenue against the budget, product mix and Pflegekassen from the rollups"""
+    try:
+        end = date.fromisoformat(date_to) if date_to else datetime.now(STATS_TIMEZONE).date()
+        start = date.fromisoformat(date_from) if date_from else end - timedelta(days=STATS_DEFAULT_DAYS - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datum im Format JJJJ-MM-TT angeben")
     
-    # Save to database
-    doc = order.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.orders.insert_one(doc)
-    
-    return order
+    totals = {"orders": 0, "revenue_cents": 0, "budget_cents": 0, "products": {}, "kassen": {}}
+    days = []
+    query = {"_id": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+    async for values in db.order_stats_daily.find(query).sort("_id", ASCENDING):
+        days.append(stats_summary(values, date=values["_id"]))
+        for field in ("orders", "revenue_cents", "budget_cents"):
+            totals[field] += values[field]
+        for group in ("products", "kassen"):
+            for key, value in values.get(group, {}).items():
+                totals[group][key] = totals[group].get(key, 0) + value
+    return StatsResponse(date_from=start.isoformat(), date_to=end.isoformat(), totals=stats_summary(totals), days=days)
 
 @api_router.get("/orders/{order_id}")
-async def get_order(order_id: str):
-    """Get order by ID"""
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+async def get_order(
+    order_id: str,
+    fields: Optional[str] = Query(None, description="comma-separated, e.g. customer.nachname,total"),
+):
+    """Get order by ID, without the signatures"""
+    order = await db.orders.find_one({"id": order_id}, list_projection(selected_fields(fields)))
     if not order:
         raise HTTPException(status_code=404, detail="Bestellung nicht gefunden")
-    return order
+    return json_response(order)
 
 @api_router.get("/orders/{order_id}/pdf")
-async def get_order_pdf(order_id: str, pdf_type: str = Query("main", description="PDF type: main, bestellung, wechsel, or all")):
+async def get_order_pdf(
+    order_id: str,
+    pdf_type: str = Query("main", description="PDF type: main, bestellung, wechsel, or all"),
+    flatten: bool = Query(False, description="Feldwerte in den Seiteninhalt einbrennen, ohne Formular"),
+    if_none_match: Optional[str] = Header(None),
+):
     """Generate and download filled PDF for order
     
     pdf_type options:
@@ -489,72 +3598,172 @@ async def get_order_pdf(order_id: str, pdf_type: str = Query("main", description
     - bestellung: Bestellformular/Lieferschein
     - wechsel: Wechselerklärung
     - all: Alle PDFs als ZIP
+
+    flatten=true liefert nicht mehr ausfüllbare PDFs (kleiner, ohne AcroForm)
     """
-    order_doc = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    if pdf_type not in PDF_DOCUMENTS and pdf_type != "all":
+        pdf_type = "main"
+    
+    # Signatures are large and only loaded if a document actually has to be rendered
+    with timed(pdf_type, "mongo"):
+        order_doc = await db.orders.find_one({"id": order_id}, ORDER_PDF_PROJECTION)
     if not order_doc:
         raise HTTPException(status_code=404, detail="Bestellung nicht gefunden")
     
-    # Convert to Order model
-    order = Order(**order_doc)
+    # Orders are immutable, so the ETag only depends on the cache key
+    etag = f'"{pdf_cache.key(order_id, pdf_type, flatten)}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache_headers)
+    
+    with timed(pdf_type, "validate"):
+        order = stored_order(order_doc)
+    
+    if pdf_type == "all":
+        # Render all documents concurrently and send each ZIP entry as soon as it and those before it are ready
+        doc_types = order_document_types(order)
+        try:
+            futures = await render_order_documents(order, doc_types, signatures_loaded=False, flatten=flatten)
+        except RenderPoolSaturated:
+            raise render_pool_busy()
+        entries = [
+            (f"{PDF_DOCUMENTS[t][1]}_{order.customer.nachname}.pdf", future)
+            for t, future in zip(doc_types, futures)
+        ]
+        return StreamingResponse(
+            stream_zip(entries),
+            media_type="application/zip",
+            headers={
+                **attachment_headers(f"Marina_Pflegebox_{order.customer.nachname}_{order.id[:8]}.zip"),
+                **cache_headers,
+            }
+        )
     
     try:
-        if pdf_type == "all":
-            # Generate all PDFs and bundle as ZIP
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                # Main form
-                main_pdf = generate_filled_pdf(order)
-                zip_file.writestr(f"Anlage2_Antrag_{order.customer.nachname}.pdf", main_pdf)
-                
-                # Order form
-                order_pdf = generate_bestellformular_pdf(order)
-                zip_file.writestr(f"Bestellformular_{order.customer.nachname}.pdf", order_pdf)
-                
-                # Switch declaration (if already receiving benefits)
-                if order.insurance.bezieht_bereits:
-                    wechsel_pdf = generate_wechsel_pdf(order)
-                    zip_file.writestr(f"Wechselerklaerung_{order.customer.nachname}.pdf", wechsel_pdf)
-            
-            zip_buffer.seek(0)
-            return Response(
-                content=zip_buffer.getvalue(),
-                media_type="application/zip",
-                headers={
-                    "Content-Disposition": f"attachment; filename=Marina_Pflegebox_{order.customer.nachname}_{order.id[:8]}.zip"
-                }
-            )
-        
-        elif pdf_type == "bestellung":
-            pdf_bytes = generate_bestellformular_pdf(order)
-            filename = f"Bestellformular_{order.customer.nachname}_{order.id[:8]}.pdf"
-        
-        elif pdf_type == "wechsel":
-            pdf_bytes = generate_wechsel_pdf(order)
-            filename = f"Wechselerklaerung_{order.customer.nachname}_{order.id[:8]}.pdf"
-        
-        else:  # main
-            pdf_bytes = generate_filled_pdf(order)
-            filename = f"Anlage2_Antrag_{order.customer.nachname}_{order.id[:8]}.pdf"
-        
+        with timed(pdf_type, "render"):
+            [future] = await render_order_documents(order, [pdf_type], signatures_loaded=False, flatten=flatten)
+            pdf_bytes = await future
+    except RenderPoolSaturated:
+        raise render_pool_busy()
+    except asyncio.TimeoutError:
+        logger.error(f"PDF generation timed out after {PDF_JOB_TIMEOUT}s")
+        raise HTTPException(status_code=504, detail="PDF-Generierung hat zu lange gedauert")
     except Exception as e:
         logger.error(f"PDF generation failed: {e}")
         raise HTTPException(status_code=500, detail=f"PDF-Generierung fehlgeschlagen: {str(e)}")
     
-    # Return as file
-    output_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    output_path.write(pdf_bytes)
-    output_path.close()
-    
-    return FileResponse(
-        output_path.name,
+    filename = f"{PDF_DOCUMENTS[pdf_type][1]}_{order.customer.nachname}_{order.id[:8]}.pdf"
+    return Response(
+        content=pdf_bytes,
         media_type="application/pdf",
-        filename=filename
+        headers={**attachment_headers(filename), **cache_headers},
     )
 
+@api_router.post("/orders/{order_id}/email", response_model=OutboxMessage, status_code=202)
+async def email_order(order_id: str, params: Optional[EmailRequest] = None):
+    """Queue the order documents for sending to ORDER_EMAIL_TO
+
+    Die PDFs werden serverseitig erzeugt und angehängt; solange eine Nachricht
+    zur Bestellung noch nicht zugestellt ist, wird diese zurückgegeben.
+    """
+    if not email_outbox.configured:
+        raise HTTPException(status_code=503, detail="E-Mail-Versand ist nicht konfiguriert")
+    params = params or EmailRequest()
+    order_doc = await db.orders.find_one({"id": order_id}, ORDER_EMAIL_PROJECTION)
+    if not order_doc:
+        raise HTTPException(status_code=404, detail="Bestellung nicht gefunden")
+    order = stored_order(order_doc)
+    available = order_document_types(order)
+    unknown = [doc_type for doc_type in params.doc_types or [] if doc_type not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Dokument gehört nicht zur Bestellung: {', '.join(unknown)}")
+    return await queue_order_email(order, params.doc_types, params.flatten)
+
+@api_router.get("/emails/{message_id}", response_model=OutboxMessage)
+async def get_email(message_id: str):
+    """Delivery status of a queued order email"""
+    message = await db.email_outbox.find_one({"id": message_id}, {"_id": 0})
+    if not message:
+        raise HTTPException(status_code=404, detail="Nachricht nicht gefunden")
+    return message
+
+@api_router.post("/exports", response_model=ExportJob)
+async def create_export(params: ExportRequest):
+    """Start a batch export of order PDFs, e.g. the daily Anlage 2 batch per Pflegekasse"""
+    if params.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unbekanntes Format: {params.format}")
+    unknown = [t for t in params.doc_types if t not in PDF_DOCUMENTS]
+    if unknown or not params.doc_types:
+        raise HTTPException(status_code=400, detail=f"Unbekannte Dokumenttypen: {unknown}")
+    try:
+        export_query(params)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datum im Format JJJJ-MM-TT angeben")
+    
+    job = ExportJob(params=params)
+    await db.export_jobs.insert_one(job.model_dump())
+    start_export_job(job.id)
+    return job
+
+@api_router.get("/exports/{job_id}", response_model=ExportJob)
+async def get_export(job_id: str):
+    """Progress of a batch export"""
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export nicht gefunden")
+    return job
+
+@api_router.post("/exports/{job_id}/resume", response_model=ExportJob)
+async def resume_export(job_id: str):
+    """Continue an interrupted or failed export; finished documents are kept"""
+    if not await db.export_jobs.count_documents({"id": job_id}):
+        raise HTTPException(status_code=404, detail="Export nicht gefunden")
+    if any(not task.done() for task in export_tasks if task.get_name() == job_id):
+        raise HTTPException(status_code=409, detail="Export läuft bereits")
+    # The lease also covers jobs running in another instance
+    job = await claim_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=409, detail="Export läuft bereits")
+    start_export_job(job_id)
+    return job
+
+@api_router.get("/exports/{job_id}/download")
+async def download_export(job_id: str):
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export nicht gefunden")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export ist noch nicht fertig ({job['status']})")
+    return FileResponse(export_archive_path(job_id), media_type="application/zip", filename=f"Export_{job_id[:8]}.zip")
+
 @api_router.get("/health")
 async def health_check():
+    """Liveness: the process answers requests"""
     return {"status": "healthy"}
 
+@api_router.get("/ready")
+async def readiness_check():
+    """Readiness: startup finished and MongoDB is reachable"""
+    if not startup_state.ready:
+        raise HTTPException(status_code=503, detail="Dienst wird gestartet")
+    try:
+        await ping_mongo(READY_MONGO_TIMEOUT)
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Datenbank nicht erreichbar")
+    return {"status": "ready", "startup_ms": startup_state.phases}
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the latency histograms and counters"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metriken sind deaktiviert")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/templates")
+async def get_templates():
+    """Memory held by the cached PDF templates and rendered documents"""
+    return {**pdf_templates.memory_usage(), "rendered_cache": pdf_cache.stats()}
+
 # Include router
 app.include_router(api_router)
 
@@ -574,6 +3783,144 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Service loops that run until shutdown
+background_tasks: set = set()
+
+
+@app.on_event("startup")
+async def startup():
+    """Bring the service up phase by phase; /api/ready only reports ready afterwards"""
+    started = time.perf_counter()
+
+    async def database():
+        await startup_state.run("mongo", ping_mongo(STARTUP_MONGO_TIMEOUT))
+        await startup_state.run("indexes", ensure_indexes())
+
+    # Parsing the templates is CPU-bound; it runs in a thread while Mongo answers
+    await asyncio.gather(startup_state.run("templates", asyncio.to_thread(load_static_data)), database())
+    await startup_state.run("render_pool", pdf_render_pool.start())
+    await startup_state.run("email_outbox", email_outbox.start())
+    start_export_task(recover_export_jobs(), "export-recovery")
+    if TEMPLATE_CHECK_INTERVAL > 0:
+        background_tasks.add(asyncio.create_task(watch_templates(), name="template-watcher"))
+    await startup_state.run("warm", asyncio.to_thread(warm_libraries))
+    startup_state.ready = True
+    logger.info(f"Ready after {(time.perf_counter() - started) * 1000:.1f} ms: {startup_state.phases}")
+
 @app.on_event("shutdown")
-async def shutdown_db_client():
+async def shutdown_services():
+    for task in background_tasks:
+        task.cancel()
+    await email_outbox.stop()
+    # Interrupted exports give up their lease, the next start continues them
+    for task in list(export_tasks):
+        task.cancel()
+    await asyncio.gather(*export_tasks, return_exceptions=True)
     client.close()
+    # Let running renders finish, drop the queued ones
+    await asyncio.to_thread(pdf_render_pool.shutdown)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pflegebox backend utilities")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prepare_cmd = commands.add_parser("prepare-templates", help="Write the prepared PDF templates to a directory")
+    prepare_cmd.add_argument("--out", type=Path, default=PDF_DIR / "prepared")
+    export_cmd = commands.add_parser("export", help="Batch-export order PDFs into a ZIP")
+    export_cmd.add_argument("--from", dest="date_from", help="first day, YYYY-MM-DD")
+    export_cmd.add_argument("--to", dest="date_to", help="last day, YYYY-MM-DD")
+    export_cmd.add_argument("--kasse", dest="krankenkasse", help="only orders of this Pflegekasse")
+    export_cmd.add_argument("--doc", dest="doc_types", action="append", choices=list(PDF_DOCUMENTS))
+    export_cmd.add_argument("--format", choices=EXPORT_FORMATS, default="zip")
+    export_cmd.add_argument("--resume", metavar="JOB_ID", help="continue an interrupted export")
+    migrate_cmd = commands.add_parser(
+        "migrate-signatures", help="Move inline signatures of existing orders into db.signatures"
+    )
+    migrate_cmd.add_argument("--batch-size", type=int, default=500)
+    stats_cmd = commands.add_parser("backfill-stats", help="Rebuild the daily order statistics from all orders")
+    stats_cmd.add_argument("--batch-size", type=int, default=1000)
+    fields_cmd = commands.add_parser("form-fields", help="List the form fields of a template or of any PDF")
+    fields_cmd.add_argument("template", help=f"template name ({', '.join(pdf_templates.names())}) or path to a PDF")
+    fields_cmd.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    if args.command == "prepare-templates":
+        for path in pdf_templates.write_prepared(args.out):
+            print(path)
+
+    elif args.command == "form-fields":
+        if args.template in pdf_templates.names():
+            template = pdf_templates.get(args.template)
+            form, mapped = template.form, template.compiled.names() if template.compiled else set()
+        else:
+            form, mapped = TemplateForm.compile(PdfReader(args.template)), None
+        inventory = form.describe()
+        if mapped is not None:
+            for entry in inventory:
+                entry["mapped"] = entry["name"] in mapped
+        if args.json:
+            print(json.dumps(inventory, indent=2, ensure_ascii=False))
+        else:
+            for entry in inventory:
+                details = " ".join(
+                    f"{key}={value}" for key, value in entry.items()
+                    if key not in ("name", "page", "kind", "rect", "object", "mapped")
+                )
+                marker = "" if mapped is None else "* " if entry["mapped"] else "  "
+                rect = " ".join(f"{v:7.2f}" for v in entry["rect"])
+                print(f"{marker}{entry['name']:<28} p{entry['page']} {entry['kind']:<8} [{rect}] {details}")
+            if mapped is not None:
+                print(f"{len(inventory)} fields, {sum(e['mapped'] for e in inventory)} mapped (*)", file=sys.stderr)
+
+    elif args.command == "export":
+        async def export_cli():
+            pdf_templates.load_all()
+            await pdf_render_pool.start()
+            try:
+                if args.resume:
+                    job_id = args.resume
+                    if not await claim_export_job(job_id):
+                        raise SystemExit(f"Export {job_id} does not exist or is still running")
+                else:
+                    job = ExportJob(params=ExportRequest(
+                        date_from=args.date_from,
+                        date_to=args.date_to,
+                        krankenkasse=args.krankenkasse,
+                        doc_types=args.doc_types or ["main"],
+                        format=args.format,
+                    ))
+                    await db.export_jobs.insert_one(job.model_dump())
+                    job_id = job.id
+                print(f"Export {job_id}", file=sys.stderr)
+                job = await run_export_job(
+                    job_id,
+                    progress=lambda j: print(f"\r{j.processed}/{j.total} ({j.failed} failed)", end="", file=sys.stderr),
+                )
+                print(file=sys.stderr)
+                if job.status != "done":
+                    raise SystemExit(f"Export failed: {job.error} (resume with --resume {job_id})")
+                print(export_archive_path(job_id))
+            finally:
+                pdf_render_pool.shutdown()
+
+        asyncio.run(export_cli())
+
+    elif args.command == "migrate-signatures":
+        stats = asyncio.run(migrate_signatures(
+            args.batch_size,
+            progress=lambda st: print(
+                f"\r{st['orders']} orders, {st['signatures']} signatures, {st['invalid']} invalid",
+                end="", file=sys.stderr,
+            ),
+        ))
+        print(file=sys.stderr)
+        print(json.dumps(stats))
+
+    elif args.command == "backfill-stats":
+        stats = asyncio.run(backfill_order_stats(
+            args.batch_size, progress=lambda processed: print(f"\r{processed} orders", end="", file=sys.stderr),
+        ))
+        print(file=sys.stderr)
+        print(json.dumps(stats))
@@ -0,0 +1,122 @@
+import base64
+import io
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pflegebox_test")
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import server  # noqa: E402
+
+
+def _order(**changes) -> server.Order:
+    """An order without signatures; ``changes`` replace top-level fields"""
+    fields = {
+        "products": [
+            server.ProductSelection(product_id="gloves", quantity=1, size="M"),
+            server.ProductSelection(product_id="pads", quantity=1),
+        ],
+        "customer": server.CustomerInfo(
+            pflegegrad="2", anrede="Frau", vorname="Erika", nachname="Mustermann",
+            strasse="Musterstraße", hausnr="1", plz="10115", stadt="Berlin", geburtsdatum="01.01.1940",
+        ),
+        "insurance": server.InsuranceInfo(
+            versicherungsart="gesetzlich", krankenkasse="AOK Nordost", versichertennummer="A123456789",
+            bezieht_bereits=True, consent1=True, consent2=True, signature_insured="",
+        ),
+        "total": 33.65,
+    }
+    return server.Order(**{**fields, **changes})
+
+
+def _signature() -> str:
+    """A drawn line as the canvas of the Konfigurator exports it"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (300, 100), (0, 0, 0, 0))
+    ImageDraw.Draw(image).line([(10, 80), (120, 20), (290, 70)], fill=(0, 0, 0, 255), width=4)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def _payload(**insurance) -> dict:
+    """Body of POST /api/orders; ``insurance`` overrides fields of the insurance block"""
+    return {
+        "products": [{"product_id": "gloves", "quantity": 1, "size": "M"}, {"product_id": "pads", "quantity": 1}],
+        "customer": {
+            "pflegegrad": "2", "anrede": "Frau", "vorname": "Erika", "nachname": "Mustermann",
+            "strasse": "Musterstraße", "hausnr": "1", "plz": "10115", "stadt": "Berlin", "geburtsdatum": "01.01.1940",
+        },
+        "insurance": {
+            "versicherungsart": "gesetzlich", "krankenkasse": "AOK Nordost", "versichertennummer": "A123456789",
+            "bezieht_bereits": True, "consent1": True, "consent2": True, "signature_insured": _signature(),
+            **insurance,
+        },
+    }
+
+
+@pytest.fixture(scope="session")
+def templates():
+    server.pdf_templates.load_all()
+    return server.pdf_templates
+
+
+@pytest.fixture
+def make_order():
+    return _order
+
+
+@pytest.fixture
+def order_payload():
+    return _payload
+
+
+@pytest.fixture
+def signature():
+    return _signature
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory stand-in for the Mongo database"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    database = AsyncMongoMockClient()["pflegebox_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+@pytest.fixture
+def pdf_cache(monkeypatch):
+    cache = server.RenderedPdfCache(8 * 1024 * 1024)
+    monkeypatch.setattr(server, "pdf_cache", cache)
+    return cache
+
+
+@pytest.fixture
+async def render_pool(monkeypatch, templates, pdf_cache):
+    """Thread render pool; tests of the process pool start their own"""
+    pool = server.PdfRenderPool("thread", 2, 8, 30)
+    await pool.start()
+    monkeypatch.setattr(server, "pdf_render_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+async def client(db, render_pool):
+    """The API without its startup: the fixtures provide the database and the render pool"""
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
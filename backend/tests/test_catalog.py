@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+
+import pytest
+from pydantic import ValidationError
+
+import server
+
+PRODUCT = {"id": "gloves", "name": "Einmalhandschuhe", "price": 9.25, "factor": 100, "pos": "54.99.01.1001"}
+
+
+def write(path, content: str, mtime: int):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_builtin_catalog_keeps_the_api_shape():
+    catalog = server.Catalog.parse(server.PRODUCTS)
+    assert catalog.api_payload == {"products": server.PRODUCTS, "budget_limit": server.BUDGET_LIMIT}
+    assert catalog.get("gloves").price_cents == 925
+    assert catalog.get("gloves").has_size
+
+
+def test_broken_file_keeps_the_last_good_catalog(tmp_path, caplog):
+    path = tmp_path / "products.json"
+    write(path, json.dumps({"products": [PRODUCT], "budget_limit": 40}), 1_000_000_000)
+    store = server.CatalogStore(path)
+    assert store.current().get("gloves").price_cents == 925
+    assert store.current().budget_limit_cents == 4000
+
+    with caplog.at_level(logging.ERROR, logger="server"):
+        write(path, json.dumps([PRODUCT])[:20], 2_000_000_000)  # truncated
+        assert store.current().get("gloves").price_cents == 925
+        assert store.current().get("gloves").price_cents == 925
+
+        write(path, json.dumps([{k: v for k, v in PRODUCT.items() if k != "factor"}]), 3_000_000_000)
+        assert store.current().get("gloves").factor == 100
+
+        path.unlink()
+        assert store.current().get("gloves").price_cents == 925
+    # Reported once per change of the file, not on every request
+    assert len([r for r in caplog.records if r.levelno == logging.ERROR]) == 3
+
+    write(path, json.dumps([{**PRODUCT, "price": 9.5}]), 4_000_000_000)
+    assert store.current().get("gloves").price_cents == 950
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    [{**PRODUCT, "factor": 0}],
+    [{**PRODUCT, "price": "teuer"}],
+    [PRODUCT, {**PRODUCT, "name": "Handschuhe"}],
+    {"products": [PRODUCT], "budget_limit": -1},
+])
+def test_invalid_entries_are_rejected(data):
+    with pytest.raises(ValidationError):
+        server.Catalog.parse(data)
+
+
+def test_reload_raises_for_an_invalid_file(tmp_path):
+    path = tmp_path / "products.json"
+    write(path, "{", 1_000_000_000)
+    with pytest.raises(ValueError):
+        server.CatalogStore(path).reload()
@@ -0,0 +1,114 @@
+import asyncio
+import io
+import socket
+from email import message_from_bytes, policy
+
+import pytest
+from aiosmtpd.controller import Controller
+from pypdf import PdfReader
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+class Inbox:
+    """aiosmtpd handler that keeps every accepted message"""
+
+    def __init__(self):
+        self.envelopes = []
+        self.refuse = set()
+
+    async def handle_RCPT(self, smtp, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 5.1.1 Unbekannter Empfänger"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, smtp, session, envelope):
+        self.envelopes.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    """A local SMTP server the outbox delivers to"""
+    handler = Inbox()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    for name, value in {
+        "SMTP_HOST": "127.0.0.1", "SMTP_PORT": controller.port, "SMTP_USER": "", "SMTP_PASS": "",
+        "SMTP_SECURE": False, "FROM_EMAIL": "bestellung@example.com", "ORDER_EMAIL_TO": "kontakt@example.com",
+        "SMTP_RATE_LIMIT": 0,
+    }.items():
+        monkeypatch.setattr(server, name, value)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+async def outbox(monkeypatch, inbox, render_pool):
+    outbox = server.EmailOutbox()
+    monkeypatch.setattr(server, "email_outbox", outbox)
+    await outbox.start()
+    yield outbox
+    await outbox.stop()
+
+
+async def wait_for_status(db, message_id: str, status: str):
+    for _ in range(200):
+        message = await db.email_outbox.find_one({"id": message_id}, {"_id": 0})
+        if message["status"] == status:
+            return message
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"message {message_id} is {message['status']}, not {status}")
+
+
+async def test_order_documents_arrive_as_attachments(client, db, inbox, outbox, order_payload):
+    order_id = (await client.post("/api/orders", json=order_payload())).json()["id"]
+    response = await client.post(f"/api/orders/{order_id}/email")
+    assert response.status_code == 202
+    await wait_for_status(db, response.json()["id"], "sent")
+
+    [envelope] = inbox.envelopes
+    assert envelope.mail_from == "bestellung@example.com"
+    assert envelope.rcpt_tos == ["kontakt@example.com"]
+    email = message_from_bytes(envelope.content, policy=policy.default)
+    assert order_id in email.get_body(("plain",)).get_content()
+
+    attachments = list(email.iter_attachments())
+    assert [part.get_filename() for part in attachments] == [
+        f"{server.PDF_DOCUMENTS[doc_type][1]}_Mustermann_{order_id[:8]}.pdf"
+        for doc_type in ("bestellung", "main", "wechsel")
+    ]
+    for part in attachments:
+        assert part.get_content_type() == "application/pdf"
+        assert len(PdfReader(io.BytesIO(part.get_content())).pages) > 0
+
+
+async def test_session_is_reused_for_the_next_message(client, db, inbox, outbox, order_payload):
+    for number in range(2):
+        payload = order_payload(versichertennummer=f"A00000000{number}")
+        order_id = (await client.post("/api/orders", json=payload)).json()["id"]
+        message = (await client.post(f"/api/orders/{order_id}/email", json={"doc_types": ["main"]})).json()
+        await wait_for_status(db, message["id"], "sent")
+
+    assert len(inbox.envelopes) == 2
+    assert outbox.pool.opened == 1
+
+
+async def test_refused_recipient_is_not_retried(client, db, inbox, outbox, order_payload):
+    inbox.refuse.add("kontakt@example.com")
+    order_id = (await client.post("/api/orders", json=order_payload())).json()["id"]
+    message = (await client.post(f"/api/orders/{order_id}/email")).json()
+
+    failed = await wait_for_status(db, message["id"], "failed")
+    assert failed["attempts"] == 1
+    assert "550" in failed["last_error"]
+    assert inbox.envelopes == []
@@ -0,0 +1,96 @@
+import asyncio
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+from pypdf import PdfReader
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def export_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "EXPORT_DIR", tmp_path)
+    return tmp_path
+
+
+async def finish_export_tasks():
+    await asyncio.gather(*server.export_tasks)
+
+
+async def test_background_jobs_wait_and_leave_the_reserve():
+    pool = server.PdfRenderPool("thread", 2, 4, 30, reserve=2)
+    await pool.start()
+    gate = threading.Event()
+    try:
+        running = await pool.submit_background([(gate.wait, 5)] * 2)
+        waiting = asyncio.create_task(pool.submit_background([(gate.wait, 5)]))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()  # waits for a slot instead of failing
+
+        # Downloads still get the reserved slots
+        download = pool.submit(time.sleep, 0)
+        await download
+        gate.set()
+        await asyncio.gather(*running, *await waiting)
+        assert pool.pending == 0
+    finally:
+        gate.set()
+        pool.shutdown()
+
+
+async def test_merged_export_is_split_into_parts(db, render_pool, export_dir, make_order, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_MERGE_MAX_DOCUMENTS", 2)
+    for _ in range(3):
+        await db.orders.insert_one(server.order_document(make_order()))
+    job = server.ExportJob(params=server.ExportRequest(format="merged"))
+    await db.export_jobs.insert_one(job.model_dump())
+
+    job = await server.run_export_job(job.id)
+    assert (job.status, job.processed, job.failed, job.lease_until) == ("done", 3, 0, None)
+
+    kasse = server.safe_filename(make_order().insurance.krankenkasse)
+    with zipfile.ZipFile(server.export_archive_path(job.id)) as archive:
+        assert archive.namelist() == [f"{kasse}_001.pdf", f"{kasse}_002.pdf"]
+        pages = [len(PdfReader(io.BytesIO(archive.read(name))).pages) for name in archive.namelist()]
+    single = len(PdfReader(io.BytesIO(server.generate_filled_pdf(make_order()))).pages)
+    assert pages == [2 * single, single]
+
+
+async def test_abandoned_job_is_recovered(db, render_pool, export_dir, make_order, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_LEASE", 0.2)
+    await db.orders.insert_one(server.order_document(make_order()))
+    # Left "running" by a stopped process: its lease ran out
+    stale = server.ExportJob(params=server.ExportRequest(), status="running", lease_until=server.utc_timestamp(-1))
+    # Still renewed by another instance, which finishes it while recovery waits
+    held = server.ExportJob(params=server.ExportRequest(), status="running", lease_until=server.utc_timestamp(60))
+    await db.export_jobs.insert_many([stale.model_dump(), held.model_dump()])
+
+    recovery = asyncio.create_task(server.recover_export_jobs())
+    await asyncio.sleep(0.15)
+    assert not recovery.done()
+    await db.export_jobs.update_one({"id": held.id}, {"$set": {"status": "done", "lease_until": None}})
+    await asyncio.wait_for(recovery, 5)
+    await finish_export_tasks()
+
+    recovered = await db.export_jobs.find_one({"id": stale.id}, {"_id": 0})
+    assert (recovered["status"], recovered["processed"], recovered["lease_until"]) == ("done", 1, None)
+    assert server.export_archive_path(stale.id).exists()
+    assert not server.export_archive_path(held.id).exists()
+
+
+async def test_resume_respects_the_lease(client, db, export_dir):
+    held = server.ExportJob(params=server.ExportRequest(), status="running")
+    failed = server.ExportJob(params=server.ExportRequest(), status="failed", lease_until=None)
+    await db.export_jobs.insert_many([held.model_dump(), failed.model_dump()])
+
+    assert (await client.post(f"/api/exports/{held.id}/resume")).status_code == 409
+    assert (await client.post(f"/api/exports/{failed.id}/resume")).status_code == 200
+    assert (await client.post(f"/api/exports/{failed.id}/resume")).status_code == 409
+    assert (await client.post("/api/exports/unbekannt/resume")).status_code == 404
+    await finish_export_tasks()
+    assert (await db.export_jobs.find_one({"id": failed.id}))["status"] == "done"
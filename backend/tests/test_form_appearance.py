@@ -0,0 +1,102 @@
+import io
+import re
+from datetime import datetime
+
+import pytest
+from pypdf import PdfReader
+
+import server
+
+
+def field_appearance(pdf: bytes, name: str):
+    """Stored value and the strings the normal appearance of a field shows"""
+    reader = PdfReader(io.BytesIO(pdf))
+    for page in reader.pages:
+        for ref in page.get("/Annots", []):
+            annot = ref.get_object()
+            field = annot if "/T" in annot else annot["/Parent"].get_object()
+            if field.get("/T") == name:
+                content = annot["/AP"]["/N"].get_object().get_data().decode("latin-1")
+                return field["/V"], re.findall(r"\((.*?)\) Tj", content)
+    raise KeyError(name)
+
+
+def test_comb_date_without_separators(templates, make_order):
+    pdf = server.generate_filled_pdf(make_order())
+
+    value, shown = field_appearance(pdf, "geb_1")
+    assert value == "01011940"
+    assert shown == list("01011940")  # one character per cell
+
+    today = datetime.now().strftime("%d%m%Y")
+    value, shown = field_appearance(pdf, "datum_beratung")
+    assert value == today
+    assert "".join(shown) == today
+
+
+def test_value_longer_than_comb_is_not_cut(templates, make_order):
+    pdf = server.generate_filled_pdf(make_order())
+
+    value, shown = field_appearance(pdf, "qty_3")  # three cells
+    assert value == "100 (Gr. M)"
+    assert shown == ["100 \\(Gr. M\\)"]  # a single line, parentheses escaped
+
+    value, shown = field_appearance(pdf, "qty_1")
+    assert value == "50"
+    assert shown == ["5", "0"]
+
+
+def test_flattened_document_keeps_full_values(templates, make_order):
+    pdf = server.generate_filled_pdf(make_order(), flatten=True)
+    text = PdfReader(io.BytesIO(pdf)).pages[0].extract_text()
+    assert "100 (Gr. M)" in text
+
+
+def test_dates_of_the_other_forms(templates, make_order):
+    today = datetime.now()
+    value, _ = field_appearance(server.generate_bestellformular_pdf(make_order()), "DATUM")
+    assert value == today.strftime("%d.%m.%Y")
+
+    value, _ = field_appearance(server.generate_wechsel_pdf(make_order()), "txt_ort_datum")
+    assert value == f"Berlin, {today.strftime('%d.%m.%Y')}"
+
+
+@pytest.mark.parametrize("today, start", [
+    (datetime(2026, 10, 17), "01.11.2026"),
+    (datetime(2026, 12, 31), "01.01.2027"),
+])
+def test_supply_starts_next_month(make_order, today, start):
+    context = server.FormContext(make_order(), (), today)
+    assert server._supply_start(context) == start
+
+
+STAMP = re.compile(r"q ([\d.]+) 0 0 ([\d.]+) ([\d.]+) ([\d.]+) cm (/Sig_\w+) Do Q")
+
+
+@pytest.mark.parametrize("template, field, render", [
+    ("main", "Image1", server.generate_filled_pdf),
+    ("wechsel", "sig_unterschrift", server.generate_wechsel_pdf),
+])
+@pytest.mark.parametrize("flatten", [False, True])
+def test_signature_is_stamped_into_its_field(templates, make_order, signature, template, field, render, flatten):
+    widget, _ = templates.get(template).compiled.signature
+    assert widget.name == field
+    insurance = make_order().insurance.model_copy(update={"signature_insured": signature()})
+    page = PdfReader(io.BytesIO(render(make_order(insurance=insurance), flatten=flatten))).pages[widget.page]
+
+    content = b"".join(part.get_object().get_data() for part in page["/Contents"]).decode("latin-1")
+    [(width, height, x, y, name)] = STAMP.findall(content)
+    assert name == f"/Sig_{field}"
+    image = page["/Resources"]["/XObject"][name].get_object()
+    assert image["/Subtype"] == "/Image" and "/SMask" in image
+
+    # Fitted into the rectangle, keeping the aspect ratio, centered
+    width, height, x, y = (float(v) for v in (width, height, x, y))
+    x1, y1, x2, y2 = widget.rect
+    assert width / height == pytest.approx(image["/Width"] / image["/Height"], rel=1e-3)
+    assert x1 <= x and x + width <= x2 + 1e-3 and y1 <= y and y + height <= y2 + 1e-3
+    assert width == pytest.approx(x2 - x1, abs=1e-3) or height == pytest.approx(y2 - y1, abs=1e-3)
+    assert x - x1 == pytest.approx(x2 - x - width, abs=1e-3)
+    assert y - y1 == pytest.approx(y2 - y - height, abs=1e-3)
+    if flatten:
+        assert "/AcroForm" not in page.pdf.trailer["/Root"]
@@ -0,0 +1,92 @@
+import dataclasses
+import os
+import shutil
+
+import pytest
+
+import server
+
+MAPPINGS = [
+    ("main", server.PDF_MAIN, server.prepare_main_template, server.MAIN_FORM),
+    ("bestellung", server.PDF_ORDER, None, server.ORDER_FORM),
+    ("wechsel", server.PDF_WECHSEL, None, server.WECHSEL_FORM),
+]
+
+
+def registry(name, path, prepare, mapping) -> server.TemplateRegistry:
+    templates = server.TemplateRegistry()
+    templates.register(name, path, prepare=prepare, mapping=mapping)
+    return templates
+
+
+@pytest.mark.parametrize("name, path, prepare, mapping", MAPPINGS)
+def test_missing_field_fails_when_the_template_is_loaded(name, path, prepare, mapping):
+    broken = dataclasses.replace(mapping, fields={**mapping.fields, "gibt_es_nicht": lambda c: "x"})
+    with pytest.raises(ValueError, match=f"template {name} does not match the PDF: gibt_es_nicht does not exist"):
+        registry(name, path, prepare, broken).load_all()
+
+
+@pytest.mark.parametrize("name, path, prepare, mapping", MAPPINGS)
+def test_shipped_mappings_match_their_templates(name, path, prepare, mapping):
+    template = registry(name, path, prepare, mapping).get(name)
+    assert template.compiled is not None and template.version
+
+
+def test_every_mismatch_is_reported():
+    _, path, _, mapping = MAPPINGS[1]
+    [first, *rest] = mapping.rows.fields
+    broken = dataclasses.replace(
+        mapping,
+        fields={**mapping.fields, "K_FEHLT": lambda c: ""},
+        rows=dataclasses.replace(mapping.rows, fields=((*first, "POS_99"), *rest)),
+        signature=server.FormSignature("K_AUCH_NICHT", lambda order: None),
+    )
+    with pytest.raises(ValueError) as error:
+        registry("bestellung", path, None, broken).load_all()
+    message = str(error.value)
+    for problem in ("K_FEHLT does not exist", "POS_99 does not exist", "rows differ in length", "K_AUCH_NICHT"):
+        assert problem in message
+
+
+def touch(path, offset: int):
+    """Change the file and move its mtime, as a deployment replacing it would"""
+    with path.open("ab") as file:
+        file.write(b"\n%% changed\n")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset * 1_000_000_000))
+
+
+def test_changed_template_is_reloaded_after_the_check_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "TEMPLATE_CHECK_INTERVAL", 60)
+    path = tmp_path / "bestellformular.pdf"
+    shutil.copy(server.PDF_ORDER, path)
+    templates = registry("bestellung", path, None, server.ORDER_FORM)
+    loaded = templates.get("bestellung")
+    version = loaded.version
+
+    touch(path, 1)
+    # Within the interval the file is not looked at
+    assert templates.get("bestellung").version == version
+    assert templates.version("bestellung") == version
+
+    loaded.checked_at -= 60
+    assert templates.get("bestellung").version != version
+    version = loaded.version
+
+    touch(path, 2)
+    assert templates.reload_changed() == ["bestellung"]
+    assert templates.version("bestellung") != version
+    assert templates.reload_changed() == []
+
+
+def test_templates_are_not_checked_with_interval_zero(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "TEMPLATE_CHECK_INTERVAL", 0)
+    path = tmp_path / "bestellformular.pdf"
+    shutil.copy(server.PDF_ORDER, path)
+    templates = registry("bestellung", path, None, server.ORDER_FORM)
+    template = templates.get("bestellung")
+    version = template.version
+
+    touch(path, 1)
+    template.checked_at -= 3600
+    assert templates.get("bestellung").version == version
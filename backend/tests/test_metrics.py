@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+def parse(text: str):
+    """Types and sample values of a Prometheus text exposition; fails on malformed lines"""
+    assert text.endswith("\n")
+    types, values = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        values[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return types, values
+
+
+async def scrape(client):
+    response = await client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return parse(response.text)
+
+
+async def test_exposition_format_and_types(client):
+    types, values = await scrape(client)
+    for name in ("pdf_cache_hits_total", "pdf_cache_misses_total", "smtp_connections_opened_total"):
+        assert types[name] == "counter"
+        assert name in values
+    assert types["pdf_stage_seconds"] == "histogram"
+    assert types["pdf_renders_in_flight"] == "gauge"
+
+
+async def test_counters_go_up(client, db, make_order):
+    order = make_order()
+    await db.orders.insert_one(server.order_document(order))
+    _, before = await scrape(client)
+
+    for _ in range(2):  # rendered, then served from the cache
+        assert (await client.get(f"/api/orders/{order.id}/pdf")).status_code == 200
+    types, after = await scrape(client)
+
+    assert after["pdf_cache_misses_total"] > before["pdf_cache_misses_total"]
+    assert after["pdf_cache_hits_total"] > before["pdf_cache_hits_total"]
+    rendered = 'pdf_documents_total{pdf_type="main",source="rendered"}'
+    cached = 'pdf_documents_total{pdf_type="main",source="cache"}'
+    assert after[rendered] == before.get(rendered, 0) + 1
+    assert after[cached] == before.get(cached, 0) + 1
+
+    # Histogram buckets are cumulative and end in the count
+    series = '{pdf_type="main",stage="render"}'
+    prefix = "pdf_stage_seconds_bucket" + series[:-1]
+    buckets = [value for name, value in after.items() if name.startswith(prefix)]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == after[f"pdf_stage_seconds_count{series}"] >= 2
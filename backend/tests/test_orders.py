@@ -0,0 +1,144 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_idempotency_key_replays_the_first_order(client, db, order_payload):
+    headers = {"Idempotency-Key": "checkout-1"}
+    first = await client.post("/api/orders", json=order_payload(), headers=headers)
+    again = await client.post("/api/orders", json=order_payload(), headers=headers)
+
+    assert first.status_code == again.status_code == 200
+    # The replay reads the stored order, whose pdf_status moved on after the pre-render
+    assert {**again.json(), "pdf_status": None} == {**first.json(), "pdf_status": None}
+    assert again.json()["pdf_status"] == "rendered"
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert await db.orders.count_documents({}) == 1
+    assert set(first.json()) == {"id", "created_at", "total", "pdf_status"}
+
+
+async def test_idempotency_key_of_another_order_is_rejected(client, db, order_payload):
+    headers = {"Idempotency-Key": "checkout-2"}
+    await client.post("/api/orders", json=order_payload(), headers=headers)
+    other = await client.post("/api/orders", json=order_payload(versichertennummer="B987654321"), headers=headers)
+
+    assert other.status_code == 422
+    assert await db.orders.count_documents({}) == 1
+
+
+async def test_rejected_order_releases_the_idempotency_key(client, db, order_payload):
+    headers = {"Idempotency-Key": "checkout-3"}
+    rejected = await client.post("/api/orders", json=order_payload(consent2=False), headers=headers)
+    assert rejected.status_code == 400
+    assert await db.idempotency_keys.count_documents({}) == 0
+
+
+async def test_bulk_create_reports_duplicates(client, db, order_payload):
+    rows = [
+        {**order_payload(), "client_key": "row-1"},
+        {**order_payload(), "client_key": "row-2"},
+        {**order_payload(), "client_key": "row-1"},  # repeated within the batch
+        {**order_payload(consent1=False), "client_key": "row-3"},
+    ]
+    first = (await client.post("/api/orders/bulk", json=rows)).json()
+    assert [r["status"] for r in first["results"]] == ["created", "created", "duplicate", "rejected"]
+    assert (first["created"], first["duplicates"], first["rejected"]) == (2, 1, 1)
+    assert "Zeile 0" in first["results"][2]["detail"]
+
+    # Sending the batch again creates nothing and points at the stored orders
+    again = (await client.post("/api/orders/bulk", json=rows[:2])).json()
+    assert [r["status"] for r in again["results"]] == ["duplicate", "duplicate"]
+    assert [r["id"] for r in again["results"]] == [r["id"] for r in first["results"][:2]]
+    assert await db.orders.count_documents({}) == 2
+
+
+async def test_bulk_batch_key_derives_client_keys(client, db, order_payload):
+    rows = [order_payload(), order_payload()]
+    first = (await client.post("/api/orders/bulk", params={"batch_key": "import-7"}, json=rows)).json()
+    again = (await client.post("/api/orders/bulk", params={"batch_key": "import-7"}, json=rows)).json()
+
+    assert [r["client_key"] for r in first["results"]] == ["import-7:0", "import-7:1"]
+    assert again["duplicates"] == 2
+    assert await db.orders.count_documents({}) == 2
+
+
+async def test_keyset_pagination_visits_every_order_once(client, db, make_order):
+    start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    docs = []
+    for n in range(11):
+        # Pairs of orders share a timestamp, so the id has to break the tie
+        order = make_order(id=str(uuid.uuid4()), created_at=start + timedelta(minutes=n // 2))
+        docs.append(server.order_document(order))
+    await db.orders.insert_many([dict(doc) for doc in docs])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/api/orders", params=params)).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    expected = sorted(docs, key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+    assert [item["id"] for item in seen] == [doc["id"] for doc in expected]
+    assert all("signature_insured" not in item["insurance"] for item in seen)
+
+
+async def test_keyset_pagination_with_filter_and_fields(client, db, make_order):
+    start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    for n in range(6):
+        order = make_order(created_at=start + timedelta(days=n))
+        if n % 2:
+            order.insurance.krankenkasse = "TK"
+        await db.orders.insert_one(server.order_document(order))
+
+    params = {"limit": 2, "krankenkasse": "TK", "fields": "total"}
+    page = (await client.get("/api/orders", params=params)).json()
+    assert len(page["items"]) == 2
+    assert set(page["items"][0]) == {"id", "created_at", "total"}
+    rest = (await client.get("/api/orders", params={**params, "cursor": page["next_cursor"]})).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+
+    invalid = await client.get("/api/orders", params={"cursor": "kaputt"})
+    assert invalid.status_code == 400
+
+
+async def test_single_order_returns_the_requested_fields(client, db, order_payload):
+    order_id = (await client.post("/api/orders", json=order_payload())).json()["id"]
+
+    full = (await client.get(f"/api/orders/{order_id}")).json()
+    assert full["customer"]["nachname"] == "Mustermann"
+    assert "signature_insured" not in full["insurance"]
+
+    response = await client.get(f"/api/orders/{order_id}", params={"fields": "customer.nachname,total,insurance"})
+    assert response.status_code == 200
+    order = response.json()
+    # id and created_at always come along
+    assert set(order) == {"id", "created_at", "customer", "total", "insurance"}
+    assert order["customer"] == {"nachname": "Mustermann"}
+    assert order["insurance"]["krankenkasse"] == "AOK Nordost"
+    assert "signature_insured" not in order["insurance"]
+
+
+@pytest.mark.parametrize("fields", ["passwort", "customer.passwort", "insurance.signature_insured"])
+async def test_unknown_fields_are_rejected(client, db, order_payload, fields):
+    order_id = (await client.post("/api/orders", json=order_payload())).json()["id"]
+    response = await client.get(f"/api/orders/{order_id}", params={"fields": fields})
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Unbekanntes Feld: {fields}"
+
+
+async def test_order_creation_documents_the_summary(client, order_payload):
+    operation = server.app.openapi()["paths"]["/api/orders"]["post"]
+    schema = operation["responses"]["200"]["content"]["application/json"]["schema"]
+    assert schema == {"$ref": "#/components/schemas/OrderSummary"}
+
+    created = await client.post("/api/orders", json=order_payload(), params={"fields": "id,customer.vorname"})
+    assert created.json() == {"id": created.json()["id"], "customer": {"vorname": "Erika"}}
@@ -0,0 +1,38 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cache_evicts_the_least_recently_used_by_bytes():
+    cache = server.RenderedPdfCache(max_bytes=250)
+    for key in ("a", "b"):
+        await cache.put(key, b"x" * 100)
+    assert await cache.get("a") is not None  # "b" is now the oldest
+
+    await cache.put("c", b"x" * 100)
+    assert cache.size == 200
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None and await cache.get("c") is not None
+
+    # Replacing an entry counts its new size only
+    await cache.put("a", b"x" * 150)
+    assert (cache.size, list(cache._entries)) == (250, ["c", "a"])
+
+
+async def test_documents_larger_than_the_budget_are_not_kept():
+    cache = server.RenderedPdfCache(max_bytes=100)
+    await cache.put("small", b"x" * 60)
+    await cache.put("large", b"x" * 101)
+    assert await cache.get("large") is None
+    assert await cache.get("small") is not None
+    assert cache.size == 60
+
+
+def test_cache_key_does_not_touch_the_template_files(templates, monkeypatch):
+    key = server.RenderedPdfCache.key("order-1", "all")
+    for name in templates.names():
+        monkeypatch.setattr(templates._templates[name], "path", server.PDF_DIR / "fehlt.pdf")
+    assert server.RenderedPdfCache.key("order-1", "all") == key
+    assert server.RenderedPdfCache.key("order-1", "all", flatten=True) != key
@@ -0,0 +1,90 @@
+import asyncio
+import io
+import tempfile
+import zipfile
+
+import pytest
+import pypdf
+from pypdf import PdfReader
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    """An empty directory that the tempfile module hands out"""
+    directory = tmp_path / "tmp"
+    directory.mkdir()
+    monkeypatch.setenv("TMPDIR", str(directory))
+    monkeypatch.setattr(tempfile, "tempdir", str(directory))
+    return directory
+
+
+async def test_pdf_requests_leave_no_temp_files(client, temp_dir, order_payload):
+    response = await client.post("/api/orders", json=order_payload())
+    order_id = response.json()["id"]
+
+    for params in ({"pdf_type": "main"}, {"pdf_type": "wechsel", "flatten": "true"}, {"pdf_type": "all"}):
+        response = await client.get(f"/api/orders/{order_id}/pdf", params=params)
+        assert response.status_code == 200
+        assert list(temp_dir.iterdir()) == []
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as bundle:
+        names = bundle.namelist()
+        assert len(names) == 3
+        for name in names:
+            assert len(PdfReader(io.BytesIO(bundle.read(name))).pages) > 0
+
+
+def field_values(pdf: bytes) -> dict:
+    return {name: field.get("/V") for name, field in PdfReader(io.BytesIO(pdf)).get_fields().items()}
+
+
+def test_incremental_writes_fill_the_same_fields(templates, make_order, monkeypatch):
+    order = make_order()
+    full = server.generate_filled_pdf(order)
+    monkeypatch.setattr(server, "INCREMENTAL_WRITES", True)
+    incremental = server.generate_filled_pdf(order)
+
+    assert field_values(incremental) == field_values(full)
+    # The template bytes stay in front, the filled fields follow as an update
+    assert incremental.count(b"%%EOF") > full.count(b"%%EOF")
+
+
+@pytest.mark.parametrize(
+    "version, supported", [("6.7.3", True), ("6.0.0", True), ("7.0.0", False), ("5.9.0", False), ("dev", False)],
+)
+def test_incremental_writes_need_a_tested_pypdf(monkeypatch, version, supported):
+    monkeypatch.setattr(pypdf, "__version__", version)
+    assert server._pypdf_incremental_supported() is supported
+
+
+async def test_zip_entries_keep_their_order():
+    async def bundle(finish_order):
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(3)]
+        stream = server.stream_zip([(f"{n}.pdf", future) for n, future in enumerate(futures)])
+        for n in finish_order:
+            futures[n].set_result(f"document {n}".encode() * 100)
+        return b"".join([chunk async for chunk in stream])
+
+    first, second = await bundle([2, 0, 1]), await bundle([1, 2, 0])
+    assert first == second  # the response carries a strong ETag
+    with zipfile.ZipFile(io.BytesIO(first)) as archive:
+        assert archive.namelist() == ["0.pdf", "1.pdf", "2.pdf"]
+
+
+async def test_etag_is_checked_after_the_order_lookup(client, db, make_order):
+    order = make_order()
+    await db.orders.insert_one(server.order_document(order))
+    response = await client.get(f"/api/orders/{order.id}/pdf")
+    etag = response.headers["ETag"]
+
+    again = await client.get(f"/api/orders/{order.id}/pdf", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+    await db.orders.delete_one({"id": order.id})
+    gone = await client.get(f"/api/orders/{order.id}/pdf", headers={"If-None-Match": etag})
+    assert gone.status_code == 404
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def stored_document(db, order_id: str, doc_type: str, data: bytes, rendered_on: str):
+    await db.order_documents.insert_one({
+        "order_id": order_id, "doc_type": doc_type, "data": data, "render_date": rendered_on,
+        "template_version": server.pdf_templates.version(doc_type),
+    })
+
+
+async def test_prerendered_documents_are_stored_with_their_date(db, render_pool, make_order):
+    order = make_order()
+    await db.orders.insert_one(server.order_document(order))
+    await server.prerender_order(order)
+
+    stored = await db.order_documents.find({"order_id": order.id}).to_list(None)
+    assert sorted(doc["doc_type"] for doc in stored) == ["bestellung", "main", "wechsel"]
+    assert {doc["render_date"] for doc in stored} == {server.render_date()}
+    assert (await db.orders.find_one({"id": order.id}))["pdf_status"] == "rendered"
+
+
+async def test_documents_of_today_are_served_as_stored(db, render_pool, make_order):
+    order = make_order()
+    await stored_document(db, order.id, "bestellung", b"%PDF-stored", server.render_date())
+
+    [future] = await server.render_order_documents(order, ["bestellung"])
+    assert await future == b"%PDF-stored"
+
+
+async def test_documents_of_earlier_days_are_rendered_again(db, render_pool, make_order):
+    order = make_order()
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    await stored_document(db, order.id, "bestellung", b"%PDF-stale", yesterday)
+    await stored_document(db, order.id, "main", b"%PDF-undated", None)
+
+    futures = await server.render_order_documents(order, ["bestellung", "main"])
+    for data in [await future for future in futures]:
+        assert data.startswith(b"%PDF-1.")
+        assert data not in (b"%PDF-stale", b"%PDF-undated")
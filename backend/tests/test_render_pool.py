@@ -0,0 +1,51 @@
+import asyncio
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def process_pool(monkeypatch, templates, pdf_cache):
+    pool = server.PdfRenderPool("process", 1, 4, 60)
+    await pool.start()
+    monkeypatch.setattr(server, "pdf_render_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+async def test_process_pool_renders_the_same_fields(process_pool, make_order):
+    order = make_order()
+    data, report = await process_pool.run(server.render_document, "main", order)
+
+    fields = PdfReader(io.BytesIO(data)).get_fields()
+    expected = PdfReader(io.BytesIO(server.generate_filled_pdf(order))).get_fields()
+    assert {name: field.get("/V") for name, field in fields.items()} == {
+        name: field.get("/V") for name, field in expected.items()
+    }
+    if server.METRICS_ENABLED:
+        assert {"clone", "fields", "write"} <= set(report["stages"])
+        assert report["failures"] == {}
+
+
+async def test_process_pool_serves_api_documents(db, process_pool, make_order):
+    order = make_order()
+    await db.orders.insert_one(server.order_document(order))
+
+    futures = await server.render_order_documents(order, server.order_document_types(order), signatures_loaded=False)
+    documents = await asyncio.gather(*futures)
+    assert [len(PdfReader(io.BytesIO(data)).pages) > 0 for data in documents] == [True] * 3
+    assert process_pool.pending == 0
+
+
+async def test_full_queue_is_rejected(process_pool, make_order):
+    order = make_order()
+    futures = process_pool.submit_all([(server.render_document, "main", order)] * process_pool.queue_limit)
+    with pytest.raises(server.RenderPoolSaturated):
+        process_pool.submit(server.render_document, "main", order)
+    await asyncio.gather(*futures)
+    assert process_pool.pending == 0
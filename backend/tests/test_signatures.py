@@ -0,0 +1,101 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def data_url(image: Image.Image, format: str = "PNG") -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return f"data:image/{format.lower()};base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.mark.parametrize("value, reason", [
+    ("data:text/plain;base64,aGFsbG8=", "kein Bild"),
+    ("data:image/png;base64,kein base64!", "ungültige Base64-Daten"),
+    ("data:image/png;base64," + base64.b64encode(b"kein PNG").decode(), "Bild nicht lesbar"),
+    (data_url(Image.new("RGBA", (300, 100), (0, 0, 0, 0))), "leere Unterschrift"),
+    (data_url(Image.new("RGB", (300, 100), "white")), "leere Unterschrift"),
+])
+def test_malformed_and_empty_signatures_are_rejected(value, reason):
+    with pytest.raises(server.InvalidSignature, match=reason):
+        server.normalize_signature(value)
+
+
+def test_oversized_signatures_are_rejected(monkeypatch, signature):
+    monkeypatch.setattr(server, "SIGNATURE_MAX_UPLOAD", 64)
+    with pytest.raises(server.InvalidSignature, match="Bild zu groß"):
+        server.normalize_signature(signature())
+
+    monkeypatch.setattr(server, "SIGNATURE_MAX_UPLOAD", 2 * 1024 * 1024)
+    monkeypatch.setattr(server, "SIGNATURE_MAX_PIXELS", 300 * 100 - 1)
+    with pytest.raises(server.InvalidSignature, match="Bild zu groß"):
+        server.normalize_signature(signature())
+
+
+def test_signature_is_cropped_to_the_ink(signature):
+    png = server.normalize_signature(signature())
+    image = Image.open(io.BytesIO(png))
+    assert image.mode == "LA"
+    assert image.width < 300 and image.height < 100
+    # Ink on white without transparency gives the same stroke
+    drawn = Image.open(io.BytesIO(base64.b64decode(signature().partition(",")[2])))
+    opaque = Image.new("RGB", drawn.size, "white")
+    opaque.paste(drawn, mask=drawn)
+    assert Image.open(io.BytesIO(server.normalize_signature(data_url(opaque)))).size == image.size
+
+
+async def test_same_signature_is_stored_once(db, signature):
+    png = server.normalize_signature(signature())
+    first = await server.store_signature(png)
+    second = await server.store_signature(server.normalize_signature(signature()))
+
+    assert first == second == "sha256:" + server.hashlib.sha256(png).hexdigest()
+    assert await db.signatures.count_documents({}) == 1
+    assert (await db.signatures.find_one({"_id": first}))["data"] == png
+
+
+async def test_orders_share_the_stored_signature(client, db, order_payload):
+    for number in range(2):
+        payload = order_payload(versichertennummer=f"A00000000{number}")
+        assert (await client.post("/api/orders", json=payload)).status_code == 200
+
+    refs = {doc["insurance"]["signature_insured"] async for doc in db.orders.find({})}
+    assert len(refs) == 1 and refs.pop().startswith(server.SIGNATURE_REF_PREFIX)
+    assert await db.signatures.count_documents({}) == 1
+
+
+async def test_inline_signatures_are_migrated_in_batches(db, make_order, signature):
+    inline = signature()
+
+    def signed(**signatures):
+        return make_order(insurance=make_order().insurance.model_copy(update=signatures))
+
+    orders = [
+        signed(signature_insured=inline),
+        signed(signature_insured=inline, signature_care=inline),
+        signed(signature_insured="data:image/png;base64,AAAA"),
+        make_order(),
+    ]
+    await db.orders.insert_many([server.order_document(order) for order in orders])
+    batches = []
+
+    stats = await server.migrate_signatures(batch_size=2, progress=lambda st: batches.append(dict(st)))
+    assert stats == {"orders": 2, "signatures": 3, "invalid": 1}
+    assert len(batches) == 2
+
+    ref = server.signature_ref(server.normalize_signature(inline))
+    migrated = {doc["id"]: doc["insurance"] async for doc in db.orders.find({}, {"_id": 0})}
+    assert migrated[orders[0].id]["signature_insured"] == ref
+    assert migrated[orders[1].id]["signature_insured"] == migrated[orders[1].id]["signature_care"] == ref
+    assert migrated[orders[2].id]["signature_insured"] == "data:image/png;base64,AAAA"  # left for a manual look
+    assert migrated[orders[3].id]["signature_insured"] == ""
+    assert await db.signatures.count_documents({}) == 1
+
+    # A second run finds nothing left to move
+    assert await server.migrate_signatures() == {"orders": 0, "signatures": 0, "invalid": 1}
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def startup_state(monkeypatch):
+    state = server.StartupState()
+    monkeypatch.setattr(server, "startup_state", state)
+    return state
+
+
+@pytest.fixture
+def services(monkeypatch, db, templates):
+    """What the startup brings up, without SMTP and with a thread render pool"""
+    monkeypatch.setattr(server, "pdf_render_pool", server.PdfRenderPool("thread", 1, 4, 30))
+    monkeypatch.setattr(server, "email_outbox", server.EmailOutbox())
+    monkeypatch.setattr(server, "SMTP_HOST", "")
+    monkeypatch.setattr(server, "background_tasks", set())
+    yield
+    for task in [*server.background_tasks, *server.export_tasks]:
+        task.cancel()
+    server.pdf_render_pool.shutdown()
+
+
+async def test_ready_after_every_phase(client, startup_state, services):
+    response = await client.get("/api/ready")
+    assert (response.status_code, response.json()["detail"]) == (503, "Dienst wird gestartet")
+
+    await server.startup()
+    response = await client.get("/api/ready")
+    assert response.status_code == 200
+    phases = response.json()["startup_ms"]
+    # templates and mongo run side by side, so only the set is fixed
+    assert set(phases) == {"templates", "mongo", "indexes", "render_pool", "email_outbox", "warm"}
+    assert all(isinstance(ms, float) and ms >= 0 for ms in phases.values())
+
+
+async def test_phase_timings(startup_state):
+    await startup_state.run("slow", asyncio.sleep(0.05))
+    await startup_state.run("fast", asyncio.sleep(0))
+    assert startup_state.phases["slow"] >= 50
+    assert startup_state.phases["fast"] < startup_state.phases["slow"]
+    assert startup_state.failed is None
+
+
+async def test_failed_phase_keeps_the_service_unready(client, startup_state):
+    async def broken():
+        raise RuntimeError("MongoDB not reachable")
+
+    with pytest.raises(RuntimeError):
+        await startup_state.run("mongo", broken())
+    assert startup_state.failed == "mongo: MongoDB not reachable"
+    assert "mongo" not in startup_state.phases
+    assert (await client.get("/api/ready")).status_code == 503
+
+
+async def test_ready_needs_the_database(client, startup_state, monkeypatch):
+    startup_state.ready = True
+
+    async def unreachable(timeout):
+        raise RuntimeError("MongoDB did not answer")
+
+    monkeypatch.setattr(server, "ping_mongo", unreachable)
+    response = await client.get("/api/ready")
+    assert (response.status_code, response.json()["detail"]) == (503, "Datenbank nicht erreichbar")
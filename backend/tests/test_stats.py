@@ -0,0 +1,54 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def rollups(db) -> list:
+    return await db.order_stats_daily.find({}).sort("_id", 1).to_list(None)
+
+
+async def test_single_orders_update_the_daily_rollup(client, order_payload):
+    first = (await client.post("/api/orders", json=order_payload())).json()
+    # "." cannot be part of a field name, the rollup stores a stand-in
+    second = (await client.post("/api/orders", json=order_payload(krankenkasse="BKK v.d. Firma"))).json()
+
+    stats = (await client.get("/api/stats")).json()
+    totals = stats["totals"]
+    assert totals["orders"] == 2
+    assert totals["revenue"] == pytest.approx(first["total"] + second["total"])
+    assert totals["budget"] == 2 * server.BUDGET_LIMIT
+    assert totals["products"] == {"gloves": 2, "pads": 2}
+    assert totals["kassen"] == {"AOK Nordost": 1, "BKK v.d. Firma": 1}
+    [day] = stats["days"]
+    assert day["date"] == stats["date_to"] and day["orders"] == 2
+
+
+async def test_replays_and_duplicates_are_counted_once(client, db, order_payload):
+    headers = {"Idempotency-Key": "stats-1"}
+    for _ in range(2):
+        assert (await client.post("/api/orders", json=order_payload(), headers=headers)).status_code == 200
+
+    rows = [{**order_payload(), "client_key": key} for key in ("row-1", "row-2", "row-1")]
+    for _ in range(2):
+        await client.post("/api/orders/bulk", json=rows)
+
+    [day] = await rollups(db)
+    assert await db.orders.count_documents({}) == 3
+    assert day["orders"] == 3
+    assert day["products"] == {"gloves": 3, "pads": 3}
+
+
+async def test_backfill_matches_the_live_counters(client, db, order_payload):
+    await client.post("/api/orders", json=order_payload())
+    await client.post("/api/orders", json=order_payload(krankenkasse="BKK v.d. Firma"))
+    await client.post("/api/orders/bulk", json=[{**order_payload(), "client_key": "row-1"}])
+    live = await rollups(db)
+    # A day without orders left behind by an earlier run is removed
+    stale = {"_id": "2000-01-01", "orders": 1, "revenue_cents": 100, "budget_cents": 4200}
+    await db.order_stats_daily.insert_one(stale)
+
+    result = await server.backfill_order_stats(batch_size=2)
+    assert result == {"orders": 3, "days": 1}
+    assert await rollups(db) == live
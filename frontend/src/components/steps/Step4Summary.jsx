@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useOrder } from '../../context/OrderContext';
 import { Button } from '../ui/button';
 import { cn } from '../../lib/utils';
@@ -13,6 +13,10 @@ export const Step4Summary = () => {
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [orderId, setOrderId] = useState(null);
   const [isDownloading, setIsDownloading] = useState({});
+  // One key per summary screen: double clicks and retries return the same order
+  const idempotencyKey = useRef(
+    window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
 
   const customer = state.customer;
   const insurance = state.insurance;
@@ -65,7 +69,9 @@ export const Step4Summary = () => {
         extra_washable: state.extraWashable,
       };
 
-      const response = await axios.post(`${API}/orders`, orderData);
+      const response = await axios.post(`${API}/orders`, orderData, {
+        headers: { 'Idempotency-Key': idempotencyKey.current },
+      });
       setOrderId(response.data.id);
       dispatch({ type: 'SET_ORDER_ID', payload: response.data.id });
       toast.success('Bestellung erfolgreich erstellt!');
@@ -0,0 +1,143 @@
+/**
+ * Build-Schritt für die statischen Dateien des Konfigurators
+ * Start:  npm run build   (danach: STATIC_DIR=dist npm start)
+ *
+ * - kopiert index.html und die Assets (SVGs, PDFs, CSS) nach dist/
+ * - Assets bekommen zusätzlich einen Content-Hash im Namen (gloves.1a2b3c4d.svg),
+ *   Verweise in den HTML-Dateien zeigen auf die gehashten Namen
+ * - legt neben jede komprimierbare Datei eine .br- und .gz-Variante
+ * - komprimiert den React-Build (frontend/build) an Ort und Stelle, falls vorhanden
+ * - gibt einen Bericht über die eingesparte Übertragungsgröße aus (dist/precompress-report.json)
+ */
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const ROOT = __dirname;
+const DIST = path.join(ROOT, 'dist');
+const REACT_BUILD = path.join(ROOT, 'frontend', 'build');
+
+const PAGES = ['index.html'];
+const ASSET_PATTERN = /\.(svg|pdf|css)$/i;
+const COMPRESSIBLE = /\.(html|css|js|mjs|json|map|svg|txt|xml|pdf)$/i;
+// Varianten, die weniger als 10 % sparen, lohnen den zusätzlichen Request-Pfad nicht
+const MIN_SAVING = 0.1;
+
+function contentHash(data) {
+  return crypto.createHash('sha256').update(data).digest('hex').slice(0, 8);
+}
+
+function hashedName(name, data) {
+  const ext = path.extname(name);
+  return `${path.basename(name, ext)}.${contentHash(data)}${ext}`;
+}
+
+function escapeRegExp(text) {
+  return text.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+}
+
+function walk(dir) {
+  return fs.readdirSync(dir, { withFileTypes: true }).flatMap((entry) => {
+    const full = path.join(dir, entry.name);
+    return entry.isDirectory() ? walk(full) : [full];
+  });
+}
+
+function compress(file) {
+  const data = fs.readFileSync(file);
+  const sizes = { file, raw: data.length, gzip: null, brotli: null };
+  if (!COMPRESSIBLE.test(file)) return sizes;
+
+  const gzip = zlib.gzipSync(data, { level: zlib.constants.Z_BEST_COMPRESSION });
+  const brotli = zlib.brotliCompressSync(data, {
+    params: {
+      [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+      [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  });
+  for (const [key, suffix, variant] of [['gzip', '.gz', gzip], ['brotli', '.br', brotli]]) {
+    if (variant.length <= data.length * (1 - MIN_SAVING)) {
+      fs.writeFileSync(file + suffix, variant);
+      sizes[key] = variant.length;
+    } else {
+      fs.rmSync(file + suffix, { force: true });
+    }
+  }
+  return sizes;
+}
+
+function buildKonfigurator() {
+  fs.rmSync(DIST, { recursive: true, force: true });
+  fs.mkdirSync(DIST, { recursive: true });
+
+  const manifest = {};
+  for (const name of fs.readdirSync(ROOT).filter((n) => ASSET_PATTERN.test(n)).sort()) {
+    const data = fs.readFileSync(path.join(ROOT, name));
+    manifest[name] = hashedName(name, data);
+    // Der ungehashte Name bleibt für externe Links erhalten
+    fs.writeFileSync(path.join(DIST, name), data);
+    fs.writeFileSync(path.join(DIST, manifest[name]), data);
+  }
+
+  for (const page of PAGES) {
+    let html = fs.readFileSync(path.join(ROOT, page), 'utf8');
+    for (const [name, hashed] of Object.entries(manifest)) {
+      // nur echte Verweise: "gloves.svg", './wechsel.pdf', url(gloves.svg)
+      html = html.replace(new RegExp(`(?<=["'(/])${escapeRegExp(name)}(?=["')?#])`, 'g'), hashed);
+    }
+    fs.writeFileSync(path.join(DIST, page), html);
+  }
+  fs.writeFileSync(path.join(DIST, 'manifest.json'), JSON.stringify(manifest, null, 2));
+
+  const rows = walk(DIST).filter((f) => !/\.(br|gz)$/.test(f)).map(compress);
+  // Die ungehashten Kopien sind derselbe Inhalt und zählen im Bericht nicht doppelt
+  const copies = new Set(Object.keys(manifest).map((name) => path.join(DIST, name)));
+  return rows.filter((row) => !copies.has(row.file));
+}
+
+function buildReact() {
+  if (!fs.existsSync(REACT_BUILD)) return [];
+  return walk(REACT_BUILD).filter((f) => !/\.(br|gz)$/.test(f)).map(compress);
+}
+
+function formatKb(bytes) {
+  return bytes === null ? '-' : `${(bytes / 1024).toFixed(1)} KB`;
+}
+
+function report(rows) {
+  // Source Maps lädt nur das Entwicklerwerkzeug des Browsers
+  rows = rows.filter((row) => !row.file.endsWith('.map'));
+  const best = (row) => Math.min(row.raw, row.gzip ?? row.raw, row.brotli ?? row.raw);
+  const totals = rows.reduce(
+    (sum, row) => ({
+      raw: sum.raw + row.raw,
+      gzip: sum.gzip + (row.gzip ?? row.raw),
+      brotli: sum.brotli + best(row),
+    }),
+    { raw: 0, gzip: 0, brotli: 0 },
+  );
+
+  const width = Math.max(...rows.map((row) => path.relative(ROOT, row.file).length), 5);
+  console.log(`${'Datei'.padEnd(width)}  ${'roh'.padStart(10)}  ${'gzip'.padStart(10)}  ${'brotli'.padStart(10)}`);
+  for (const row of rows.filter((r) => r.gzip !== null || r.brotli !== null)) {
+    console.log(
+      `${path.relative(ROOT, row.file).padEnd(width)}  ${formatKb(row.raw).padStart(10)}  ` +
+        `${formatKb(row.gzip).padStart(10)}  ${formatKb(row.brotli).padStart(10)}`,
+    );
+  }
+  const saving = (size) => `${(100 * (1 - size / totals.raw)).toFixed(1)} %`;
+  console.log(
+    `\nGesamt: ${formatKb(totals.raw)} roh, ${formatKb(totals.gzip)} gzip (-${saving(totals.gzip)}), ` +
+      `${formatKb(totals.brotli)} brotli (-${saving(totals.brotli)})`,
+  );
+
+  return {
+    files: rows.map((row) => ({ ...row, file: path.relative(ROOT, row.file) })),
+    totals: { ...totals, gzip_saving: 1 - totals.gzip / totals.raw, brotli_saving: 1 - totals.brotli / totals.raw },
+  };
+}
+
+const rows = [...buildKonfigurator(), ...buildReact()];
+const result = report(rows);
+fs.writeFileSync(path.join(DIST, 'precompress-report.json'), JSON.stringify(result, null, 2));
@@ -1,67 +1,126 @@
 /**
- * Marina Pflegebox Konfigurator – Mail API (lokal/Server)
+ * Marina Pflegebox Konfigurator – Webserver (lokal/Server)
  * Start:  npm install  &&  npm start
  * Dann im Browser: http://localhost:3000
+ * Produktion: npm run build  &&  STATIC_DIR=dist npm start  (vorkomprimiert, Cache-Header)
  *
- * SMTP Zugangsdaten in .env setzen (siehe .env.example)
+ * /api/* (Bestellungen, PDFs, E-Mail-Versand) leitet der Server an das Python-Backend weiter:
+ * BACKEND_URL, Standard http://localhost:8001
  */
+const fs = require('fs');
+const http = require('http');
+const https = require('https');
 const path = require('path');
 const express = require('express');
-const nodemailer = require('nodemailer');
 
 const app = express();
 
-// JSON kann groß sein (Base64 PDF)
-app.use(express.json({ limit: '35mb' }));
+// Bodies werden unverändert durchgereicht, nicht als JSON geparst
+const BACKEND_URL = new URL(process.env.BACKEND_URL || 'http://localhost:8001');
+const BACKEND_CLIENT = BACKEND_URL.protocol === 'https:' ? https : http;
+const BACKEND_AGENT = new BACKEND_CLIENT.Agent({ keepAlive: true });
+const HOP_BY_HOP = new Set([
+  'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+  'te', 'trailer', 'transfer-encoding', 'upgrade',
+]);
 
-// Static Files (Konfigurator)
-app.use(express.static(__dirname, { extensions: ['html'] }));
+function endToEnd(headers) {
+  const kept = {};
+  for (const [name, value] of Object.entries(headers)) {
+    if (!HOP_BY_HOP.has(name)) kept[name] = value;
+  }
+  return kept;
+}
 
-app.post('/api/send-email', async (req, res) => {
-  try {
-    const { to, subject, text, filename, pdfBase64 } = req.body || {};
-    if (!to || !subject || !text || !filename || !pdfBase64) {
-      return res.status(400).json({ error: 'Fehlende Felder: to, subject, text, filename, pdfBase64' });
-    }
+// Streamt Anfrage und Antwort (z. B. PDF-ZIPs) ohne sie zu puffern
+function proxyToBackend(req, res) {
+  const headers = endToEnd(req.headers);
+  headers.host = BACKEND_URL.host;
+  headers['x-forwarded-for'] = [req.headers['x-forwarded-for'], req.socket.remoteAddress].filter(Boolean).join(', ');
+  const upstream = BACKEND_CLIENT.request({
+    hostname: BACKEND_URL.hostname,
+    port: BACKEND_URL.port,
+    method: req.method,
+    path: BACKEND_URL.pathname.replace(/\/$/, '') + (req.originalUrl || req.url),
+    headers,
+    agent: BACKEND_AGENT,
+  }, (response) => {
+    res.writeHead(response.statusCode, endToEnd(response.headers));
+    response.pipe(res);
+  });
+  upstream.on('error', (e) => {
+    console.error('backend proxy error:', e.message);
+    if (res.headersSent) return res.destroy(e);
+    res.writeHead(502, { 'Content-Type': 'application/json; charset=utf-8' });
+    res.end(JSON.stringify({ detail: 'Backend nicht erreichbar' }));
+  });
+  req.pipe(upstream);
+}
 
-    const host = process.env.SMTP_HOST;
-    const port = Number(process.env.SMTP_PORT || 587);
-    const user = process.env.SMTP_USER;
-    const pass = process.env.SMTP_PASS;
-    const secure = String(process.env.SMTP_SECURE || '').toLowerCase() === 'true';
-    const from = process.env.FROM_EMAIL || user;
+app.use('/api', proxyToBackend);
 
-    if (!host || !user || !pass || !from) {
-      return res.status(500).json({ error: 'SMTP nicht konfiguriert. Bitte .env prüfen.' });
-    }
+// Static Files (Konfigurator); STATIC_DIR=dist nach `npm run build` liefert vorkomprimierte Dateien
+const STATIC_DIR = path.resolve(process.env.STATIC_DIR || __dirname);
+const HASHED_ASSET = /\.[0-9a-f]{8,}\.[a-z0-9]+$/i;
+const ENCODINGS = [['br', '.br'], ['gzip', '.gz']];
 
-    const transporter = nodemailer.createTransport({
-      host,
-      port,
-      secure,
-      auth: { user, pass }
-    });
+function cacheControl(file) {
+  if (HASHED_ASSET.test(file)) return 'public, max-age=31536000, immutable';
+  if (file.endsWith('.html')) return 'public, max-age=60, must-revalidate';
+  return 'public, max-age=3600';
+}
 
-    await transporter.sendMail({
-      from,
-      to,
-      subject,
-      text,
-      attachments: [
-        {
-          filename,
-          content: Buffer.from(pdfBase64, 'base64'),
-          contentType: 'application/pdf'
-        }
-      ]
-    });
+function acceptedEncodings(header) {
+  const accepted = new Set();
+  for (const part of String(header || '').split(',')) {
+    const [name, ...params] = part.trim().toLowerCase().split(';');
+    const q = params.map((p) => p.trim()).find((p) => p.startsWith('q='));
+    if (name && (!q || Number(q.slice(2)) > 0)) accepted.add(name);
+  }
+  return accepted;
+}
 
-    return res.json({ ok: true });
-  } catch (e) {
-    console.error('send-email error:', e);
-    return res.status(500).json({ error: e && e.message ? e.message : 'Unbekannter Fehler' });
+async function exists(file) {
+  try {
+    return (await fs.promises.stat(file)).isFile();
+  } catch {
+    return false;
   }
-});
+}
+
+// Liefert file.br / file.gz, wenn der Build sie erzeugt hat und der Client sie akzeptiert
+async function precompressed(req, res, next) {
+  if (req.method !== 'GET' && req.method !== 'HEAD') return next();
+  let file;
+  try {
+    file = path.join(STATIC_DIR, decodeURIComponent(req.path));
+  } catch {
+    return next();
+  }
+  if (req.path.endsWith('/')) file = path.join(file, 'index.html');
+  if (!file.startsWith(STATIC_DIR + path.sep) || !(await exists(file))) return next();
+
+  const accepted = acceptedEncodings(req.headers['accept-encoding']);
+  let hasVariants = false;
+  for (const [encoding, suffix] of ENCODINGS) {
+    if (!(await exists(file + suffix))) continue;
+    hasVariants = true;
+    if (!accepted.has(encoding)) continue;
+    res.type(path.extname(file));
+    res.setHeader('Content-Encoding', encoding);
+    res.setHeader('Vary', 'Accept-Encoding');
+    res.setHeader('Cache-Control', cacheControl(file));
+    return res.sendFile(file + suffix, (err) => err && next(err));
+  }
+  if (hasVariants) res.setHeader('Vary', 'Accept-Encoding');
+  return next();
+}
+
+app.use((req, res, next) => precompressed(req, res, next).catch(next));
+app.use(express.static(STATIC_DIR, {
+  extensions: ['html'],
+  setHeaders: (res, file) => res.setHeader('Cache-Control', cacheControl(file)),
+}));
 
 const PORT = Number(process.env.PORT || 3000);
 app.listen(PORT, () => {